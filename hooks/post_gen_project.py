@@ -139,6 +139,9 @@ if not include_fred:
 
 if not include_fed_yield_curve:
     remove_file("src/load_fed_yield_curve.py")
+    remove_file("src/test_load_fed_yield_curve.py")
+    remove_file("src/calc_svensson_yield_curve.py")
+    remove_file("src/test_calc_svensson_yield_curve.py")
 
 if not include_ofr:
     remove_file("src/pull_ofr_api_data.py")
@@ -150,12 +153,29 @@ if not (include_fred and include_ofr):
 
 if not include_bloomberg:
     remove_file("src/pull_bloomberg.py")
+    remove_file("src/fake_blp.py")
+    remove_file("src/test_pull_bloomberg.py")
 
 if not include_crsp_stock:
     remove_file("src/pull_CRSP_stock.py")
+    remove_file("src/security_identifiers.py")
+    remove_file("src/test_security_identifiers.py")
 
 if not include_crsp_compustat:
     remove_file("src/pull_CRSP_Compustat.py")
+    remove_file("src/merge_CRSP_Compustat.py")
+    remove_file("src/test_merge_CRSP_Compustat.py")
+    remove_file("src/calc_Fama_French_1993_factors.py")
+    remove_file("src/test_calc_Fama_French_1993_factors.py")
+    remove_file("src/calc_CRSP_adjustment_factors.py")
+    remove_file("src/test_calc_CRSP_adjustment_factors.py")
+
+# Shared by both of the WRDS pull scripts
+if not (include_crsp_stock or include_crsp_compustat):
+    remove_file("src/wrds_schema.py")
+    remove_file("src/test_wrds_schema.py")
+    remove_file("src/wrds_backend.py")
+    remove_file("src/test_wrds_backend.py")
 
 print("Project configuration complete!")
 print("\nNext steps:")
@@ -76,6 +76,7 @@ def test_minimal_project_generation(template_dir, temp_dir):
     assert (project_dir / ".gitignore").exists()
     assert (project_dir / "src" / "settings.py").exists()
     assert (project_dir / "src" / "misc_tools.py").exists()
+    assert (project_dir / "src" / "benchmark_misc_tools.py").exists()
 
     # Environment files for other managers should NOT exist (pip is default)
     assert not (project_dir / "environment.yml").exists()
@@ -94,6 +95,16 @@ def test_minimal_project_generation(template_dir, temp_dir):
     assert not (project_dir / "src" / "pull_fred.py").exists()
     assert not (project_dir / "src" / "pull_ofr_api_data.py").exists()
     assert not (project_dir / "src" / "pull_bloomberg.py").exists()
+    assert not (project_dir / "src" / "test_load_fed_yield_curve.py").exists()
+    assert not (project_dir / "src" / "calc_svensson_yield_curve.py").exists()
+    assert not (project_dir / "src" / "fake_blp.py").exists()
+    assert not (project_dir / "src" / "wrds_schema.py").exists()
+    assert not (project_dir / "src" / "test_wrds_schema.py").exists()
+    assert not (project_dir / "src" / "wrds_backend.py").exists()
+    assert not (project_dir / "src" / "security_identifiers.py").exists()
+    assert not (project_dir / "src" / "merge_CRSP_Compustat.py").exists()
+    assert not (project_dir / "src" / "calc_Fama_French_1993_factors.py").exists()
+    assert not (project_dir / "src" / "calc_CRSP_adjustment_factors.py").exists()
 
 
 def test_full_project_generation(template_dir, temp_dir):
@@ -118,8 +129,22 @@ def test_full_project_generation(template_dir, temp_dir):
     assert (project_dir / "src" / "pull_fred.py").exists()
     assert (project_dir / "src" / "pull_ofr_api_data.py").exists()
     assert (project_dir / "src" / "pull_bloomberg.py").exists()
+    assert (project_dir / "src" / "test_load_fed_yield_curve.py").exists()
+    assert (project_dir / "src" / "calc_svensson_yield_curve.py").exists()
+    assert (project_dir / "src" / "test_calc_svensson_yield_curve.py").exists()
+    assert (project_dir / "src" / "fake_blp.py").exists()
+    assert (project_dir / "src" / "test_pull_bloomberg.py").exists()
     assert (project_dir / "src" / "pull_CRSP_stock.py").exists()
     assert (project_dir / "src" / "pull_CRSP_Compustat.py").exists()
+    assert (project_dir / "src" / "wrds_schema.py").exists()
+    assert (project_dir / "src" / "test_wrds_schema.py").exists()
+    assert (project_dir / "src" / "wrds_backend.py").exists()
+    assert (project_dir / "src" / "test_wrds_backend.py").exists()
+    assert (project_dir / "src" / "security_identifiers.py").exists()
+    assert (project_dir / "src" / "test_security_identifiers.py").exists()
+    assert (project_dir / "src" / "merge_CRSP_Compustat.py").exists()
+    assert (project_dir / "src" / "calc_Fama_French_1993_factors.py").exists()
+    assert (project_dir / "src" / "calc_CRSP_adjustment_factors.py").exists()
 
     # Notebooks should exist
     assert (project_dir / "src" / "01_example_notebook_interactive_ipynb.py").exists()
@@ -227,6 +252,15 @@ def test_wrds_sources(template_dir, temp_dir):
 
     assert (project_dir / "src" / "pull_CRSP_stock.py").exists()
     assert (project_dir / "src" / "pull_CRSP_Compustat.py").exists()
+    assert (project_dir / "src" / "wrds_schema.py").exists()
+    assert (project_dir / "src" / "test_wrds_schema.py").exists()
+    assert (project_dir / "src" / "wrds_backend.py").exists()
+    assert (project_dir / "src" / "test_wrds_backend.py").exists()
+    assert (project_dir / "src" / "security_identifiers.py").exists()
+    assert (project_dir / "src" / "test_security_identifiers.py").exists()
+    assert (project_dir / "src" / "merge_CRSP_Compustat.py").exists()
+    assert (project_dir / "src" / "calc_Fama_French_1993_factors.py").exists()
+    assert (project_dir / "src" / "calc_CRSP_adjustment_factors.py").exists()
 
     # Check requirements.txt includes wrds
     requirements = (project_dir / "requirements.txt").read_text()
@@ -179,10 +179,21 @@ def task_pull():
             "ipython ./src/settings.py",
             "ipython ./src/pull_CRSP_stock.py",
         ],
-        "targets": [DATA_DIR / "CRSP_stock.parquet"],
+        "targets": [DATA_DIR / "CRSP_stock.parquet", DATA_DIR / "CRSP_DSF"],
         "file_dep": ["./src/settings.py", "./src/pull_CRSP_stock.py"],
         "clean": [],
     }
+    yield {
+        "name": "crsp_cusip_crosswalk",
+        "doc": "Build the CUSIP to permno crosswalk from the CRSP names history",
+        "actions": [
+            "ipython ./src/settings.py",
+            "ipython ./src/security_identifiers.py",
+        ],
+        "targets": [DATA_DIR / "crsp_cusip_crosswalk.parquet"],
+        "file_dep": ["./src/settings.py", "./src/security_identifiers.py"],
+        "clean": [],
+    }
 {%- endif %}
 {%- if cookiecutter.include_crsp_compustat %}
     yield {
@@ -192,12 +203,56 @@ def task_pull():
             "ipython ./src/settings.py",
             "ipython ./src/pull_CRSP_Compustat.py",
         ],
-        "targets": [DATA_DIR / "CRSP_Compustat.parquet"],
+        "targets": [DATA_DIR / "CRSP_Compustat.parquet", DATA_DIR / "Compustat"],
         "file_dep": ["./src/settings.py", "./src/pull_CRSP_compustat.py"],
         "clean": [],
     }
 {%- endif %}
 {%- endif %}
+{%- if cookiecutter.include_crsp_compustat %}
+
+
+def task_calc_Fama_French_factors():
+    """Replicate the Fama-French SMB and HML factors from CRSP and Compustat"""
+    file_dep = [
+        "./src/calc_Fama_French_1993_factors.py",
+        "./src/merge_CRSP_Compustat.py",
+        "./src/pull_CRSP_Compustat.py",
+    ]
+    targets = [DATA_DIR / "FF_FACTORS_REPLICATED.parquet"]
+
+    return {
+        "actions": [
+            "ipython ./src/calc_Fama_French_1993_factors.py",
+        ],
+        "targets": targets,
+        "file_dep": file_dep,
+        "task_dep": ["pull:crsp_compustat"],
+        "clean": True,
+    }
+
+
+def task_calc_CRSP_adjustment_factors():
+    """Rebuild CRSP cumulative adjustment factors from CIZ distributions"""
+    file_dep = [
+        "./src/calc_CRSP_adjustment_factors.py",
+        "./src/pull_CRSP_Compustat.py",
+    ]
+    targets = [
+        DATA_DIR / "CRSP_distributions.parquet",
+        DATA_DIR / "CRSP_adjustment_factors.parquet",
+    ]
+
+    return {
+        "actions": [
+            "ipython ./src/calc_CRSP_adjustment_factors.py",
+        ],
+        "targets": targets,
+        "file_dep": file_dep,
+        "task_dep": ["pull:crsp_compustat"],
+        "clean": True,
+    }
+{%- endif %}
 {%- if cookiecutter.include_latex_reports %}
 
 
@@ -0,0 +1,303 @@
+"""
+Benchmark the numerically heavy helpers in `misc_tools.py`.
+
+Each function is run on synthetic data of increasing size, and its run time
+and peak memory are recorded:
+
+ - Time is the best of `repeat` runs, measured with `time.perf_counter`.
+ - Peak memory is measured in a separate run with `tracemalloc`, which also
+   sees the allocations made by numpy and pandas. It is the memory allocated
+   by the function on top of its inputs.
+
+Results are appended to `OUTPUT_DIR / "benchmark_misc_tools.csv"`, tagged
+with the current git commit, so that running the benchmarks before and after
+a change shows the speedup or regression of each function:
+```
+python src/benchmark_misc_tools.py
+python src/benchmark_misc_tools.py --BENCHMARK_SIZES=10000,100000000 \
+    --BENCHMARK_FUNCTIONS=leave_one_out_sums
+```
+and then `load_benchmark_history()` to compare versions.
+
+The data are generated by
+
+ - `make_repo_trades`: repo trades like the OFR data, with a date, trade
+   direction, tenor, rate, volume and an 8-digit CUSIP.
+ - `make_crsp_panel`: a monthly stock panel like CRSP, with a permno, date
+   and return, where some firm-months are missing.
+
+Sizes of 10^7 rows and more need several GB of memory. Functions that still
+loop in Python can be listed in `SLOW_FUNCTIONS`, and are then skipped above
+`BENCHMARK_MAX_ROWS` rows. All the benchmarked functions are vectorized at
+the moment, so the list is empty.
+"""
+
+import csv
+import datetime
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import misc_tools
+from settings import config
+
+OUTPUT_DIR = Path(config("OUTPUT_DIR"))
+BENCHMARK_SIZES = config("BENCHMARK_SIZES", default="10000,100000,1000000", cast=str)
+BENCHMARK_FUNCTIONS = config("BENCHMARK_FUNCTIONS", default="all", cast=str)
+BENCHMARK_MAX_ROWS = config("BENCHMARK_MAX_ROWS", default=1_000_000, cast=int)
+
+_alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def make_repo_trades(n_rows, n_days=None, seed=0):
+    """Synthetic repo trades, with about 1,000 trades per business day.
+
+    Examples
+    --------
+    ```
+    >>> make_repo_trades(5).columns.tolist()
+    ['date', 'trade_direction', 'tenor', 'rate', 'start_leg_amount', 'cusip']
+
+    ```
+    """
+    rng = np.random.default_rng(seed)
+    n_days = max(1, n_rows // 1000) if n_days is None else n_days
+    dates = pd.bdate_range("2010-01-04", periods=n_days)
+    tenors = np.array(["overnight", "1w", "1m", "3m"])
+    directions = np.array(["DELIVERED", "RECEIVED"])
+    # Most trades are small, a few are very large
+    amounts = np.round(rng.lognormal(16, 1.5, n_rows), -3)
+    # A pool of CUSIPs, each traded many times
+    n_cusips = max(1, n_rows // 100)
+    chars = rng.integers(0, len(_alphabet), (n_cusips, 8), dtype=np.int8)
+    pool = np.array(["".join(_alphabet[c] for c in row) for row in chars], dtype=object)
+    df = pd.DataFrame(
+        {
+            "date": dates[np.sort(rng.integers(0, n_days, n_rows))],
+            "trade_direction": directions[rng.integers(0, 2, n_rows)],
+            "tenor": tenors[rng.integers(0, len(tenors), n_rows)],
+            "rate": np.round(rng.normal(2.0, 0.5, n_rows), 3),
+            "start_leg_amount": amounts,
+            "cusip": pool[rng.integers(0, n_cusips, n_rows)],
+        }
+    )
+    return df
+
+
+def make_crsp_panel(n_rows, n_months=240, missing_share=0.05, seed=0):
+    """Synthetic monthly panel of about `n_rows` firm-months.
+
+    Firms are observed for `n_months` months from January 2000, except for a
+    random `missing_share` of firm-months, so that lags have to respect gaps.
+
+    Examples
+    --------
+    ```
+    >>> make_crsp_panel(1000).columns.tolist()
+    ['permno', 'mthcaldt', 'ret', 'me']
+
+    ```
+    """
+    rng = np.random.default_rng(seed)
+    n_permnos = max(1, round(n_rows / n_months / (1 - missing_share)))
+    months = pd.date_range("2000-01-01", periods=n_months, freq="MS")
+    permno = np.repeat(np.arange(10000, 10000 + n_permnos, dtype=np.int32), n_months)
+    date = np.tile(months.to_numpy(), n_permnos)
+    keep = rng.random(len(permno)) >= missing_share
+    n = int(keep.sum())
+    df = pd.DataFrame(
+        {
+            "permno": permno[keep],
+            "mthcaldt": date[keep],
+            "ret": rng.normal(0.01, 0.1, n),
+            "me": rng.lognormal(6, 2, n),
+        }
+    )
+    return df
+
+
+def _bench_groupby_weighted_average(df):
+    return misc_tools.groupby_weighted_average(
+        data_col="rate", weight_col="start_leg_amount", by_col="date", data=df
+    )
+
+
+def _bench_groupby_weighted_std(df):
+    return misc_tools.groupby_weighted_std(
+        data_col="rate", weight_col="start_leg_amount", by_col="date", data=df
+    )
+
+
+def _bench_weighted_quantile(df):
+    return misc_tools.weighted_quantile(
+        df["rate"], [0.01, 0.25, 0.5, 0.75, 0.99], sample_weight=df["start_leg_amount"]
+    )
+
+
+def _bench_groupby_weighted_quantile(df):
+    return misc_tools.groupby_weighted_quantile(
+        data_col="rate",
+        weight_col="start_leg_amount",
+        by_col="date",
+        data=df,
+        quantiles=[0.25, 0.5, 0.75],
+    )
+
+
+def _bench_rolling_weighted_stats(df):
+    return misc_tools.rolling_weighted_stats(
+        data=df,
+        data_col="rate",
+        weight_col="start_leg_amount",
+        window=5,
+        quantiles=[0.25, 0.5, 0.75],
+    )
+
+
+def _bench_with_lagged_columns(df):
+    return misc_tools.with_lagged_columns(
+        df=df,
+        column_to_lag="ret",
+        id_column="permno",
+        date_col="mthcaldt",
+        freq="MS",
+    )
+
+
+def _bench_leave_one_out_sums(df):
+    return misc_tools.leave_one_out_sums(df, groupby=["mthcaldt"], summed_col="me")
+
+
+def _bench_convert_cusips_from_8_to_9_digit(df):
+    return misc_tools.convert_cusips_from_8_to_9_digit(df["cusip"])
+
+
+def _bench_dataframe_set_difference(df):
+    return misc_tools.dataframe_set_difference(df, df.iloc[::2], show="numbers")
+
+
+# name: (data generator, function of the generated data)
+BENCHMARKS = {
+    "groupby_weighted_average": (make_repo_trades, _bench_groupby_weighted_average),
+    "groupby_weighted_std": (make_repo_trades, _bench_groupby_weighted_std),
+    "weighted_quantile": (make_repo_trades, _bench_weighted_quantile),
+    "groupby_weighted_quantile": (make_repo_trades, _bench_groupby_weighted_quantile),
+    "rolling_weighted_stats": (make_repo_trades, _bench_rolling_weighted_stats),
+    "with_lagged_columns": (make_crsp_panel, _bench_with_lagged_columns),
+    "leave_one_out_sums": (make_crsp_panel, _bench_leave_one_out_sums),
+    "convert_cusips_from_8_to_9_digit": (
+        make_repo_trades,
+        _bench_convert_cusips_from_8_to_9_digit,
+    ),
+    "dataframe_set_difference": (make_repo_trades, _bench_dataframe_set_difference),
+}
+
+# Functions that loop in Python, and are only run up to BENCHMARK_MAX_ROWS
+SLOW_FUNCTIONS = []
+
+
+def measure(func, *args, repeat=3):
+    """Best run time (seconds) of `func(*args)` over `repeat` runs, and peak
+    memory (bytes) allocated during one more run."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def _git_version():
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(
+    sizes=(10_000, 100_000, 1_000_000),
+    functions=None,
+    repeat=3,
+    max_rows=BENCHMARK_MAX_ROWS,
+    output_path=OUTPUT_DIR / "benchmark_misc_tools.csv",
+    version=None,
+):
+    """Benchmark `functions` (default: all of `BENCHMARKS`) at each size.
+
+    Results are appended to `output_path` (if not None) and returned as a
+    DataFrame with one row per function and size.
+    """
+    functions = list(BENCHMARKS) if functions is None else list(functions)
+    version = _git_version() if version is None else version
+    timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+    rows = []
+    for n_rows in sizes:
+        data = {}
+        for name in functions:
+            if name in SLOW_FUNCTIONS and n_rows > max_rows:
+                continue
+            make_data, func = BENCHMARKS[name]
+            if make_data not in data:
+                data = {make_data: make_data(n_rows)}
+            seconds, peak = measure(func, data[make_data], repeat=repeat)
+            rows.append(
+                {
+                    "timestamp": timestamp,
+                    "version": version,
+                    "function": name,
+                    "n_rows": n_rows,
+                    "seconds": seconds,
+                    "peak_memory_mb": peak / 2**20,
+                }
+            )
+
+    if output_path is not None and rows:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        write_header = not output_path.exists()
+        with open(output_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+    return pd.DataFrame(rows)
+
+
+def load_benchmark_history(
+    path=OUTPUT_DIR / "benchmark_misc_tools.csv", value="seconds"
+):
+    """Table of `value` ("seconds" or "peak_memory_mb") by function and size,
+    with one column per version, in the order the versions were benchmarked.
+    When a version was benchmarked several times, its latest run is used."""
+    history = pd.read_csv(path)
+    versions = history["version"].drop_duplicates().tolist()
+    history = history.drop_duplicates(["version", "function", "n_rows"], keep="last")
+    table = history.pivot(index=["function", "n_rows"], columns="version", values=value)
+    return table[versions]
+
+
+if __name__ == "__main__":
+    sizes = [int(float(size)) for size in BENCHMARK_SIZES.split(",")]
+    functions = None
+    if BENCHMARK_FUNCTIONS != "all":
+        functions = BENCHMARK_FUNCTIONS.split(",")
+    results = run_benchmarks(sizes=sizes, functions=functions)
+    print(results[["function", "n_rows", "seconds", "peak_memory_mb"]])
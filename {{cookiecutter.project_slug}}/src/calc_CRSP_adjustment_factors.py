@@ -0,0 +1,201 @@
+"""
+Rebuild the cumulative price and share adjustment factors (CFACPR and CFACSHR)
+for CRSP CIZ data from the distribution events.
+
+The legacy CRSP files provide `cfacpr` and `cfacshr`, the factors that make
+prices and shares outstanding comparable over time (`prc / cfacpr` and
+`shrout * cfacshr`). The CIZ format does not provide them reliably (see the
+notes in `pull_CRSP_Compustat.pull_CRSP_stock_ciz`). Instead, each
+distribution in `crsp.stkdistributions` comes with the price and share
+adjustment factors of that one event (`disfacpr` and `disfacshr`), e.g., 1 for
+a 2-for-1 split.
+
+The cumulative factor of a security at date t is the product of
+`1 + disfacpr` over all of its events with an ex-date after t, so that the
+factor is 1 after the last event. This is computed as follows:
+
+ - Events are sorted by permno and ex-date, and events on the same day are
+   combined.
+ - A reverse cumulative product within each permno gives, for each event,
+   the factor that applies to all dates before its ex-date.
+ - Each observation is matched to the first event of its permno with an
+   ex-date after the observation date with a single `np.searchsorted` on a
+   combined (permno, date) key.
+
+There are no loops over securities, so the factors for the full monthly or
+daily CRSP universe take a few seconds to compute. The results can be
+checked against the legacy factors with `compare_with_legacy_factors`.
+
+ - CIZ FAQ: https://wrds-www.wharton.upenn.edu/pages/support/manuals-and-overviews/crsp/stocks-and-indices/crsp-stock-and-indexes-version-2/crsp-ciz-faq/
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import pull_CRSP_Compustat
+from settings import config
+from wrds_backend import connect
+
+DATA_DIR = Path(config("DATA_DIR"))
+WRDS_USERNAME = config("WRDS_USERNAME")
+
+
+def pull_CRSP_distributions(wrds_username=WRDS_USERNAME):
+    """Pull the CIZ distribution events that change the price or shares."""
+    sql_query = """
+        SELECT
+            permno, disexdt, disseqnbr, distype, disfacpr, disfacshr
+        FROM
+            crsp.stkdistributions
+        WHERE
+            (disfacpr <> 0 OR disfacshr <> 0) AND
+            disexdt IS NOT NULL
+        """
+    db = connect(wrds_username=wrds_username)
+    events = db.raw_sql(sql_query, date_cols=["disexdt"])
+    db.close()
+    events["permno"] = events["permno"].astype("int32")
+    return events
+
+
+def load_CRSP_distributions(data_dir=DATA_DIR):
+    path = Path(data_dir) / "CRSP_distributions.parquet"
+    events = pd.read_parquet(path)
+    return events
+
+
+def _dates_to_key(permno, dates):
+    """Combine permno and date into one sortable int64 key, with the permno in
+    the upper 32 bits (recovered with `key >> 32`)."""
+    days = dates.to_numpy().astype("datetime64[D]").astype(np.int64)
+    # Shift days since 1970 to be non-negative so they don't borrow from the
+    # permno bits
+    return (permno.to_numpy().astype(np.int64) << 32) + (days + (1 << 31))
+
+
+def calc_cumulative_event_factors(events):
+    """For each permno and ex-date, the cumulative factors that apply to all
+    dates before the ex-date.
+
+    Returns a DataFrame sorted by `permno` and `disexdt` with the columns
+    `cum_facpr` and `cum_facshr`.
+    """
+    events = events[["permno", "disexdt"]].assign(
+        facpr=1 + events["disfacpr"].fillna(0),
+        facshr=1 + events["disfacshr"].fillna(0),
+    )
+    # Combine events with the same ex-date (e.g., a split and a spin-off)
+    events = events.groupby(["permno", "disexdt"], sort=True).prod()
+
+    # Product of this event and all later events of the same permno
+    reverse = events.iloc[::-1]
+    cumulative = reverse.groupby(level="permno", sort=False).cumprod().iloc[::-1]
+    cumulative.columns = ["cum_facpr", "cum_facshr"]
+    return cumulative.reset_index()
+
+
+def calc_cumulative_adjustment_factors(crsp, events, date_col="mthcaldt"):
+    """Compute `cfacpr` and `cfacshr` for each row of `crsp` from CIZ events.
+
+    Parameters
+    ----------
+    crsp : pandas.DataFrame
+        CRSP data with `permno` and `date_col`, e.g., the output of
+        `pull_CRSP_Compustat.pull_CRSP_stock_ciz` or a daily file.
+    events : pandas.DataFrame
+        Output of `pull_CRSP_distributions`.
+    date_col : str
+        Date column in `crsp`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        With the same index as `crsp` and the columns `cfacpr` and `cfacshr`.
+
+    Examples
+    --------
+    ```
+    >>> import pandas as pd
+    >>> crsp = pd.DataFrame({
+    ...     "permno": [10001, 10001, 10001],
+    ...     "mthcaldt": pd.to_datetime(["2020-01-31", "2020-02-28", "2020-03-31"]),
+    ... })
+    >>> events = pd.DataFrame({
+    ...     "permno": [10001],
+    ...     "disexdt": pd.to_datetime(["2020-02-14"]),
+    ...     "disfacpr": [1.0],  # 2-for-1 split
+    ...     "disfacshr": [1.0],
+    ... })
+    >>> calc_cumulative_adjustment_factors(crsp, events)
+       cfacpr  cfacshr
+    0     2.0      2.0
+    1     1.0      1.0
+    2     1.0      1.0
+
+    ```
+    """
+    factors = pd.DataFrame(1.0, index=crsp.index, columns=["cfacpr", "cfacshr"])
+    cumulative = calc_cumulative_event_factors(events)
+    if cumulative.empty:
+        return factors
+    event_keys = _dates_to_key(cumulative["permno"], cumulative["disexdt"])
+    row_keys = _dates_to_key(crsp["permno"], crsp[date_col])
+
+    # First event of the same permno with an ex-date after the row's date
+    pos = np.searchsorted(event_keys, row_keys, side="right")
+    in_range = pos < len(event_keys)
+    pos = np.minimum(pos, len(event_keys) - 1)
+    same_permno = in_range & ((event_keys[pos] >> 32) == (row_keys >> 32))
+
+    for col, cum_col in [("cfacpr", "cum_facpr"), ("cfacshr", "cum_facshr")]:
+        factors[col] = np.where(same_permno, cumulative[cum_col].to_numpy()[pos], 1.0)
+    return factors
+
+
+def compare_with_legacy_factors(factors, legacy, rtol=1e-4):
+    """Compare rebuilt factors with the legacy `cfacpr` and `cfacshr`.
+
+    `factors` and `legacy` must have the same index. Rows where the legacy
+    factor is missing or zero are ignored. Returns, for each factor, the
+    number of rows compared, the share of rows that agree within `rtol`,
+    and the largest relative difference.
+    """
+    comparison = {}
+    for col in ["cfacpr", "cfacshr"]:
+        ours, theirs = factors[col], legacy[col]
+        valid = theirs.notna() & (theirs != 0)
+        rel_diff = (ours[valid] / theirs[valid] - 1).abs()
+        comparison[col] = {
+            "n": int(valid.sum()),
+            "share_matching": (rel_diff <= rtol).mean(),
+            "max_rel_diff": rel_diff.max(),
+        }
+    return pd.DataFrame(comparison)
+
+
+def load_CRSP_adjustment_factors(data_dir=DATA_DIR):
+    path = Path(data_dir) / "CRSP_adjustment_factors.parquet"
+    factors = pd.read_parquet(path)
+    return factors
+
+
+def _demo():
+    crsp = pull_CRSP_Compustat.load_CRSP_stock_ciz(data_dir=DATA_DIR)
+    factors = load_CRSP_adjustment_factors(data_dir=DATA_DIR)
+    comparison = compare_with_legacy_factors(factors, crsp[["cfacpr", "cfacshr"]])
+    return comparison
+
+
+if __name__ == "__main__":
+    events = pull_CRSP_distributions(wrds_username=WRDS_USERNAME)
+    events.to_parquet(DATA_DIR / "CRSP_distributions.parquet")
+
+    crsp = pull_CRSP_Compustat.load_CRSP_stock_ciz(data_dir=DATA_DIR)
+    factors = calc_cumulative_adjustment_factors(crsp, events, date_col="mthcaldt")
+    factors = pd.concat([crsp[["permno", "mthcaldt"]], factors], axis=1)
+    factors.to_parquet(DATA_DIR / "CRSP_adjustment_factors.parquet")
+
+    comparison = compare_with_legacy_factors(factors, crsp[["cfacpr", "cfacshr"]])
+    print(comparison)
@@ -0,0 +1,225 @@
+"""
+Evaluate the Svensson yield curves published by the Federal Reserve
+(Gurkaynak, Sack, and Wright, 2007) at arbitrary maturities.
+
+The Fed tabulates zero-coupon yields at whole years (`SVENY01` to `SVENY30`),
+but also publishes the daily parameters of the fitted curve (`BETA0` to
+`BETA3`, `TAU1` and `TAU2`, see
+`load_fed_yield_curve.pull_fed_svensson_parameters`). From the parameters,
+the continuously compounded zero-coupon yield at maturity n (in years) is
+
+    y(n) = BETA0
+           + BETA1 * (1 - exp(-n/TAU1)) / (n/TAU1)
+           + BETA2 * [(1 - exp(-n/TAU1)) / (n/TAU1) - exp(-n/TAU1)]
+           + BETA3 * [(1 - exp(-n/TAU2)) / (n/TAU2) - exp(-n/TAU2)]
+
+and the instantaneous forward rate is
+
+    f(n) = BETA0 + BETA1 * exp(-n/TAU1) + BETA2 * (n/TAU1) * exp(-n/TAU1)
+           + BETA3 * (n/TAU2) * exp(-n/TAU2)
+
+`SvenssonCurve` evaluates these for all dates and maturities at once, by
+broadcasting the (dates x 1) parameters against the (1 x maturities) grid,
+so pricing a panel of bonds over every date since 1961 is a single array
+operation. The results for the most recently used maturity grids are cached.
+
+Rates are in percent, as published by the Fed.
+
+ - Paper and data: https://www.federalreserve.gov/data/nominal-yield-curve.htm
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from load_fed_yield_curve import load_fed_svensson_parameters
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+
+
+def _loading(x):
+    """(1 - exp(-x)) / x, which is 1 at x = 0."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(x == 0, 1.0, -np.expm1(-x) / x)
+
+
+class SvenssonCurve:
+    """Svensson yield curves for many dates.
+
+    Parameters
+    ----------
+    params : pandas.DataFrame
+        Indexed by date, with the columns BETA0, BETA1, BETA2, BETA3, TAU1
+        and TAU2. Missing BETA3/TAU2 (Nelson-Siegel fits before 1980) are
+        treated as BETA3 = 0.
+
+    Examples
+    --------
+    ```
+    >>> import pandas as pd
+    >>> params = pd.DataFrame(
+    ...     {"BETA0": [5.0], "BETA1": [-1.0], "BETA2": [0.0], "BETA3": [0.0],
+    ...      "TAU1": [1.0], "TAU2": [1.0]},
+    ...     index=pd.to_datetime(["2000-01-03"]),
+    ... )
+    >>> curve = SvenssonCurve(params)
+    >>> curve.zero([1, 10]).round(4)
+                  1.0   10.0
+    2000-01-03  4.3679   4.9
+
+    ```
+    """
+
+    # Number of (kind, maturity grid) results kept, most recently used first
+    cache_size = 32
+
+    def __init__(self, params):
+        params = params.astype(float)
+        self.dates = params.index
+        self.beta0 = params["BETA0"].to_numpy()[:, None]
+        self.beta1 = params["BETA1"].to_numpy()[:, None]
+        self.beta2 = params["BETA2"].to_numpy()[:, None]
+        has_beta3 = params["BETA3"].notna() & params["TAU2"].notna()
+        self.beta3 = params["BETA3"].where(has_beta3, 0.0).to_numpy()[:, None]
+        self.tau1 = params["TAU1"].to_numpy()[:, None]
+        self.tau2 = params["TAU2"].where(has_beta3, 1.0).to_numpy()[:, None]
+        self._cache = OrderedDict()
+
+    @classmethod
+    def from_fed(cls, data_dir=DATA_DIR):
+        """Curves for all dates saved by `pull_fed_svensson_parameters`."""
+        return cls(load_fed_svensson_parameters(data_dir=data_dir).dropna(how="all"))
+
+    def _cached(self, kind, maturities, compute):
+        """Result of `compute` on the (1 x maturities) grid, from a small LRU
+        cache. Cached arrays are read-only, since they are shared between
+        calls."""
+        maturities = np.atleast_1d(np.asarray(maturities, dtype=float))
+        key = (kind, maturities.tobytes())
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        values = compute(maturities[None, :])
+        values.setflags(write=False)
+        self._cache[key] = values
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return values
+
+    def _frame(self, values, maturities):
+        columns = np.atleast_1d(np.asarray(maturities, dtype=float))
+        return pd.DataFrame(values, index=self.dates, columns=columns, copy=True)
+
+    def _zero(self, n):
+        x1, x2 = n / self.tau1, n / self.tau2
+        l1, l2 = _loading(x1), _loading(x2)
+        return (
+            self.beta0
+            + self.beta1 * l1
+            + self.beta2 * (l1 - np.exp(-x1))
+            + self.beta3 * (l2 - np.exp(-x2))
+        )
+
+    def _forward(self, n):
+        x1, x2 = n / self.tau1, n / self.tau2
+        return (
+            self.beta0
+            + self.beta1 * np.exp(-x1)
+            + self.beta2 * x1 * np.exp(-x1)
+            + self.beta3 * x2 * np.exp(-x2)
+        )
+
+    def _discount(self, n):
+        return np.exp(-self._zero(n) / 100 * n)
+
+    def _par(self, n):
+        n = n[0]
+        # Coupon dates, (maturities x coupons), padded with NaN
+        n_coupons = int(np.ceil(2 * n.max()))
+        times = n[:, None] - 0.5 * np.arange(n_coupons)[None, :]
+        times = np.where(times > 0, times, np.nan)
+        valid = ~np.isnan(times)
+        discount = self._discount(np.nan_to_num(times.ravel(), nan=1.0)[None, :])
+        discount = discount.reshape(len(self.dates), *times.shape)
+        annuity = (discount * valid).sum(axis=2)
+        return 200 * (1 - self._discount(n[None, :])) / annuity
+
+    def zero_rates(self, maturities):
+        """Array (dates x maturities) of continuously compounded zero yields."""
+        return self._cached("zero", maturities, self._zero)
+
+    def forward_rates(self, maturities):
+        """Array (dates x maturities) of instantaneous forward rates."""
+        return self._cached("forward", maturities, self._forward)
+
+    def discount_factors(self, maturities):
+        """Array (dates x maturities) of discount factors."""
+        return self._cached("discount", maturities, self._discount)
+
+    def par_rates(self, maturities):
+        """Array (dates x maturities) of par yields of bonds with semiannual
+        coupons, in percent (bond-equivalent).
+
+        Coupons are paid every half year going back from maturity, so
+        maturities that are not whole half years have a short first period
+        (accrued interest is ignored).
+        """
+        return self._cached("par", maturities, self._par)
+
+    def zero(self, maturities):
+        """DataFrame of zero yields, indexed by date, one column per maturity."""
+        return self._frame(self.zero_rates(maturities), maturities)
+
+    def forward(self, maturities):
+        """DataFrame of instantaneous forward rates."""
+        return self._frame(self.forward_rates(maturities), maturities)
+
+    def discount(self, maturities):
+        """DataFrame of discount factors."""
+        return self._frame(self.discount_factors(maturities), maturities)
+
+    def par(self, maturities):
+        """DataFrame of semiannual par yields."""
+        return self._frame(self.par_rates(maturities), maturities)
+
+    def price_cashflows(self, times, amounts):
+        """Price cash flows on every date.
+
+        `times` (in years from each date) and `amounts` are arrays with one
+        entry per cash flow, or (bonds x cash flows) arrays padded with zero
+        amounts. Returns an array of prices (dates) or (dates x bonds). The
+        discount factors of the cash flow times are not cached.
+
+        Examples
+        --------
+        ```
+        curve = SvenssonCurve.from_fed()
+        # 10-year bond with a 4% semiannual coupon, on every date
+        times = np.arange(0.5, 10.5, 0.5)
+        amounts = np.full(20, 2.0)
+        amounts[-1] += 100
+        prices = curve.price_cashflows(times, amounts)
+        ```
+        """
+        times, amounts = np.asarray(times, dtype=float), np.asarray(amounts)
+        discount = self._discount(times.ravel()[None, :]).reshape(
+            len(self.dates), *times.shape
+        )
+        return (discount * amounts).sum(axis=-1)
+
+
+def _demo():
+    curve = SvenssonCurve.from_fed(data_dir=DATA_DIR)
+    zero = curve.zero(np.arange(0.25, 30.25, 0.25))
+    par = curve.par([2, 5, 10, 30])
+    print(pd.concat({"zero": zero[[2.0, 5.0, 10.0, 30.0]], "par": par}, axis=1))
+
+
+if __name__ == "__main__":
+    curve = SvenssonCurve.from_fed(data_dir=DATA_DIR)
+    zero = curve.zero(np.arange(0.25, 30.25, 0.25))
+    zero.columns = [f"{n:g}" for n in zero.columns]
+    zero.to_parquet(DATA_DIR / "fed_svensson_zero_curve.parquet")
@@ -0,0 +1,79 @@
+"""
+A local stand-in for `xbbg.blp`, for running and testing the Bloomberg pulls
+without a terminal.
+
+The functions here take the same arguments as their `xbbg.blp` counterparts
+and return DataFrames of the same shape, filled with deterministic synthetic
+data: each (ticker, field) pair gets its own random walk, seeded by its name,
+so repeated requests return the same values. Every request is recorded in
+`requests`, which lets tests check how many calls a pull would have made
+against the terminal.
+
+Use it in place of `xbbg.blp` with
+```
+import fake_blp as blp
+```
+or by setting `BLOOMBERG_BACKEND=fake` (see `pull_bloomberg.py`).
+"""
+
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# (function name, tickers, fields, start date, end date) of each request
+requests = []
+
+
+def _as_list(x):
+    return [x] if isinstance(x, str) else list(x)
+
+
+def _random_walk(name, index, start_value=100.0, volatility=0.01):
+    rng = np.random.default_rng(zlib.crc32(name.encode()))
+    steps = rng.normal(0, volatility, len(index))
+    return start_value * np.exp(np.cumsum(steps))
+
+
+def bdh(tickers, flds=None, start_date=None, end_date="today", **kwargs):
+    """Daily history of `flds` for `tickers` on business days between
+    `start_date` and `end_date`, with (ticker, field) columns."""
+    tickers = _as_list(tickers)
+    flds = ["Last_Price"] if flds is None else _as_list(flds)
+    requests.append(("bdh", tickers, flds, start_date, end_date))
+
+    # Walks start at a fixed date so that overlapping requests agree
+    index = pd.bdate_range("1900-01-01", end_date)
+    columns = pd.MultiIndex.from_product([tickers, flds])
+    df = pd.DataFrame(
+        {
+            (ticker, fld): _random_walk(f"{ticker}|{fld}", index)
+            for ticker, fld in columns
+        },
+        index=index,
+        columns=columns,
+    )
+    return df.loc[pd.Timestamp(start_date) :]
+
+
+def bdib(ticker, dt, session="allday", typ="TRADE", interval=1, **kwargs):
+    """Intraday bars of `ticker` on the day `dt`, every `interval` minutes
+    from 9:30 to 16:00, with (ticker, field) columns. Weekends and New Year's
+    Day are empty."""
+    requests.append(("bdib", [ticker], [typ], dt, dt))
+    day = pd.Timestamp(dt).normalize()
+    fields = ["open", "high", "low", "close", "volume", "num_trds"]
+    columns = pd.MultiIndex.from_product([[ticker], fields])
+    if day.dayofweek >= 5 or (day.month, day.day) == (1, 1):
+        return pd.DataFrame(columns=columns, dtype=float)
+
+    index = pd.date_range(
+        day + pd.Timedelta("9h30min"), day + pd.Timedelta("16h"), freq=f"{interval}min"
+    )
+    close = _random_walk(f"{ticker}|{day:%Y-%m-%d}", index, volatility=0.001)
+    rng = np.random.default_rng(zlib.crc32(f"{ticker}|{day:%Y-%m-%d}|volume".encode()))
+    volume = rng.integers(1, 1000, len(index)).astype(float)
+    values = np.column_stack(
+        [close, close * 1.0005, close * 0.9995, close, volume, volume // 10]
+    )
+    return pd.DataFrame(values, index=index, columns=columns)
@@ -3,12 +3,27 @@ This module contains functions to load the zero coupon yield curve from the Fede
 It saves the pulled raw data to a parquet file for future use.
 Functions to load the raw/clean data from the parquet file are also provided for future use.
 
+The raw CSV is streamed to `DATA_DIR / "feds200628.csv"` and is only
+downloaded again when the Fed has published a new version (using an
+If-Modified-Since request). Only the date and the 30 `SVENY` columns are
+decoded, with pyarrow's CSV reader, and the parsed curve is reused as long as
+the CSV has not changed, so a refresh is nearly free when there is no new
+data.
+
+The loaders keep an uncompressed Arrow copy of each saved parquet file next
+to it (`fed_yield_curve.arrow`), which is memory-mapped on load. Repeated
+loads, e.g. in notebooks, then neither read nor decompress the full history.
 """
 
-from io import BytesIO
+import email.utils
+import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.feather as feather
 import requests
 
 from settings import config
@@ -17,25 +32,181 @@ DATA_DIR = config("DATA_DIR")
 START_DATE = config("START_DATE")
 END_DATE = config("END_DATE")
 
+FED_YIELD_CURVE_URL = (
+    "https://www.federalreserve.gov/data/yield-curve-tables/feds200628.csv"
+)
+SVENY_COLUMNS = ["SVENY" + str(i).zfill(2) for i in range(1, 31)]
+# Parameters of the fitted Svensson curve (see calc_svensson_yield_curve.py)
+SVENSSON_PARAMETER_COLUMNS = ["BETA0", "BETA1", "BETA2", "BETA3", "TAU1", "TAU2"]
+
+
+def download_fed_yield_curve(data_dir=DATA_DIR, url=FED_YIELD_CURVE_URL):
+    """Stream the Fed yield curve CSV to `data_dir` if it has changed.
+
+    The modification time of the local file is set to the `Last-Modified`
+    date reported by the Fed, and is sent back as `If-Modified-Since` on the
+    next call. Returns the path to the CSV and whether it was downloaded.
+    """
+    path = Path(data_dir) / "feds200628.csv"
+    headers = {}
+    if path.exists():
+        headers["If-Modified-Since"] = email.utils.formatdate(
+            path.stat().st_mtime, usegmt=True
+        )
+
+    with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            return path, False
+        response.raise_for_status()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+        tmp_path.replace(path)
+        last_modified = response.headers.get("Last-Modified")
+
+    if last_modified is not None:
+        mtime = email.utils.parsedate_to_datetime(last_modified).timestamp()
+        os.utime(path, (mtime, mtime))
+    return path, True
+
+
+def parse_fed_yield_curve(path, columns=SVENY_COLUMNS):
+    """Parse the date and `columns` of the Fed yield curve CSV.
 
-def pull_fed_yield_curve():
+    The CSV starts with 9 lines of notes. The other ~70 columns are skipped
+    without being decoded.
+    """
+    table = pv.read_csv(
+        path,
+        read_options=pv.ReadOptions(skip_rows=9),
+        convert_options=pv.ConvertOptions(
+            include_columns=["Date"] + list(columns),
+            column_types={
+                "Date": pa.timestamp("ns"),
+                **{c: pa.float64() for c in columns},
+            },
+        ),
+    )
+    df = table.to_pandas().set_index("Date")
+    return df
+
+
+def _pull_fed_columns(columns, filename, data_dir=DATA_DIR):
+    """Parse `columns` from the latest Fed CSV, or, if the CSV has not changed
+    since `data_dir / filename` was saved, read them from that file."""
+    csv_path, downloaded = download_fed_yield_curve(data_dir=data_dir)
+    parquet_path = Path(data_dir) / filename
+    if (
+        not downloaded
+        and parquet_path.exists()
+        and parquet_path.stat().st_mtime >= csv_path.stat().st_mtime
+    ):
+        return pd.read_parquet(parquet_path)
+    return parse_fed_yield_curve(csv_path, columns=columns)
+
+
+def pull_fed_yield_curve(data_dir=DATA_DIR):
     """
     Download the latest yield curve from the Federal Reserve
 
     This is the published data using Gurkaynak, Sack, and Wright (2007) model
+
+    If the Fed file has not changed since the last call, the curve saved in
+    `fed_yield_curve.parquet` is returned instead of parsing the CSV again.
+    """
+    return _pull_fed_columns(SVENY_COLUMNS, "fed_yield_curve.parquet", data_dir)
+
+
+def pull_fed_svensson_parameters(data_dir=DATA_DIR):
     """
+    Download the daily parameters of the Svensson curve fitted by Gurkaynak,
+    Sack, and Wright (2007): BETA0-BETA3, TAU1 and TAU2.
 
-    url = "https://www.federalreserve.gov/data/yield-curve-tables/feds200628.csv"
-    response = requests.get(url)
-    pdf_stream = BytesIO(response.content)
-    df = pd.read_csv(pdf_stream, skiprows=9, index_col=0, parse_dates=True)
-    cols = ["SVENY" + str(i).zfill(2) for i in range(1, 31)]
-    return df[cols]
+    Before 1980, the Fed fits the Nelson-Siegel curve, and BETA3 and TAU2 are
+    missing.
+    """
+    return _pull_fed_columns(
+        SVENSSON_PARAMETER_COLUMNS, "fed_svensson_parameters.parquet", data_dir
+    )
+
+
+def _write_arrow_sidecar(df, path):
+    """Save `df` as an uncompressed Arrow IPC (Feather v2) file.
+
+    Columns are stored as plain numpy buffers: NaN stays NaN instead of being
+    turned into nulls, so the float columns can be viewed by pandas without a
+    copy.
+    """
+    table = pa.table(
+        {df.index.name: pa.array(df.index.to_numpy())}
+        | {col: pa.array(df[col].to_numpy()) for col in df.columns}
+    )
+    tmp_path = path.with_name(f"_{path.name}.tmp")
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    tmp_path.replace(path)
+
+
+def _load_with_arrow_sidecar(
+    data_dir, filename, columns=None, start_date=None, end_date=None
+):
+    """Load `data_dir / filename` through a memory-mapped Arrow sidecar.
+
+    The sidecar (same name, `.arrow` suffix) is written on first use and again
+    whenever the parquet file is newer. Reading it maps the file instead of
+    decompressing it, and the date range and columns are sliced out of the
+    mapped table, so only the selected part of the history is touched.
+    """
+    parquet_path = Path(data_dir) / filename
+    arrow_path = parquet_path.with_suffix(".arrow")
+    if (
+        not arrow_path.exists()
+        or arrow_path.stat().st_mtime < parquet_path.stat().st_mtime
+    ):
+        _write_arrow_sidecar(pd.read_parquet(parquet_path), arrow_path)
 
+    with pa.memory_map(str(arrow_path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    index_name = table.column_names[0]
 
-def load_fed_yield_curve(data_dir=DATA_DIR):
-    path = data_dir / "fed_yield_curve.parquet"
-    _df = pd.read_parquet(path)
+    # Dates are sorted, so the range is a contiguous (zero-copy) slice
+    dates = table.column(index_name).to_numpy()
+    start = 0
+    stop = len(dates)
+    if start_date is not None:
+        start = np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)))
+    if end_date is not None:
+        stop = np.searchsorted(
+            dates, np.datetime64(pd.Timestamp(end_date)), side="right"
+        )
+    table = table.slice(start, max(stop - start, 0))
+    if columns is not None:
+        table = table.select([index_name] + list(columns))
+
+    df = table.to_pandas(split_blocks=True).set_index(index_name)
+    return df
+
+
+def load_fed_yield_curve(
+    data_dir=DATA_DIR, columns=None, start_date=None, end_date=None
+):
+    """Load the curve saved by `pull_fed_yield_curve`.
+
+    Only the `columns` (e.g. `["SVENY02", "SVENY10"]`) and dates between
+    `start_date` and `end_date` (inclusive) are returned. See
+    `_load_with_arrow_sidecar` for how repeated loads are made cheap.
+    """
+    _df = _load_with_arrow_sidecar(
+        data_dir, "fed_yield_curve.parquet", columns, start_date, end_date
+    )
+    return _df
+
+
+def load_fed_svensson_parameters(data_dir=DATA_DIR, start_date=None, end_date=None):
+    _df = _load_with_arrow_sidecar(
+        data_dir, "fed_svensson_parameters.parquet", None, start_date, end_date
+    )
     return _df
 
 
@@ -43,3 +214,6 @@ if __name__ == "__main__":
     df = pull_fed_yield_curve()
     path = Path(DATA_DIR) / "fed_yield_curve.parquet"
     df.to_parquet(path)
+
+    params = pull_fed_svensson_parameters()
+    params.to_parquet(Path(DATA_DIR) / "fed_svensson_parameters.parquet")
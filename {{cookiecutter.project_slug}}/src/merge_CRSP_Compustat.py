@@ -0,0 +1,198 @@
+"""
+Merge CRSP and Compustat through the CRSP/Compustat Merged (CCM) link table.
+
+Each CRSP observation (`permno`, `jdate`) is matched to a Compustat `gvkey`
+using the link that is valid on that date, i.e., `linkdt <= jdate <= linkenddt`.
+Each linked observation is then matched to the most recent Compustat
+record (`gvkey`, `datadate`) that would have been publicly available at
+`jdate`.
+
+Both steps are done with sorted as-of joins (`pd.merge_asof`) rather than by
+merging on `permno` or `gvkey` and then filtering on the dates. This avoids
+materializing every combination of CRSP month and link (or fiscal year),
+which is what makes the naive approach run out of memory on the full
+CRSP universe.
+
+The data used here is pulled in `pull_CRSP_Compustat.py`:
+
+ - `crsp`: `pull_CRSP_stock_ciz`
+ - `comp`: `pull_compustat`
+ - `ccm`: `pull_CRSP_Comp_Link_Table`
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import MonthEnd
+
+from misc_tools import merge_stats
+
+
+def _month_number(dates):
+    """Months since year 0, used for calendar-month differences."""
+    return dates.dt.year * 12 + dates.dt.month
+
+
+def link_CRSP_to_Compustat(crsp, ccm, date_col="jdate"):
+    """Add the Compustat `gvkey` that is linked to each CRSP `permno` at `date_col`.
+
+    A missing `linkenddt` means that the link is still active and is treated
+    as open-ended. If more than one link is valid on a given date, the one
+    that started most recently is used, with primary links (`linkprim` equal
+    to "P") taking precedence over links that start on the same day.
+
+    CRSP rows without a valid link are kept, with `gvkey` set to missing. The
+    returned DataFrame has the same index and row order as `crsp`.
+    """
+    links = ccm[["gvkey", "permno", "linkprim", "linkdt", "linkenddt"]].dropna(
+        subset=["permno", "linkdt"]
+    )
+    links = links.assign(
+        permno=links["permno"].astype(crsp["permno"].dtype),
+        linkdt=links["linkdt"].astype(crsp[date_col].dtype),
+        linkenddt=links["linkenddt"].fillna(pd.Timestamp.max),
+        _primary=(links["linkprim"] == "P"),
+    )
+    # merge_asof takes the last of several rows with the same key, so sort
+    # primary links after the others.
+    links = links.sort_values(["linkdt", "_primary"], kind="stable")
+
+    left = crsp[["permno", date_col]].reset_index(drop=True)
+    left["_row"] = np.arange(len(left))
+    left = left.sort_values(date_col, kind="stable")
+
+    linked = pd.merge_asof(
+        left,
+        links[["permno", "linkdt", "linkenddt", "gvkey"]],
+        left_on=date_col,
+        right_on="linkdt",
+        by="permno",
+        direction="backward",
+    )
+    expired = linked["gvkey"].notna() & (linked[date_col] > linked["linkenddt"])
+    linked.loc[expired, "gvkey"] = np.nan
+
+    # The most recent link can have expired while an older one is still valid.
+    # Rows without any link that started by `date_col` cannot have a valid
+    # link, so only rows whose most recent link expired are resolved with an
+    # ordinary merge and filter.
+    unmatched = linked.loc[expired, ["_row", "permno", date_col]]
+    candidates = unmatched.merge(
+        links[["permno", "linkdt", "linkenddt", "gvkey", "_primary"]],
+        on="permno",
+        how="inner",
+    )
+    candidates = candidates[
+        (candidates["linkdt"] <= candidates[date_col])
+        & (candidates[date_col] <= candidates["linkenddt"])
+    ]
+    candidates = candidates.sort_values(["_row", "linkdt", "_primary"]).drop_duplicates(
+        "_row", keep="last"
+    )
+    linked = linked.set_index("_row").sort_index()
+    linked.loc[candidates["_row"].to_numpy(), "gvkey"] = candidates["gvkey"].to_numpy()
+
+    df = crsp.copy()
+    df["gvkey"] = linked["gvkey"].to_numpy()
+    return df
+
+
+def merge_CRSP_and_Compustat(
+    crsp,
+    comp,
+    ccm,
+    date_col="jdate",
+    min_lag_months=6,
+    max_lag_months=18,
+    how="left",
+    return_stats=False,
+):
+    """Merge CRSP with Compustat fundamentals through the CCM link table.
+
+    Each CRSP row is first linked to a `gvkey` (see `link_CRSP_to_Compustat`)
+    and then matched to the most recent Compustat record whose `datadate` is
+    at least `min_lag_months` and at most `max_lag_months` calendar months
+    before `date_col`. The minimum lag ensures that the accounting data would
+    have been available to investors at the time. The maximum lag keeps
+    stale records from being carried forward indefinitely.
+
+    Parameters
+    ----------
+    crsp : pandas.DataFrame
+        CRSP data with at least `permno` and `date_col`.
+    comp : pandas.DataFrame
+        Compustat data with at least `gvkey` and `datadate`.
+    ccm : pandas.DataFrame
+        Link table with `gvkey`, `permno`, `linkprim`, `linkdt` and `linkenddt`.
+    date_col : str
+        Date column in `crsp` (month end).
+    min_lag_months, max_lag_months : int
+        Bounds on the number of calendar months between `datadate` and
+        `date_col`.
+    how : {"left", "inner"}
+        "left" keeps every CRSP row, with missing Compustat columns where
+        there is no match. "inner" keeps only the matched rows.
+    return_stats : bool
+        If True, also return a DataFrame of match statistics, with one
+        column from `misc_tools.merge_stats` for each step of the merge.
+
+    Examples
+    --------
+    ```
+    crsp = load_CRSP_stock_ciz()
+    comp = load_compustat()
+    ccm = load_CRSP_Comp_Link_Table()
+    df, stats = merge_CRSP_and_Compustat(crsp, comp, ccm, return_stats=True)
+    ```
+    """
+    if how not in ("left", "inner"):
+        raise ValueError(f"Unknown how: {how}")
+
+    linked = link_CRSP_to_Compustat(crsp, ccm, date_col=date_col)
+    linked["_row"] = np.arange(len(linked))
+
+    comp_cols = [c for c in comp.columns if c not in linked.columns or c == "gvkey"]
+    right = comp[comp_cols].dropna(subset=["gvkey", "datadate"])
+    right = right.astype({"datadate": linked[date_col].dtype})
+    right = right.sort_values("datadate", kind="stable")
+
+    left = linked.loc[linked["gvkey"].notna(), ["_row", "gvkey", date_col]]
+    # Month end that is `min_lag_months` calendar months before date_col
+    left["_available"] = (
+        left[date_col] - pd.DateOffset(months=min_lag_months) + MonthEnd(0)
+    )
+    left = left.sort_values("_available", kind="stable")
+
+    matched = pd.merge_asof(
+        left[["_row", "gvkey", "_available"]],
+        right,
+        left_on="_available",
+        right_on="datadate",
+        by="gvkey",
+        direction="backward",
+    )
+    lag = _month_number(linked[date_col].iloc[matched["_row"]].reset_index(drop=True))
+    lag = lag - _month_number(matched["datadate"])
+    matched = matched[(lag >= min_lag_months) & (lag <= max_lag_months)]
+
+    df = linked.merge(matched.drop(columns=["gvkey", "_available"]), on="_row", how=how)
+    df = df.drop(columns="_row")
+    if how == "left":
+        df.index = crsp.index
+
+    if return_stats:
+        stats = pd.DataFrame(
+            {
+                "link": merge_stats(crsp, ccm.dropna(subset=["permno"]), on=["permno"]),
+                "fundamentals": merge_stats(
+                    linked.dropna(subset=["gvkey"]), comp, on=["gvkey"]
+                ),
+            }
+        )
+        stats.loc["matched_rows"] = [
+            linked["gvkey"].notna().sum(),
+            df["datadate"].notna().sum(),
+        ]
+        stats.loc["matched_rows/rows"] = stats.loc["matched_rows"] / len(crsp)
+        return df, stats
+
+    return df
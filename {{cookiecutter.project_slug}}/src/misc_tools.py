@@ -1,5 +1,11 @@
 """Collection of miscelaneous tools useful in a variety of situations
 (not specific to the current project)
+
+The DataFrame helpers accept pandas DataFrames, polars DataFrames and polars
+LazyFrames, and run on the backend of their input (see `_frame_library`):
+pandas input gives pandas output, and polars input gives polars output,
+without converting between the two. LazyFrames stay lazy where the result is
+a frame, so large panels can be kept in lazy polars end-to-end.
 """
 
 import datetime
@@ -8,6 +14,7 @@ import matplotlib.dates as mdates
 import numpy as np
 import pandas as pd
 import polars as pl
+import pyarrow.parquet as pq
 from dateutil.relativedelta import relativedelta
 from matplotlib import pyplot as plt
 
@@ -16,6 +23,40 @@ from matplotlib import pyplot as plt
 ########################################################################################
 
 
+def _frame_library(df, library=None):
+    """Backend to use for `df`: "polars" for polars DataFrames and LazyFrames,
+    "pandas" otherwise. An explicit `library` takes precedence.
+
+    Examples
+    --------
+    ```
+    >>> _frame_library(pl.LazyFrame({"a": [1]}))
+    'polars'
+    >>> _frame_library(pd.DataFrame({"a": [1]}))
+    'pandas'
+
+    ```
+    """
+    if library is None:
+        return "polars" if isinstance(df, (pl.DataFrame, pl.LazyFrame)) else "pandas"
+    if library not in ("pandas", "polars"):
+        raise ValueError("Unknown library")
+    return library
+
+
+def _collect(result, like):
+    """Collect the LazyFrame `result` unless the input `like` was lazy."""
+    if isinstance(like, pl.LazyFrame):
+        return result
+    return result.collect()
+
+
+def _has_keys(keys):
+    """Polars expression that is true for the rows with no missing `keys`,
+    since pandas leaves the other rows out of the groups."""
+    return pl.all_horizontal([pl.col(key).is_not_null() for key in keys])
+
+
 def df_to_literal(df, missing_value="None"):
     """Convert a pandas dataframe to a literal string representing the code to recreate it.
 
@@ -101,11 +142,33 @@ def merge_stats(df_left, df_right, on=[]):
     'intersection/left': percentage of matched based on total in left index
     'intersection/right': percentage of matched based on total in right index
 
+    Works on pandas DataFrames and on polars DataFrames or LazyFrames, for
+    which the distinct keys are counted with a lazy `unique` and join.
     """
-    left_index = df_left.set_index(on).index.unique()
-    right_index = df_right.set_index(on).index.unique()
-    union = left_index.union(right_index)
-    intersection = left_index.intersection(right_index)
+    if _frame_library(df_left) == "polars":
+        on = [on] if isinstance(on, str) else list(on)
+        left = df_left.lazy().select(on).unique()
+        right = df_right.lazy().select(on).unique()
+        n_left, n_right, n_intersection = (
+            pl.concat(
+                [
+                    left.select(pl.len()),
+                    right.select(pl.len()),
+                    left.join(right, on=on, how="inner", join_nulls=True).select(
+                        pl.len()
+                    ),
+                ]
+            )
+            .collect()
+            .to_series()
+            .to_list()
+        )
+    else:
+        left_index = df_left.set_index(on).index.unique()
+        right_index = df_right.set_index(on).index.unique()
+        n_left, n_right = len(left_index), len(right_index)
+        n_intersection = len(left_index.intersection(right_index))
+    n_union = n_left + n_right - n_intersection
     stats = [
         "union",
         "intersection",
@@ -119,81 +182,273 @@ def merge_stats(df_left, df_right, on=[]):
         "intersection/right",
     ]
     df_stats = pd.Series(index=stats, dtype=int)
-    df_stats["union"] = len(union)
-    df_stats["intersection"] = len(intersection)
-    df_stats["union-intersection"] = len(union) - len(intersection)
-    df_stats["intersection/union"] = len(intersection) / len(union)
-    df_stats["left"] = len(left_index)
-    df_stats["right"] = len(right_index)
-    df_stats["left-intersection"] = len(left_index) - len(intersection)
-    df_stats["right-intersection"] = len(right_index) - len(intersection)
-    df_stats["intersection/left"] = len(intersection) / len(left_index)
-    df_stats["intersection/right"] = len(intersection) / len(right_index)
+    df_stats["union"] = n_union
+    df_stats["intersection"] = n_intersection
+    df_stats["union-intersection"] = n_union - n_intersection
+    df_stats["intersection/union"] = n_intersection / n_union
+    df_stats["left"] = n_left
+    df_stats["right"] = n_right
+    df_stats["left-intersection"] = n_left - n_intersection
+    df_stats["right-intersection"] = n_right - n_intersection
+    df_stats["intersection/left"] = n_intersection / n_left
+    df_stats["intersection/right"] = n_intersection / n_right
     return df_stats
 
 
-def dataframe_set_difference(dff, df, library="pandas", show="rows_and_numbers"):
+def _row_hashes(df, columns):
+    """64-bit hash of the values of `columns` in each row of `df`, as a
+    numpy array for pandas and as an expression for polars."""
+    if isinstance(df, (pl.DataFrame, pl.LazyFrame)):
+        return pl.struct(columns).hash()
+    if not columns:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def dataframe_set_difference(dff, df, library=None, show="rows_and_numbers"):
     """
     Gives the rows that appear in dff but not in df
 
+    `dff` and `df` can be pandas DataFrames, or polars DataFrames or
+    LazyFrames. Rows are compared by a 64-bit hash of all their values
+    rather than by a merge on all columns, so wide frames are cheap to
+    compare. The columns of `df` must have the same dtypes as in `dff`
+    (an int 1 and a float 1.0 hash differently).
+
+    Returns the positions (0-based row numbers) of the rows of `dff` that
+    are not in `df`, and with `show="rows_and_numbers"` the rows themselves.
+
     Example
     -------
     ```
-    rows = data_frame_set_difference(dff, df)
+    >>> dff = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", None]}, index=[7, 8, 9])
+    >>> df = pd.DataFrame({"a": [3, 1], "b": [None, "x"]})
+    >>> row_numbers, rows = dataframe_set_difference(dff, df)
+    >>> row_numbers
+    [1]
+    >>> rows
+       a  b
+    8  2  y
+
     ```
     """
+    library = _frame_library(dff, library)
     if library == "pandas":
-        # Reset index to ensure the row numbers are captured as a column
-        # This is important for tracking the original row numbers after operations
-        dff_reset = dff.reset_index().rename(columns={"index": "original_row_number"})
-        df_reset = df.reset_index(drop=True)
+        columns = dff.columns.tolist()
+        in_df = np.isin(_row_hashes(dff, columns), _row_hashes(df, columns))
+        row_numbers = np.flatnonzero(~in_df).tolist()
+        if show == "rows_and_numbers":
+            return row_numbers, dff.iloc[row_numbers]
 
-        # Perform an outer merge with an indicator to identify rows present only in dff
-        merged = dff_reset.merge(
-            df_reset, how="left", indicator=True, on=dff.columns.tolist()
+    elif library == "polars":
+        # Assuming dff and df have the same schema (column names and types)
+        columns = dff.lazy().collect_schema().names()
+        assert columns == df.lazy().collect_schema().names()
+
+        # Anti join on the row hashes, keeping the row numbers of dff
+        row_hash = _row_hashes(dff, columns).alias("_row_hash")
+        diff = (
+            dff.lazy()
+            .with_row_index("row_number")
+            .with_columns(row_hash)
+            .join(df.lazy().select(row_hash), on="_row_hash", how="anti")
+            .collect()
         )
+        row_numbers = diff.get_column("row_number").to_list()
+        if show == "rows_and_numbers":
+            return row_numbers, diff.select(columns)
 
-        # Filter to rows only in dff (left_only)
-        only_in_dff = merged[merged["_merge"] == "left_only"]
+    else:
+        raise ValueError("Unknown library")
+    return row_numbers
 
-        # Extract the original row numbers of these rows
-        row_numbers = only_in_dff["original_row_number"].tolist()
-        ret = row_numbers
 
-    elif library == "polars":
-        # Assuming dff and df have the same schema (column names and types)
-        assert dff.columns == df.columns
+def compare_vintages(old, new, key, columns=None, library=None):
+    """
+    Rows added, removed and changed between two vintages of a dataset.
 
-        # First, add a temporary column to each DataFrame with row numbers
-        dff_with_index = dff.with_columns(pl.arange(0, dff.height).alias("row_number"))
-        df_with_index = df.with_columns(
-            pl.arange(0, df.height).alias("dummy_row_number")
-        )
+    Rows are matched on `key` (a column or list of columns that identifies
+    the rows of each vintage), and a matched row has changed if the hash of
+    its `columns` (default: the other columns of `new`) differs between the
+    vintages. Works on pandas DataFrames and polars DataFrames or
+    LazyFrames; see `compare_parquet_vintages` for files that do not fit in
+    memory.
 
-        # Perform an anti join to find rows in dff not present in df
-        # Note: This requires the DataFrames to have columns to join on that define row uniqueness
+    Returns a dict of frames:
 
-        diff = dff_with_index.join(
-            df_with_index, on=list(dff.columns), how="anti", join_nulls=True
+     - "added": the rows of `new` whose key is not in `old`
+     - "removed": the rows of `old` whose key is not in `new`
+     - "changed": the rows of `new` whose values changed
+     - "changed_before": the same rows (in the same order) in `old`
+
+    Example
+    -------
+    ```
+    >>> old = pd.DataFrame({"id": [1, 2, 3], "x": [1.0, 2.0, 3.0]})
+    >>> new = pd.DataFrame({"id": [4, 3, 2], "x": [4.0, 3.5, 2.0]})
+    >>> diff = compare_vintages(old, new, key="id")
+    >>> diff["added"]["id"].tolist(), diff["removed"]["id"].tolist()
+    ([4], [1])
+    >>> diff["changed"]["x"].tolist(), diff["changed_before"]["x"].tolist()
+    ([3.5], [3.0])
+
+    ```
+    """
+    library = _frame_library(new, library)
+    key = [key] if isinstance(key, str) else list(key)
+    if library == "pandas":
+        if columns is None:
+            columns = [col for col in new.columns if col not in key]
+        positions = pd.Index(_row_hashes(old, key)).get_indexer(_row_hashes(new, key))
+        in_old = positions >= 0
+        changed = in_old.copy()
+        changed[in_old] = (
+            _row_hashes(new, columns)[in_old]
+            != _row_hashes(old, columns)[positions[in_old]]
         )
+        seen = np.zeros(len(old), dtype=bool)
+        seen[positions[in_old]] = True
+        return {
+            "added": new.iloc[np.flatnonzero(~in_old)],
+            "removed": old.iloc[np.flatnonzero(~seen)],
+            "changed": new.iloc[np.flatnonzero(changed)],
+            "changed_before": old.iloc[positions[changed]],
+        }
 
-        # Extract the row numbers of the differing rows
-        row_numbers = diff.select("row_number").to_series(0).to_list()
-        ret = row_numbers
+    elif library == "polars":
+        if columns is None:
+            columns = [c for c in new.lazy().collect_schema().names() if c not in key]
+        row_hash = _row_hashes(new, columns).alias("_row_hash")
+        changed = (
+            new.lazy()
+            .with_columns(row_hash)
+            .join(
+                old.lazy().select(*key, row_hash),
+                on=key,
+                how="inner",
+                suffix="_before",
+                join_nulls=True,
+            )
+            .filter(pl.col("_row_hash") != pl.col("_row_hash_before"))
+        )
+        result = {
+            "added": new.lazy().join(
+                old.lazy().select(key), on=key, how="anti", join_nulls=True
+            ),
+            "removed": old.lazy().join(
+                new.lazy().select(key), on=key, how="anti", join_nulls=True
+            ),
+            "changed": changed.drop("_row_hash", "_row_hash_before"),
+            "changed_before": changed.select(key)
+            .join(old.lazy(), on=key, how="left", join_nulls=True)
+            .select(old.lazy().collect_schema().names()),
+        }
+        return {name: _collect(frame, new) for name, frame in result.items()}
 
     else:
         raise ValueError("Unknown library")
-    if show == "rows_and_numbers":
-        rows = dff[row_numbers]
-        ret = row_numbers, rows
 
-    return ret
+
+def compare_parquet_vintages(old_path, new_path, key, columns=None, batch_size=1 << 20):
+    """
+    `compare_vintages` for two parquet files, reading them in batches of
+    `batch_size` rows.
+
+    Only a key hash and a row hash (16 bytes per row of `old`) are kept in
+    memory, along with the added, removed and changed rows, so vintages much
+    larger than memory can be compared as long as they differ in relatively
+    few rows. Returns the same dict as `compare_vintages`, with polars
+    DataFrames.
+
+    Example
+    -------
+    ```
+    diff = compare_parquet_vintages(
+        DATA_DIR / "crsp_msf_2024.parquet",
+        DATA_DIR / "crsp_msf_2025.parquet",
+        key=["permno", "mthcaldt"],
+    )
+    diff["changed_before"].join(diff["changed"], on=["permno", "mthcaldt"])
+    ```
+    """
+    key = [key] if isinstance(key, str) else list(key)
+    old_file = pq.ParquetFile(old_path)
+    new_file = pq.ParquetFile(new_path)
+    if columns is None:
+        columns = [col for col in new_file.schema_arrow.names if col not in key]
+
+    def batches(parquet_file, read_columns=None):
+        for batch in parquet_file.iter_batches(batch_size, columns=read_columns):
+            frame = pl.from_arrow(batch)
+            hashes = frame.select(
+                _row_hashes(frame, key).alias("key"),
+                _row_hashes(frame, columns).alias("row"),
+            )
+            yield frame, hashes["key"].to_numpy(), hashes["row"].to_numpy()
+
+    # Pass 1: hashes of old, sorted by key hash for lookups
+    old_keys, old_rows = [np.empty(0, np.uint64)], [np.empty(0, np.uint64)]
+    for _, key_hashes, row_hashes in batches(old_file, key + columns):
+        old_keys.append(key_hashes)
+        old_rows.append(row_hashes)
+    old_keys, old_rows = np.concatenate(old_keys), np.concatenate(old_rows)
+    order = np.argsort(old_keys)
+    sorted_keys = old_keys[order]
+
+    # Pass 2: match the rows of new to old
+    empty_new = pl.from_arrow(new_file.schema_arrow.empty_table())
+    added, changed, changed_positions = [empty_new], [empty_new], [order[:0]]
+    seen = np.zeros(len(old_keys), dtype=bool)
+    for frame, key_hashes, row_hashes in batches(new_file):
+        found = np.searchsorted(sorted_keys, key_hashes)
+        in_old = found < len(sorted_keys)
+        in_old[in_old] = sorted_keys[found[in_old]] == key_hashes[in_old]
+        positions = order[found[in_old]]
+        is_changed = in_old.copy()
+        is_changed[in_old] = row_hashes[in_old] != old_rows[positions]
+        seen[positions] = True
+        added.append(frame.filter(~in_old))
+        changed.append(frame.filter(is_changed))
+        changed_positions.append(order[found[is_changed]])
+    changed_positions = np.concatenate(changed_positions)
+
+    # Pass 3: read back the removed rows, and the old values of changed rows
+    wanted = np.zeros(len(old_keys), dtype=bool)
+    wanted[changed_positions] = True
+    empty_old = pl.from_arrow(old_file.schema_arrow.empty_table())
+    removed, changed_before = [empty_old], [empty_old.with_row_index("_position")]
+    offset = 0
+    for batch in old_file.iter_batches(batch_size):
+        frame = pl.from_arrow(batch)
+        rows = slice(offset, offset + len(frame))
+        removed.append(frame.filter(~seen[rows]))
+        changed_before.append(
+            frame.with_row_index("_position", offset).filter(wanted[rows])
+        )
+        offset += len(frame)
+    changed_before = pl.concat(changed_before)
+    position = pl.Series("_position", changed_positions)
+    changed_before = (
+        position.cast(changed_before.schema["_position"])
+        .to_frame()
+        .join(changed_before, on="_position", how="left")
+        .drop("_position")
+    )
+
+    return {
+        "added": pl.concat(added),
+        "removed": pl.concat(removed),
+        "changed": pl.concat(changed),
+        "changed_before": changed_before,
+    }
 
 
 def freq_counts(df, col=None, with_count=True, with_cum_freq=True):
-    """Like value_counts, but normalizes to give frequency
-    Polars function
-    df is a polars dataframe
+    """Like value_counts, but normalizes to give frequency (in percent, with
+    missing values counted as a value).
+
+    `df` can be a pandas DataFrame, or a polars DataFrame or LazyFrame (a
+    LazyFrame gives a LazyFrame).
 
     Example
     -------
@@ -204,20 +459,29 @@ def freq_counts(df, col=None, with_count=True, with_cum_freq=True):
     ).pipe(freq_counts, col="bus_tenor_bin")
     ```
     """
-    s = df[col]
+    columns = [col, "count", "freq", "cum_freq"]
+    if not with_count:
+        columns.remove("count")
+    if not with_cum_freq:
+        columns.remove("cum_freq")
+
+    if _frame_library(df) == "pandas":
+        ret = df[col].value_counts(sort=True, dropna=False).reset_index()
+        ret["freq"] = ret["count"] / len(df) * 100
+        ret["cum_freq"] = ret["freq"].cumsum()
+        return ret[columns]
+
     ret = (
-        s.value_counts(sort=True)
+        df.lazy()
+        .select(pl.col(col).value_counts(sort=True))
+        .unnest(col)
         .with_columns(
-            freq=pl.col("count") / s.shape[0] * 100,
+            freq=pl.col("count") / pl.col("count").sum() * 100,
         )
         .with_columns(cum_freq=pl.col("freq").cum_sum())
+        .select(columns)
     )
-    if not with_count:
-        ret = ret.drop("count")
-    if not with_cum_freq:
-        ret = ret.drop("cum_freq")
-
-    return ret
+    return _collect(ret, df)
 
 
 def move_column_inplace(df, col, pos=0):
@@ -231,7 +495,13 @@ def move_column_inplace(df, col, pos=0):
 
 
 def move_columns_to_front(df, cols=[]):
-    """Move a list of columns `cols` so that they appear first"""
+    """Move a list of columns `cols` so that they appear first
+
+    pandas DataFrames are changed in place. polars frames cannot be, so the
+    reordered polars DataFrame (or LazyFrame) is returned instead.
+    """
+    if _frame_library(df) == "polars":
+        return df.select(*cols, pl.exclude(cols))
     for col in cols[::-1]:
         move_column_inplace(df, col, pos=0)
 
@@ -239,6 +509,9 @@ def move_columns_to_front(df, cols=[]):
 def weighted_average(data_col=None, weight_col=None, data=None):
     """Simple calculation of weighted average.
 
+    Missing values are skipped, along with their weights, as in
+    `groupby_weighted_average`.
+
     Examples
     --------
     ```
@@ -248,14 +521,24 @@ def weighted_average(data_col=None, weight_col=None, data=None):
     ... )
     >>> weighted_average(data_col='rate', weight_col='start_leg_amount', data=df_nccb)
     2.5
+    >>> weighted_average(
+    ...     data_col='rate', weight_col='start_leg_amount', data=pl.from_pandas(df_nccb)
+    ... )
+    2.5
 
     ```
     """
+    if _frame_library(data) == "polars":
+        vals, weights = pl.col(data_col), pl.col(weight_col)
+        valid_weights = pl.when(vals.is_not_null()).then(weights)
+        result = data.lazy().select((vals * weights).sum() / valid_weights.sum())
+        return result.collect().item()
 
     def weights_function(row):
         return data.loc[row.index, weight_col]
 
     def wm(row):
+        row = row.dropna()
         return np.average(row, weights=weights_function(row))
 
     result = wm(data[data_col])
@@ -269,12 +552,26 @@ def groupby_weighted_average(
     data=None,
     transform=False,
     new_column_name="",
+    library=None,
 ):
     """
     Faster method for calculating grouped weighted average.
 
-    From:
-    https://stackoverflow.com/a/44683506
+    Originally from https://stackoverflow.com/a/44683506. The per-group sums
+    of w * x and of the weights of non-missing x are computed with
+    `np.bincount` on the group numbers of the rows, so `data` is not modified
+    and no temporary columns are created. Rows with a missing value or weight
+    are ignored.
+
+    `data_col` can be a list of columns, in which case a DataFrame with one
+    column per `data_col` is returned. With `transform=True`, the group
+    averages are broadcast back to the rows of `data` (with the same index),
+    named `new_column_name` (a name, or a list of names when `data_col` is a
+    list).
+
+    When `data` is a polars DataFrame (or LazyFrame), a polars DataFrame (or
+    LazyFrame) with the `by_col` columns and one column per `data_col` is
+    returned (or, with `transform=True`, the averages for each row).
 
     Examples
     --------
@@ -290,34 +587,124 @@ def groupby_weighted_average(
     DELIVERED   2.00
     RECEIVED    2.67
     dtype: float64
+    >>> df_nccb['haircut'] = [1, None, 3]
+    >>> groupby_weighted_average(data=df_nccb, data_col=['rate', 'haircut'],
+    ...     weight_col='start_leg_amount', by_col='trade_direction')
+                     rate  haircut
+    trade_direction
+    DELIVERED        2.00     3.00
+    RECEIVED         2.67     1.00
+    >>> groupby_weighted_average(data=df_nccb, data_col='rate',
+    ...     weight_col='start_leg_amount', by_col='trade_direction',
+    ...     transform=True, new_column_name='avg_rate')
+    0   2.67
+    1   2.67
+    2   2.00
+    Name: avg_rate, dtype: float64
 
     ```
 
     """
-    data["_data_times_weight"] = data[data_col] * data[weight_col]
-    data["_weight_where_notnull"] = data[weight_col] * pd.notnull(data[data_col])
-    g = data.groupby(by_col)
-    result = g["_data_times_weight"].sum() / g["_weight_where_notnull"].sum()
-    del data["_data_times_weight"], data["_weight_where_notnull"]
+    library = _frame_library(data, library)
+    if library == "polars":
+        return _groupby_weighted_average_polars(
+            data_col, weight_col, by_col, data, transform, new_column_name
+        )
+
+    data_cols = [data_col] if isinstance(data_col, str) else list(data_col)
+    g = data.groupby(by_col, observed=True)
+    n_groups = g.ngroups
+    # Group number of each row, -1 for rows with a missing key
+    codes = g.ngroup().fillna(-1).to_numpy(dtype=np.intp)
+    in_group = codes >= 0
+    weights = data[weight_col].to_numpy(dtype=float)
+    if not in_group.all():
+        # Rows outside of the groups are left out by giving them no weight
+        weights = np.where(in_group, weights, np.nan)
+        codes = np.maximum(codes, 0)
+
+    averages = np.empty((n_groups, len(data_cols)))
+    for j, col in enumerate(data_cols):
+        vals = data[col].to_numpy(dtype=float)
+        products = vals * weights
+        valid_weights = weights
+        missing = np.isnan(products)
+        if missing.any():
+            products[missing] = 0
+            valid_weights = np.where(missing, 0.0, weights)
+        numer = np.bincount(codes, weights=products, minlength=n_groups)
+        denom = np.bincount(codes, weights=valid_weights, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages[:, j] = numer / denom
 
     if transform:
-        result.name = f"__{data_col}"
-        result = data.merge(result.reset_index(), how="left", on=by_col)[
-            f"__{data_col}"
-        ]
-        result.name = new_column_name
+        names = new_column_name
+        if isinstance(data_col, str):
+            names = [new_column_name]
+        elif not names:
+            names = data_cols
+        row_averages = averages[codes]
+        row_averages[~in_group] = np.nan
+        result = pd.DataFrame(row_averages, index=data.index, columns=names)
+    else:
+        result = pd.DataFrame(averages, index=g.size().index, columns=data_cols)
 
+    if isinstance(data_col, str):
+        result = result.iloc[:, 0]
+        if not transform:
+            result.name = None
     return result
 
 
+def _groupby_weighted_average_polars(
+    data_col, weight_col, by_col, data, transform, new_column_name
+):
+    by = [by_col] if isinstance(by_col, str) else list(by_col)
+    data_cols = [data_col] if isinstance(data_col, str) else list(data_col)
+    weights = pl.col(weight_col).cast(pl.Float64).fill_nan(None)
+    averages = []
+    for col in data_cols:
+        vals = pl.col(col).cast(pl.Float64).fill_nan(None)
+        valid_weights = pl.when(vals.is_not_null()).then(weights)
+        averages.append(((vals * valid_weights).sum() / valid_weights.sum()).alias(col))
+
+    if transform:
+        names = new_column_name
+        if isinstance(data_col, str):
+            names = [new_column_name]
+        elif not names:
+            names = data_cols
+        result = data.lazy().select(
+            [
+                pl.when(_has_keys(by)).then(avg.over(by)).alias(name)
+                for avg, name in zip(averages, names)
+            ]
+        )
+    else:
+        result = data.lazy().filter(_has_keys(by)).group_by(by).agg(averages).sort(by)
+    return _collect(result, data)
+
+
 def groupby_weighted_std(
-    data_col=None, weight_col=None, by_col=None, data=None, ddof=1
+    data_col=None, weight_col=None, by_col=None, data=None, ddof=1, library=None
 ):
     """
     Method for calculating grouped weighted standard devation.
 
-    From:
-    https://stackoverflow.com/a/72915123
+    Originally from https://stackoverflow.com/a/72915123, which applies a
+    Python function to each group. This version computes the per-group sums
+    with `np.bincount` instead, in two passes over the data: the weighted
+    means first, then the weighted squared deviations from them (which avoids
+    the cancellation of the one-pass formula sum(w x^2) - sum(w) mean^2). With
+    `n` the number of non-missing values in the group, the result is
+
+    sqrt( sum(w (x - mean)^2) / ((n - ddof) / n * sum(w)) )
+
+    Rows with a missing value or weight are skipped, on both backends.
+
+    When `data` is a polars DataFrame (or LazyFrame), a polars DataFrame (or
+    LazyFrame) with the `by_col` columns and the standard deviation in
+    `data_col` is returned.
 
     Examples
     --------
@@ -347,23 +734,84 @@ def groupby_weighted_std(
     0.4330127018922193
     >>> np.std([2,2,2])
     0.0
+    >>> groupby_weighted_std(data=pl.from_pandas(df_nccb), data_col='rate',
+    ...     weight_col='start_leg_amount', by_col='trade_direction')
+    shape: (2, 2)
+    ┌─────────────────┬──────┐
+    │ trade_direction ┆ rate │
+    │ ---             ┆ ---  │
+    │ str             ┆ f64  │
+    ╞═════════════════╪══════╡
+    │ DELIVERED       ┆ 0.5  │
+    │ RECEIVED        ┆ 0.0  │
+    └─────────────────┴──────┘
 
     ```
 
     """
+    library = _frame_library(data, library)
+    if library == "polars":
+        return _groupby_weighted_std_polars(data_col, weight_col, by_col, data, ddof)
+
+    g = data.groupby(by_col, observed=True)
+    # Group number of each row, NaN for rows with a missing key
+    codes = g.ngroup().to_numpy()
+    vals = data[data_col].to_numpy(dtype=float)
+    weights = data[weight_col].to_numpy(dtype=float)
+    # Rows with a missing key, value or weight are left out
+    in_group = ~np.isnan(codes) & ~np.isnan(vals) & ~np.isnan(weights)
+    codes = codes[in_group].astype(np.intp)
+    n_groups = g.ngroups
+    vals = vals[in_group]
+    weights = weights[in_group]
+
+    sum_weights = np.bincount(codes, weights=weights, minlength=n_groups)
+    count = np.bincount(codes, minlength=n_groups)
+    # Groups with no values left get NaN, as in the polars backend
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weighted_avg = (
+            np.bincount(codes, weights=weights * vals, minlength=n_groups) / sum_weights
+        )
+        numer = np.bincount(
+            codes,
+            weights=weights * (vals - weighted_avg[codes]) ** 2,
+            minlength=n_groups,
+        )
+        denom = ((count - ddof) / count) * sum_weights
+        std = np.sqrt(numer / denom)
+    return pd.Series(std, index=g.size().index)
 
-    def weighted_sd(input_df):
-        weights = input_df[weight_col]
-        vals = input_df[data_col]
-
-        weighted_avg = np.average(vals, weights=weights)
-
-        numer = np.sum(weights * (vals - weighted_avg) ** 2)
-        denom = ((vals.count() - ddof) / vals.count()) * np.sum(weights)
-
-        return np.sqrt(numer / denom)
 
-    return data.groupby(by_col).apply(weighted_sd)
+def _groupby_weighted_std_polars(data_col, weight_col, by_col, data, ddof):
+    by = [by_col] if isinstance(by_col, str) else list(by_col)
+    vals = pl.col(data_col).cast(pl.Float64).fill_nan(None)
+    # Weights of the rows with a value, so that missing values are skipped
+    weights = pl.when(vals.is_not_null()).then(
+        pl.col(weight_col).cast(pl.Float64).fill_nan(None)
+    )
+    weighted_avg = (weights * vals).sum().over(by) / weights.sum().over(by)
+    result = (
+        data.lazy()
+        .filter(_has_keys(by))
+        .with_columns(_weighted_avg=weighted_avg)
+        .group_by(by)
+        .agg(
+            numer=(weights * (vals - pl.col("_weighted_avg")) ** 2).sum(),
+            sum_weights=weights.sum(),
+            count=weights.count(),
+        )
+        .select(
+            *by,
+            (
+                pl.col("numer")
+                / ((pl.col("count") - ddof) / pl.col("count") * pl.col("sum_weights"))
+            )
+            .sqrt()
+            .alias(data_col),
+        )
+        .sort(by)
+    )
+    return _collect(result, data)
 
 
 def weighted_quantile(
@@ -425,28 +873,729 @@ def weighted_quantile(
     return np.interp(quantiles, weighted_quantiles, values)
 
 
+def groupby_weighted_quantile(
+    data_col=None,
+    weight_col=None,
+    by_col=None,
+    data=None,
+    quantiles=0.5,
+    library=None,
+):
+    """Weighted quantiles of `data_col` within each group, as given by
+    `weighted_quantile` (with `old_style=False`) for each group.
+
+    Instead of sorting each group separately, all rows are sorted once by
+    group and value, and the cumulative weights within each group are taken
+    from a single cumulative sum using the group start offsets. Each quantile
+    is then interpolated for all groups at once. Rows with a missing value or
+    weight are ignored.
+
+    If `quantiles` is a list, returns a DataFrame with one column per
+    quantile, otherwise a Series. When `data` is a polars DataFrame (or
+    LazyFrame), a polars DataFrame (or LazyFrame) is returned, with the
+    `by_col` columns and one column per quantile.
+
+    Examples
+    --------
+
+    ```
+    >>> df = pd.DataFrame({
+    ...     'date': ['2024-01-02'] * 4 + ['2024-01-03'] * 3,
+    ...     'rate': [1, 2, 3, 4, 1, 2, 6],
+    ...     'volume': [1, 1, 1, 1, 2, 1, 1]},
+    ... )
+    >>> groupby_weighted_quantile(data=df, data_col='rate', weight_col='volume',
+    ...     by_col='date', quantiles=[0.25, 0.5, 0.75])
+                0.25  0.50  0.75
+    date
+    2024-01-02  1.50  2.50  3.50
+    2024-01-03  1.00  1.67  4.00
+    >>> weighted_quantile(
+    ...     df['rate'][4:], [0.25, 0.5, 0.75], sample_weight=df['volume'][4:]
+    ... )
+    array([1.        , 1.66666667, 4.        ])
+
+    ```
+    """
+    library = _frame_library(data, library)
+    if library == "polars":
+        return _groupby_weighted_quantile_polars(
+            data_col, weight_col, by_col, data, quantiles
+        )
+
+    scalar = np.ndim(quantiles) == 0
+    quantiles = np.atleast_1d(np.asarray(quantiles, dtype=float))
+    assert np.all(quantiles >= 0) and np.all(quantiles <= 1), (
+        "quantiles should be in [0, 1]"
+    )
+
+    g = data.groupby(by_col, observed=True)
+    n_groups = g.ngroups
+    codes = g.ngroup().to_numpy()
+    vals = data[data_col].to_numpy(dtype=float)
+    if weight_col is None:
+        weights = np.ones(len(vals))
+    else:
+        weights = data[weight_col].to_numpy(dtype=float)
+    valid = ~(np.isnan(codes) | np.isnan(vals) | np.isnan(weights))
+    codes = codes[valid].astype(np.intp)
+
+    # Sort by group, then by value within each group. Same as
+    # np.lexsort((vals, codes)), but the stable sort of the integer codes is a
+    # radix sort, which makes this about twice as fast.
+    order = np.argsort(vals[valid])
+    order = order[np.argsort(codes[order], kind="stable")]
+    codes = codes[order]
+    vals = vals[valid][order]
+    weights = weights[valid][order]
+
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    total_weights = np.bincount(codes, weights=weights, minlength=n_groups)
+    cum_weights = np.cumsum(weights)
+    cum_weights -= np.concatenate([[0], cum_weights])[starts][codes]
+    # Position of each value in the distribution of its group, as in
+    # weighted_quantile
+    positions = (cum_weights - 0.5 * weights) / total_weights[codes]
+
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    nonempty = counts > 0
+    first, last = starts[nonempty], starts[nonempty] + counts[nonempty] - 1
+    for j, q in enumerate(quantiles):
+        # Number of values at or below q in each group, which brackets q
+        # between values left and left + 1
+        n_below = np.bincount(codes, weights=positions <= q, minlength=n_groups)
+        n_below = n_below.astype(np.intp)[nonempty]
+        left = np.maximum(first + n_below - 1, first)
+        right = np.minimum(first + n_below, last)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            interpolated = vals[left] + (q - positions[left]) / (
+                positions[right] - positions[left]
+            ) * (vals[right] - vals[left])
+        interpolated = np.where(n_below == 0, vals[first], interpolated)
+        interpolated = np.where(first + n_below > last, vals[last], interpolated)
+        result[nonempty, j] = interpolated
+
+    index = g.size().index
+    if scalar:
+        return pd.Series(result[:, 0], index=index)
+    return pd.DataFrame(result, index=index, columns=quantiles)
+
+
+def _groupby_weighted_quantile_polars(data_col, weight_col, by_col, data, quantiles):
+    by = [by_col] if isinstance(by_col, str) else list(by_col)
+    quantiles = [quantiles] if np.ndim(quantiles) == 0 else list(quantiles)
+    vals = pl.col(data_col)
+    weights = pl.lit(1.0) if weight_col is None else pl.col(weight_col)
+    position = pl.col("_position")
+    n = pl.len().cast(pl.Int64)
+
+    aggs = []
+    for q in quantiles:
+        n_below = (position <= q).sum().cast(pl.Int64)
+        left = (n_below - 1).clip(lower_bound=0)
+        right = pl.min_horizontal(n_below, n - 1)
+        interpolated = vals.get(left) + (q - position.get(left)) / (
+            position.get(right) - position.get(left)
+        ) * (vals.get(right) - vals.get(left))
+        aggs.append(
+            pl.when(n_below == 0)
+            .then(vals.first())
+            .when(n_below == n)
+            .then(vals.last())
+            .otherwise(interpolated)
+            .alias(str(q))
+        )
+
+    result = (
+        data.lazy()
+        .with_columns(_weight=weights.cast(pl.Float64).fill_nan(None))
+        .filter(
+            _has_keys(by)
+            & vals.is_not_null()
+            & vals.is_not_nan()
+            & pl.col("_weight").is_not_null()
+        )
+        .sort(by + [data_col])
+        .with_columns(
+            _position=(pl.col("_weight").cum_sum() - 0.5 * pl.col("_weight")).over(by)
+            / pl.col("_weight").sum().over(by)
+        )
+        .group_by(by)
+        .agg(aggs)
+        .sort(by)
+    )
+    return _collect(result, data)
+
+
+class WeightedQuantileSketch:
+    """Mergeable sketch of a weighted distribution, for approximate weighted
+    quantiles of data that do not fit in memory.
+
+    This is a t-digest (Dunning and Ertl, 2019). The data are summarized by
+    at most about `compression / 2` centroids (a mean and a total weight),
+    which are small near the tails of the distribution and larger in the
+    middle. Chunks of data are added with `update`, and sketches built on
+    different partitions (or in different processes) are combined with
+    `merge`. `quantile` then interpolates between the centroids in the same
+    way as `weighted_quantile` does between the sorted values, so that the
+    two agree exactly as long as no centroids have been combined.
+
+    Error bound: the centroid around quantile q holds at most about a
+    2 pi sqrt(q (1 - q)) / compression share of the total weight, so the
+    quantile returned for q is a value whose weighted rank is within about
+    pi sqrt(q (1 - q)) / compression of q (0.8% at the median and 0.3% at
+    the 1st and 99th percentiles for the default compression of 200). A
+    single observation is never split, so the error can be larger where one
+    observation carries a large share of the total weight. The minimum and
+    maximum are kept exactly.
+
+    Examples
+    --------
+    ```
+    >>> rng = np.random.default_rng(0)
+    >>> values = rng.normal(size=100_000)
+    >>> sketch = WeightedQuantileSketch()
+    >>> for chunk in np.array_split(values, 10):
+    ...     _ = sketch.update(chunk)
+    >>> sketch.quantile([0.5, 0.99]).round(2)
+    array([-0.  ,  2.34])
+    >>> np.quantile(values, [0.5, 0.99]).round(2)
+    array([-0.  ,  2.33])
+    >>> len(sketch.means) <= 100
+    True
+    >>> other = WeightedQuantileSketch().update(rng.normal(loc=1, size=100_000))
+    >>> sketch.merge(other).quantile(0.5).round(1)
+    0.5
+
+    ```
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def total_weight(self):
+        return self.weights.sum()
+
+    def _scale(self, q):
+        """Scale function k(q) of the t-digest: each centroid spans at most
+        one unit of k."""
+        return self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+
+    def _add_centroids(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+
+        # Combine neighbouring centroids whose mid-point falls in the same
+        # unit interval of k
+        cum_weights = np.cumsum(weights)
+        mid = (cum_weights - 0.5 * weights) / cum_weights[-1]
+        cluster = np.floor(self._scale(mid))
+        starts = np.flatnonzero(np.diff(cluster, prepend=np.nan) != 0)
+        cluster_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / cluster_weights
+        self.weights = cluster_weights
+
+    def update(self, values, sample_weight=None):
+        """Add `values` (with weights `sample_weight`) to the sketch. Missing
+        values and non-positive weights are ignored. Returns the sketch."""
+        values = np.asarray(values, dtype=float).ravel()
+        if sample_weight is None:
+            sample_weight = np.ones(len(values))
+        sample_weight = np.asarray(sample_weight, dtype=float).ravel()
+        keep = ~np.isnan(values) & (sample_weight > 0)
+        values, sample_weight = values[keep], sample_weight[keep]
+        if len(values) > 0:
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self._add_centroids(values, sample_weight)
+        return self
+
+    def merge(self, other):
+        """Add the data summarized by another sketch. Returns the sketch."""
+        if len(other.means) > 0:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._add_centroids(other.means, other.weights)
+        return self
+
+    def quantile(self, quantiles):
+        """Approximate weighted quantiles, with `quantiles` in [0, 1]."""
+        quantiles = np.asarray(quantiles, dtype=float)
+        assert np.all(quantiles >= 0) and np.all(quantiles <= 1), (
+            "quantiles should be in [0, 1]"
+        )
+        if len(self.means) == 0:
+            return np.full(quantiles.shape, np.nan)
+        positions = (np.cumsum(self.weights) - 0.5 * self.weights) / self.total_weight
+        return np.interp(
+            quantiles,
+            np.concatenate([[0], positions, [1]]),
+            np.concatenate([[self.min], self.means, [self.max]]),
+        )
+
+
+def weighted_quantile_from_parquet(
+    path, data_col, quantiles, weight_col=None, compression=200, batch_size=1 << 20
+):
+    """Approximate weighted quantiles of a column of a parquet file, reading
+    it in batches of `batch_size` rows into a `WeightedQuantileSketch`.
+
+    Only `data_col` and `weight_col` are read, and memory use does not depend
+    on the size of the file. Returns the quantiles and the sketch, which can
+    be merged with the sketches of other files.
+
+    Examples
+    --------
+    ```
+    paths = sorted(Path(DATA_DIR).glob("repo_trades/*.parquet"))
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(
+            partial(weighted_quantile_from_parquet, data_col="rate",
+                    quantiles=0.5, weight_col="volume"),
+            paths,
+        )
+        sketches = [sketch for _, sketch in results]
+    sketch = sketches[0]
+    for other in sketches[1:]:
+        sketch.merge(other)
+    median = sketch.quantile(0.5)
+    ```
+    """
+    sketch = WeightedQuantileSketch(compression=compression)
+    columns = [data_col] if weight_col is None else [data_col, weight_col]
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        values = batch.column(data_col).to_numpy(zero_copy_only=False)
+        weights = None
+        if weight_col is not None:
+            weights = batch.column(weight_col).to_numpy(zero_copy_only=False)
+        sketch.update(values, sample_weight=weights)
+    return sketch.quantile(quantiles), sketch
+
+
+class _FenwickTree:
+    """Binary indexed tree over positions 1..size, for prefix sums of values
+    that are added and removed incrementally. All methods take arrays of
+    positions and work on all of them at once."""
+
+    def __init__(self, size, dtype=float):
+        self.size = size
+        # Position 0 is a sentinel that always holds 0
+        self.tree = np.zeros(size + 1, dtype=dtype)
+        self.top_step = 1 << int(size).bit_length()
+
+    def add(self, positions, values):
+        positions = np.asarray(positions, dtype=np.intp)
+        values = np.broadcast_to(
+            np.asarray(values, dtype=self.tree.dtype), positions.shape
+        )
+        while positions.size:
+            np.add.at(self.tree, positions, values)
+            positions = positions + (positions & -positions)
+            keep = positions <= self.size
+            positions, values = positions[keep], values[keep]
+
+    def prefix_sum(self, positions):
+        """Sum of the values at positions 1..p, for each p in `positions`."""
+        # Queries come a few at a time, for which plain Python loops are
+        # faster than numpy operations on tiny arrays
+        tree = self.tree
+        totals = []
+        for p in np.asarray(positions, dtype=np.intp).ravel().tolist():
+            total = 0
+            while p > 0:
+                total += tree[p]
+                p -= p & -p
+            totals.append(total)
+        return np.array(totals, dtype=tree.dtype).reshape(np.shape(positions))
+
+    def search(self, targets):
+        """Smallest position p with prefix_sum(p) >= target, for nonnegative
+        values (size + 1 if there is none)."""
+        tree, size = self.tree, self.size
+        found = []
+        for remaining in np.asarray(targets).ravel().tolist():
+            p = 0
+            step = self.top_step
+            while step:
+                candidate = p + step
+                if candidate <= size and tree[candidate] < remaining:
+                    p = candidate
+                    remaining -= tree[candidate]
+                step >>= 1
+            found.append(p + 1)
+        return np.array(found, dtype=np.intp).reshape(np.shape(targets))
+
+
+def rolling_weighted_stats(
+    data=None,
+    data_col=None,
+    weight_col=None,
+    date_col="date",
+    window=1,
+    min_periods=1,
+    expanding=False,
+    quantiles=(0.5,),
+    ddof=1,
+):
+    """Weighted mean, standard deviation and quantiles of all observations
+    in rolling (or expanding) windows of dates.
+
+    The window for each date holds the observations of that date and of the
+    `window - 1` previous dates in the data (or of all previous dates, with
+    `expanding=True`). The statistics are those of `weighted_average`,
+    `groupby_weighted_std` and `weighted_quantile` applied to all the
+    observations in the window, e.g. the volume-weighted median rate of all
+    trades in the last 5 days, rather than an average of daily medians.
+
+    The windows are not recomputed from scratch. The weighted sums for the
+    mean and standard deviation are rolling sums of daily sums. For the
+    quantiles, observations are ranked by value once, and, as the window
+    moves, the weights of the observations of the entering and leaving dates
+    are added to and removed from a Fenwick tree over the ranks. Each
+    quantile is then found from a few O(log n) prefix-sum searches. Missing
+    values and non-positive weights are ignored.
+
+    Returns a DataFrame indexed by date, with the columns `mean`, `std`, and
+    one column per quantile. Dates whose window contains fewer than
+    `min_periods` dates are NaN. When `data` is a polars DataFrame (or
+    LazyFrame), only the three columns used are collected, and a polars
+    DataFrame with the date column and the statistics is returned.
+
+    Examples
+    --------
+
+    ```
+    >>> df = pd.DataFrame({
+    ...     'date': pd.to_datetime(
+    ...         ['2024-01-02'] * 2 + ['2024-01-03'] * 2 + ['2024-01-04'] * 2
+    ...     ),
+    ...     'rate': [1, 2, 3, 4, 5, 6],
+    ...     'volume': [1, 1, 1, 1, 1, 3],
+    ... })
+    >>> rolling_weighted_stats(data=df, data_col='rate', weight_col='volume',
+    ...     window=2, quantiles=[0.5])
+                mean  std  0.50
+    date
+    2024-01-02  1.50 0.71  1.50
+    2024-01-03  2.50 1.29  2.50
+    2024-01-04  5.00 1.33  5.25
+    >>> weighted_quantile([3, 4, 5, 6], 0.5, sample_weight=[1, 1, 1, 3])
+    5.25
+
+    ```
+    """
+    quantiles = [] if quantiles is None else list(np.atleast_1d(quantiles))
+    polars_input = _frame_library(data) == "polars"
+    if polars_input:
+        used = [date_col, data_col] + ([] if weight_col is None else [weight_col])
+        data = data.lazy().select(used).collect()
+    vals = np.asarray(data[data_col].to_numpy(), dtype=float)
+    if weight_col is None:
+        weights = np.ones(len(vals))
+    else:
+        weights = np.asarray(data[weight_col].to_numpy(), dtype=float)
+    dates = data[date_col].to_numpy() if polars_input else data[date_col]
+    date_codes, dates = pd.factorize(dates, sort=True)
+    dates = pd.Index(dates, name=date_col)
+    keep = ~np.isnan(vals) & (weights > 0) & (date_codes >= 0)
+    vals, weights, date_codes = vals[keep], weights[keep], date_codes[keep]
+    n_dates = len(dates)
+
+    # Mean and standard deviation from rolling sums of daily sums, centered
+    # on the overall mean to limit cancellation in sum(w x^2)
+    center = np.average(vals, weights=weights) if len(vals) else 0.0
+    dev = vals - center
+    daily = pd.DataFrame(
+        {
+            "n_dates": np.ones(n_dates),
+            "count": np.bincount(date_codes, minlength=n_dates),
+            "w": np.bincount(date_codes, weights=weights, minlength=n_dates),
+            "wx": np.bincount(date_codes, weights=weights * dev, minlength=n_dates),
+            "wxx": np.bincount(date_codes, weights=weights * dev**2, minlength=n_dates),
+        },
+        index=dates,
+    )
+    if expanding:
+        sums = daily.expanding().sum()
+    else:
+        sums = daily.rolling(window, min_periods=1).sum()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = pd.DataFrame(index=dates)
+        result["mean"] = center + sums["wx"] / sums["w"]
+        numer = (sums["wxx"] - sums["wx"] ** 2 / sums["w"]).clip(lower=0)
+        denom = (sums["count"] - ddof) / sums["count"] * sums["w"]
+        result["std"] = np.sqrt(numer / denom)
+
+    if quantiles:
+        # Observations by date, with their position in the overall ranking
+        order = np.argsort(vals, kind="stable")
+        sorted_vals, sorted_weights = vals[order], weights[order]
+        ranks = np.empty(len(vals), dtype=np.intp)
+        ranks[order] = np.arange(1, len(vals) + 1)
+        by_date = np.argsort(date_codes, kind="stable")
+        starts = np.searchsorted(date_codes[by_date], np.arange(n_dates + 1))
+        day_ranks = [ranks[by_date[starts[i] : starts[i + 1]]] for i in range(n_dates)]
+
+        weight_tree = _FenwickTree(len(vals))
+        count_tree = _FenwickTree(len(vals), dtype=np.int64)
+        q = np.asarray(quantiles, dtype=float)
+        quantile_values = np.full((n_dates, len(q)), np.nan)
+        for i in range(n_dates):
+            # Observations entering the window, and those leaving it
+            changed = day_ranks[i]
+            signs = np.ones(len(changed), dtype=np.int64)
+            if not expanding and i >= window:
+                leaving = day_ranks[i - window]
+                changed = np.concatenate([changed, leaving])
+                signs = np.concatenate([signs, -np.ones(len(leaving), dtype=np.int64)])
+            weight_tree.add(changed, signs * sorted_weights[changed - 1])
+            count_tree.add(changed, signs)
+            quantile_values[i] = _fenwick_weighted_quantile(
+                weight_tree, count_tree, sorted_vals, sorted_weights, q
+            )
+        # One column per requested quantile, even if some are repeated, as
+        # in groupby_weighted_quantile
+        quantile_df = pd.DataFrame(quantile_values, index=dates, columns=quantiles)
+        result = pd.concat([result, quantile_df], axis=1)
+
+    result.loc[(sums["n_dates"] < min_periods).to_numpy()] = np.nan
+    if polars_input:
+        result.columns = [str(col) for col in result.columns]
+        return pl.from_pandas(result.reset_index())
+    return result
+
+
+def _fenwick_weighted_quantile(weight_tree, count_tree, sorted_vals, weights, q):
+    """Quantiles `q`, as in `weighted_quantile`, of the observations whose
+    weights (indexed by rank) are currently in the trees."""
+    n = count_tree.prefix_sum([count_tree.size])[0]
+    if n == 0:
+        return np.full(len(q), np.nan)
+    total = weight_tree.prefix_sum([weight_tree.size])[0]
+
+    def kth(k):
+        """Rank of the k-th observation in the window, k = 1..n."""
+        return count_tree.search(np.clip(k, 1, n))
+
+    def position(rank):
+        """Share of the window's weight below the midpoint of an observation,
+        the x-coordinate used by weighted_quantile."""
+        return (weight_tree.prefix_sum(rank) - 0.5 * weights[rank - 1]) / total
+
+    # First observation whose cumulative weight reaches q, then the pair of
+    # observations whose positions bracket q
+    k = count_tree.prefix_sum(
+        np.minimum(weight_tree.search(q * total), count_tree.size)
+    )
+    k = np.clip(k, 1, n)
+    left = np.where(position(kth(k)) <= q, k, k - 1)
+    right = left + 1
+    left_rank, right_rank = kth(left), kth(right)
+    left_pos, right_pos = position(left_rank), position(right_rank)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        interpolated = sorted_vals[left_rank - 1] + (q - left_pos) / (
+            right_pos - left_pos
+        ) * (sorted_vals[right_rank - 1] - sorted_vals[left_rank - 1])
+    first, last = sorted_vals[kth(1) - 1], sorted_vals[kth(n) - 1]
+    return np.where(left < 1, first, np.where(right > n, last, interpolated))
+
+
 _alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ*@#"
+# Value of each ASCII character in a CUSIP (-1 if not allowed)
+_cusip_values = np.full(256, -1, dtype=np.int16)
+_cusip_values[np.frombuffer(_alphabet.encode(), dtype=np.uint8)] = np.arange(
+    len(_alphabet)
+)
+
+
+def _ascii_matrix(values, width):
+    """Identifiers as an (n, width) array of ASCII codes, without a Python
+    loop over the identifiers.
+
+    Returns the array, a mask of the entries that are missing or do not have
+    `width` characters (whose rows are zeros), and a mask of the missing
+    entries. Non-ASCII characters are replaced by "?".
+    """
+    values = np.asarray(values, dtype=object).ravel()
+    if len(values) == 0:
+        empty = np.zeros(0, dtype=bool)
+        return np.zeros((0, width), dtype=np.uint8), empty, empty
+    missing = pd.isna(values)
+    if missing.any():
+        values = np.where(missing, "", values)
+    try:
+        encoded = values.astype("S")
+    except UnicodeEncodeError:
+        encoded = np.char.encode(values.astype(str), "ascii", "replace")
+    if encoded.dtype.itemsize < width + 1:
+        encoded = encoded.astype(f"S{width + 1}")
+    chars = encoded.view(np.uint8).reshape(len(values), -1)
+    # Shorter strings are padded with zeros, longer ones have a character
+    # after the first `width`
+    wrong_length = missing | (chars[:, width - 1] == 0) | (chars[:, width] != 0)
+    chars = chars[:, :width] * ~wrong_length[:, None]
+    return chars, wrong_length, missing
+
+
+def _cusip_check_digits(chars):
+    """Check digits (as integers) of an (n, 8) array of ASCII codes, and a
+    mask of the rows with characters that are not allowed in a CUSIP."""
+    values = _cusip_values[chars]
+    invalid = (values < 0).any(axis=1)
+    # Double every second character, then add up the digits of each product
+    products = np.where(values < 0, 0, values) * np.array([1, 2] * 4, dtype=np.int16)
+    total = (products // 10 + products % 10).sum(axis=1)
+    return (10 - total % 10) % 10, invalid
 
 
-@np.vectorize
 def calc_check_digit(number):
     """Calculate the check digits for the 8-digit cusip.
-    This function is taken from
+
+    Follows
     https://github.com/arthurdejong/python-stdnum/blob/master/stdnum/cusip.py
+    but works on the whole array at once: the CUSIPs are viewed as an array
+    of ASCII codes, mapped to their values with a lookup table, and the digit
+    sums are done with integer arithmetic.
+
+    Returns a string for a single CUSIP, and otherwise an array of strings,
+    with None for missing CUSIPs.
+
+    Examples
+    --------
+    ```
+    >>> calc_check_digit('03783310')
+    '0'
+    >>> calc_check_digit(['03783310', '17275R10', None])
+    array(['0', '2', None], dtype=object)
+
+    ```
     """
-    # convert to numeric first, then sum individual digits
-    number = "".join(
-        str((1, 2)[i % 2] * _alphabet.index(n)) for i, n in enumerate(number)
-    )
-    return str((10 - sum(int(n) for n in number)) % 10)
+    scalar = np.ndim(number) == 0
+    chars, wrong_length, missing = _ascii_matrix(number, 8)
+    if (wrong_length & ~missing).any():
+        raise ValueError("CUSIPs must have 8 characters")
+    check_digits, invalid = _cusip_check_digits(chars)
+    if (invalid & ~missing).any():
+        raise ValueError("CUSIPs may only contain 0-9, A-Z, *, @ and #")
+
+    result = (check_digits + ord("0")).astype(np.uint8).view("S1").astype("U1")
+    if scalar:
+        return str(result[0])
+    if missing.any():
+        result = np.where(missing, None, result.astype(object))
+    return result
 
 
 def convert_cusips_from_8_to_9_digit(cusip_8dig_series):
-    dig9 = calc_check_digit(cusip_8dig_series)
-    new9 = cusip_8dig_series + dig9
+    cusip_8dig_series = pd.Series(cusip_8dig_series)
+    dig9 = pd.Series(calc_check_digit(cusip_8dig_series), index=cusip_8dig_series.index)
+    new9 = cusip_8dig_series.str.cat(dig9)
     return new9
 
 
+def cusip_check_digit_expr(cusip):
+    """Polars expression for the check digit of the 8-digit CUSIPs in the
+    column (or expression) `cusip`, named after it with a "_check_digit"
+    suffix. CUSIPs that are too short or have invalid characters get a null
+    check digit.
+
+    Examples
+    --------
+    ```
+    >>> df = pl.DataFrame({"cusip": ["03783310", "17275R10", "0378331"]})
+    >>> df.select(cusip_check_digit_expr("cusip"))["cusip_check_digit"].to_list()
+    ['0', '2', None]
+
+    ```
+    """
+    if isinstance(cusip, str):
+        cusip = pl.col(cusip)
+    mapping = {char: value for value, char in enumerate(_alphabet)}
+    total = pl.lit(0, dtype=pl.Int32)
+    for i in range(8):
+        value = cusip.str.slice(i, 1).replace_strict(
+            mapping, default=None, return_dtype=pl.Int32
+        )
+        value = value * (1 + i % 2)
+        total = total + value // 10 + value % 10
+    check_digit = ((10 - total % 10) % 10).cast(pl.String)
+    return check_digit.name.suffix("_check_digit")
+
+
+def validate_cusips(cusips):
+    """Boolean array, True for the valid 9-digit CUSIPs (with a correct check
+    digit). Missing values are not valid.
+
+    Examples
+    --------
+    ```
+    >>> validate_cusips(['037833100', '037833101', '17275R102', '1234', None])
+    array([ True, False,  True, False, False])
+
+    ```
+    """
+    chars, wrong_length, _ = _ascii_matrix(cusips, 9)
+    check_digits, invalid = _cusip_check_digits(chars[:, :8])
+    return ~wrong_length & ~invalid & (chars[:, 8] == check_digits + ord("0"))
+
+
+def _isin_check_digits(chars):
+    """Check digits (as integers) of an (n, 11) array of ASCII codes, and a
+    mask of the rows with characters other than digits and capital letters.
+
+    Uses the Luhn algorithm on the digits, with letters replaced by 10-35.
+    """
+    is_digit = (chars >= ord("0")) & (chars <= ord("9"))
+    is_letter = (chars >= ord("A")) & (chars <= ord("Z"))
+    invalid = ~(is_digit | is_letter).all(axis=1)
+    values = np.where(
+        is_digit, chars - ord("0"), chars.astype(np.int16) - ord("A") + 10
+    )
+    values = np.where(is_digit | is_letter, values, 0)
+    # Luhn sum over the digits, from the right. Letters contribute two
+    # digits. Digits at even positions from the right (the first, third, ...
+    # before the check digit) are doubled.
+    total = np.zeros(len(chars), dtype=np.int64)
+    position = np.zeros(len(chars), dtype=np.int64)
+    for i in range(chars.shape[1] - 1, -1, -1):
+        value = values[:, i]
+        for digit, present in [(value % 10, True), (value // 10, value >= 10)]:
+            doubled = np.where(position % 2 == 0, 2 * digit, digit)
+            total += np.where(present, doubled // 10 + doubled % 10, 0)
+            position += present
+    return (10 - total % 10) % 10, invalid
+
+
+def validate_isins(isins):
+    """Boolean array, True for the valid ISINs: two letters (the country
+    code), nine letters or digits, and a correct check digit (Luhn algorithm
+    on the digits, with letters replaced by 10-35). Missing values are not
+    valid.
+
+    Examples
+    --------
+    ```
+    >>> validate_isins(['US0378331005', 'US0378331006', 'GB0002634946', 'US037833100'])
+    array([ True, False,  True, False])
+
+    ```
+    """
+    chars, wrong_length, _ = _ascii_matrix(isins, 12)
+    is_letter = (chars[:, :2] >= ord("A")) & (chars[:, :2] <= ord("Z"))
+    check_digits, invalid = _isin_check_digits(chars[:, :11])
+    valid = ~wrong_length & is_letter.all(axis=1) & ~invalid
+    return valid & (chars[:, 11] == check_digits + ord("0"))
+
+
 def _with_lagged_column_no_resample(
     df=None,
     columns_to_lag=None,
@@ -488,6 +1637,53 @@ def _with_lagged_column_no_resample(
     return lag_sub_df
 
 
+# Offsets whose `resample` bins are closed on the right and labeled with
+# their end (see pandas.core.resample.TimeGrouper)
+_end_anchored_offsets = ("ME", "QE", "YE", "BME", "BQE", "BYE", "W")
+
+
+def _period_numbers(dates, freq=None):
+    """Integer number of the `freq` period of each date, counting from the
+    first period in `dates`, with dates binned as by `resample(freq)`.
+
+    Without `freq`, each distinct date is its own period.
+
+    Examples
+    --------
+    ```
+    >>> dates = pd.to_datetime(["1990-01-31", "1990-03-01", "1990-03-15", "1991-01-01"])
+    >>> _period_numbers(dates, "MS")
+    array([ 0,  2,  2, 12])
+    >>> _period_numbers(dates, "QE")
+    array([0, 0, 0, 4])
+    >>> _period_numbers(dates)
+    array([0, 1, 2, 3])
+
+    ```
+    """
+    dates = pd.DatetimeIndex(dates)
+    if freq is None:
+        return pd.factorize(dates, sort=True)[0]
+    offset = pd.tseries.frequencies.to_offset(freq)
+    if isinstance(offset, pd.offsets.Tick):
+        grid = pd.date_range(
+            dates.min().floor(offset), dates.max().ceil(offset), freq=offset
+        )
+        return np.searchsorted(grid, dates, side="right") - 1
+    # Calendar offsets bin whole days
+    dates = dates.normalize()
+    first, last = dates.min(), dates.max()
+    if offset.rule_code.split("-")[0] in _end_anchored_offsets:
+        # Bins (previous end, end]
+        grid = pd.date_range(
+            offset.rollforward(first), offset.rollforward(last), freq=offset
+        )
+        return np.searchsorted(grid, dates, side="left")
+    # Bins [start, next start)
+    grid = pd.date_range(offset.rollback(first), offset.rollback(last), freq=offset)
+    return np.searchsorted(grid, dates, side="right") - 1
+
+
 def with_lagged_columns(
     df=None,
     column_to_lag=None,
@@ -497,10 +1693,30 @@ def with_lagged_columns(
     prefix="L",
     freq=None,
     resample=True,
+    library=None,
 ):
     """
     Add lagged columns to a dataframe, respecting frequency of the data.
 
+    `column_to_lag` and `lags` can be lists, in which case every column is
+    lagged by every lag (negative lags are leads), in columns named
+    `f"{prefix}{lag}_{column}"`.
+
+    With `resample=True`, the lag of an observation is the observation of
+    the same id `lag` periods of frequency `freq` earlier, and is missing if
+    there is none. Dates are converted to integer period numbers (binned as
+    by `DataFrame.resample`, so that e.g. month-end dates work with
+    `freq="MS"`), and the lagged rows are found with a binary search over the
+    sorted (id, period) keys. This works on the long panel directly, so
+    unlike pivoting to a (dates x ids) table it only takes memory in
+    proportion to the number of rows. If an id has several observations in a
+    period, the last one is used as the lag. Without `freq`, each distinct
+    date in the panel is a period.
+
+    The original rows are returned, in their original order and with their
+    index. When `df` is a polars DataFrame (or LazyFrame), the same is
+    returned.
+
     Examples
     --------
 
@@ -550,20 +1766,19 @@ def with_lagged_columns(
 
     Rather, it should look like this:
 
-    >>> df_lag = with_lagged_columns(df=df, column_to_lag='value', id_column='id', lags=1, freq="MS", resample=True)
+    >>> df_lag = with_lagged_columns(df=df, column_to_lag='value', id_column='id',
+    ...     lags=[1, 2], freq="MS", resample=True)
     >>> df_lag
-       id       date  value  L1_value
-    2   A 1990-01-01   1.00       NaN
-    4   A 1990-02-01   2.00      1.00
-    6   A 1990-03-01   3.00      2.00
-    8   A 1990-04-01    NaN      3.00
-    1   B 1989-12-01  12.00       NaN
-    3   B 1990-01-01   1.00     12.00
-    5   B 1990-02-01   2.00      1.00
-    7   B 1990-03-01   3.00      2.00
-    9   B 1990-04-01   4.00      3.00
-    11  B 1990-05-01    NaN      4.00
-    13  B 1990-06-01   6.00       NaN
+      id       date  value  L1_value  L2_value
+    0  A 1990-01-01      1       NaN       NaN
+    1  A 1990-02-01      2      1.00       NaN
+    2  A 1990-03-01      3      2.00      1.00
+    3  B 1989-12-01     12       NaN       NaN
+    4  B 1990-01-01      1     12.00       NaN
+    5  B 1990-02-01      2      1.00     12.00
+    6  B 1990-03-01      3      2.00      1.00
+    7  B 1990-04-01      4      3.00      2.00
+    8  B 1990-06-01      6       NaN      4.00
 
     ```
 
@@ -595,36 +1810,104 @@ def with_lagged_columns(
     as seen here: https://business-science.github.io/pytimetk/guides/03_pandas_frequency.html
 
     """
-    if resample:
-        df_wide = df.pivot(index=date_col, columns=id_column, values=column_to_lag)
-        new_col = f"{prefix}{lags}_{column_to_lag}"
-        df_resampled = df_wide.resample(freq).last()
-        df_lagged = df_resampled.shift(lags)
-        df_lagged = df_lagged.stack(dropna=False).reset_index(name=new_col)
-        df_lagged = df.merge(df_lagged, on=[date_col, id_column], how="right")
-        df_lagged = df_lagged.dropna(subset=[column_to_lag, new_col], how="all")
-        df_lagged = df_lagged.sort_values(by=[id_column, date_col])
-    else:
-        df_lagged = _with_lagged_column_no_resample(
-            df=df,
-            columns_to_lag=[column_to_lag],
-            id_columns=[id_column],
-            lags=lags,
-            date_col=date_col,
-            prefix=prefix,
+    columns = [column_to_lag] if isinstance(column_to_lag, str) else list(column_to_lag)
+    lags = [lags] if np.ndim(lags) == 0 else list(lags)
+    library = _frame_library(df, library)
+    if library == "polars":
+        return _with_lagged_columns_polars(
+            df, columns, id_column, lags, date_col, prefix, freq, resample
         )
 
+    if not resample:
+        df_lagged = df.copy()
+        for lag in lags:
+            shifted = _with_lagged_column_no_resample(
+                df=df,
+                columns_to_lag=columns,
+                id_columns=[id_column],
+                lags=lag,
+                prefix=prefix,
+            )
+            for col in columns:
+                df_lagged[f"{prefix}{lag}_{col}"] = shifted[f"{prefix}{lag}_{col}"]
+        return df_lagged
+
+    ids = pd.factorize(df[id_column])[0].astype(np.int64)
+    periods = _period_numbers(df[date_col], freq).astype(np.int64)
+    # One key per (id, period), with room for the lagged periods on both sides
+    span = periods.max() + 2 * max(abs(lag) for lag in lags) + 1 if len(df) else 1
+    keys = ids * span + periods
+    order = np.lexsort((df[date_col].to_numpy(), keys))
+    sorted_keys = keys[order]
+
+    df_lagged = df.copy()
+    for lag in lags:
+        target = keys - lag
+        # Last row of the same id in the lagged period, if any
+        pos = np.searchsorted(sorted_keys, target, side="right") - 1
+        found = (pos >= 0) & (ids >= 0)
+        found[found] &= sorted_keys[pos[found]] == target[found]
+        rows = np.where(found, order[np.maximum(pos, 0)], -1)
+        for col in columns:
+            df_lagged[f"{prefix}{lag}_{col}"] = pd.api.extensions.take(
+                df[col].to_numpy(), rows, allow_fill=True
+            )
     return df_lagged
 
 
-def leave_one_out_sums(df, groupby=[], summed_col=""):
+def _with_lagged_columns_polars(
+    df, columns, id_column, lags, date_col, prefix, freq, resample
+):
+    lazy = df.lazy().with_row_index("_row")
+    if resample:
+        dates = lazy.select(date_col).collect().to_series().to_numpy()
+        lazy = lazy.with_columns(_period=pl.Series(_period_numbers(dates, freq)))
+        lazy = lazy.sort(id_column, "_period", date_col)
+    else:
+        lazy = lazy.sort(id_column, date_col).with_columns(
+            _period=pl.int_range(pl.len()).over(id_column)
+        )
+    # One sorted integer key per (id, period), with room for the lagged
+    # periods on both sides
+    span = pl.col("_period").max() + 2 * max(abs(lag) for lag in lags) + 1
+    new_id = pl.col(id_column).ne_missing(pl.col(id_column).shift(1))
+    lazy = lazy.with_columns(
+        _key=new_id.cum_sum().cast(pl.Int64) * span + pl.col("_period")
+    )
+    # The last observation of each id and period
+    last = lazy.filter(pl.col("_key").ne_missing(pl.col("_key").shift(-1))).select(
+        "_key", *columns
+    )
+    for lag in lags:
+        names = {col: f"{prefix}{lag}_{col}" for col in columns}
+        lagged = last.select(
+            pl.col("_key").alias("_lagged_key"),
+            *[pl.col(col).alias(name) for col, name in names.items()],
+        )
+        lazy = (
+            lazy.with_columns(_target=pl.col("_key") - lag)
+            .join_asof(
+                lagged, left_on="_target", right_on="_lagged_key", strategy="backward"
+            )
+            .with_columns(
+                pl.when(pl.col("_lagged_key") == pl.col("_target")).then(pl.col(name))
+                for name in names.values()
+            )
+            .drop("_target", "_lagged_key")
+        )
+    result = lazy.sort("_row").drop("_row", "_period", "_key")
+    return _collect(result, df)
+
+
+def leave_one_out_sums(df, groupby=[], summed_col="", library=None):
     """
     Compute leave-one-out sums,
 
     $x_i = \\sum_{\\ell'\\neq\\ell} w_{i, \\ell'}$
 
     This is helpful for constructing the shift-share instruments
-    in Borusyak, Hull, Jaravel (2022).
+    in Borusyak, Hull, Jaravel (2022). See `leave_one_out_aggregates` for
+    means, counts, weights and leaving out whole groups.
 
     Examples
     --------
@@ -652,8 +1935,170 @@ def leave_one_out_sums(df, groupby=[], summed_col=""):
     ```
 
     """
-    s = df.groupby(groupby)[summed_col].transform(lambda x: x.sum() - x)
-    return s
+    return leave_one_out_aggregates(
+        df, columns=summed_col, groupby=groupby, stat="sum", library=library
+    )
+
+
+def leave_one_out_aggregates(
+    df,
+    columns,
+    groupby,
+    stat="sum",
+    weight_col=None,
+    leave_out_col=None,
+    library=None,
+):
+    """
+    Sum, mean or count of `columns` over the other rows of each row's
+    `groupby` group.
+
+    With `leave_out_col`, all the rows of the group that share the row's
+    value of `leave_out_col` are left out (leave-one-group-out), e.g. the
+    average exposure of the other banks in a region, leaving out all the
+    rows of the same bank.
+
+    The aggregates are computed from segment sums: the group totals (with
+    `np.bincount` on the group numbers of the rows) minus the row's own
+    contribution (or the total of its left-out group), so there is no
+    Python call per group. With `weight_col`, the sums and means are
+    weighted and the counts are sums of weights. Missing values are
+    skipped; rows with a missing group key get a missing result.
+
+    `columns` can be a list, in which case a DataFrame is returned. When `df`
+    is a polars DataFrame (or LazyFrame), a polars DataFrame (or LazyFrame)
+    with one column per `columns` is returned.
+
+    Examples
+    --------
+    ```
+    >>> df = pd.DataFrame({
+    ...     'region': ['N', 'N', 'N', 'S', 'S'],
+    ...     'bank': ['a', 'a', 'b', 'a', 'b'],
+    ...     'loans': [1.0, 2.0, 4.0, 8.0, None],
+    ... })
+    >>> leave_one_out_aggregates(df, 'loans', groupby='region', stat='mean')
+    0   3.00
+    1   2.50
+    2   1.50
+    3    NaN
+    4   8.00
+    Name: loans, dtype: float64
+    >>> leave_one_out_aggregates(df, 'loans', groupby='region', leave_out_col='bank')
+    0   4.00
+    1   4.00
+    2   3.00
+    3   0.00
+    4   8.00
+    Name: loans, dtype: float64
+
+    ```
+    """
+    if stat not in ("sum", "mean", "count"):
+        raise ValueError(f"Unknown stat: {stat}")
+    library = _frame_library(df, library)
+    if library == "polars":
+        return _leave_one_out_aggregates_polars(
+            df, columns, groupby, stat, weight_col, leave_out_col
+        )
+
+    by = [groupby] if isinstance(groupby, str) else list(groupby)
+    cols = [columns] if isinstance(columns, str) else list(columns)
+    g = df.groupby(by, observed=True)
+    n_groups = g.ngroups
+    # Group number of each row, -1 for rows with a missing key
+    codes = g.ngroup().fillna(-1).to_numpy(dtype=np.intp)
+    in_group = codes >= 0
+    if leave_out_col is not None:
+        leave_out = [leave_out_col] if isinstance(leave_out_col, str) else leave_out_col
+        g_out = df.groupby(by + list(leave_out), observed=True)
+        n_out = g_out.ngroups
+        out_codes = g_out.ngroup().fillna(-1).to_numpy(dtype=np.intp)
+        in_group &= out_codes >= 0
+        out_codes = np.maximum(out_codes, 0)
+    codes = np.maximum(codes, 0)
+
+    weights = np.ones(len(df))
+    if weight_col is not None:
+        weights = df[weight_col].to_numpy(dtype=float)
+    weights = np.where(in_group, weights, np.nan)
+
+    def others(x):
+        """Total of `x` over the group, minus the row's own part."""
+        total = np.bincount(codes, weights=x, minlength=n_groups)[codes]
+        if leave_out_col is None:
+            return total - x
+        return total - np.bincount(out_codes, weights=x, minlength=n_out)[out_codes]
+
+    result = {}
+    for col in cols:
+        vals = df[col].to_numpy(dtype=float)
+        valid = ~np.isnan(vals) & ~np.isnan(weights)
+        valid_weights = np.where(valid, weights, 0.0)
+        if stat == "count":
+            agg = others(valid_weights)
+        else:
+            agg = others(np.where(valid, vals * weights, 0.0))
+            if stat == "mean":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    agg = agg / others(valid_weights)
+        agg[~in_group] = np.nan
+        # Unweighted sums of integers are integers, as with transform("sum")
+        integer = stat == "count" or pd.api.types.is_integer_dtype(df[col])
+        if integer and stat != "mean" and weight_col is None and in_group.all():
+            agg = agg.astype(np.int64)
+        result[col] = agg
+
+    result = pd.DataFrame(result, index=df.index)
+    if isinstance(columns, str):
+        return result[columns]
+    return result
+
+
+def _leave_one_out_aggregates_polars(
+    df, columns, groupby, stat, weight_col, leave_out_col
+):
+    by = [groupby] if isinstance(groupby, str) else list(groupby)
+    cols = [columns] if isinstance(columns, str) else list(columns)
+    leave_out = []
+    if leave_out_col is not None:
+        leave_out = [leave_out_col] if isinstance(leave_out_col, str) else leave_out_col
+    in_group = _has_keys(by + list(leave_out))
+    weights = pl.lit(1.0)
+    if weight_col is not None:
+        weights = pl.col(weight_col).cast(pl.Float64).fill_nan(None)
+    schema = df.lazy().collect_schema()
+
+    def others(x):
+        if leave_out_col is None:
+            own = x
+        else:
+            own = x.sum().over(by + list(leave_out))
+        return x.sum().over(by) - own
+
+    aggs = []
+    for col in cols:
+        vals = pl.col(col).cast(pl.Float64).fill_nan(None)
+        valid_weights = (
+            pl.when(in_group & vals.is_not_null() & weights.is_not_null())
+            .then(weights)
+            .otherwise(0.0)
+        )
+        if stat == "count":
+            agg = others(valid_weights)
+        else:
+            agg = others((vals * valid_weights).fill_null(0.0))
+            if stat == "mean":
+                agg = agg / others(valid_weights)
+        agg = pl.when(in_group).then(agg)
+        # Integer results, as in the pandas backend
+        integer = stat == "count" or schema[col].is_integer()
+        if integer and stat != "mean" and weight_col is None:
+            agg = agg.cast(pl.Int64)
+        aggs.append(agg.alias(col))
+
+    result = df.lazy().select(aggs)
+    return _collect(result, df)
 
 
 def get_most_recent_quarter_end(d):
@@ -783,6 +2228,7 @@ def plot_weighted_median_with_distribution_bars(
     rolling_window=1,
     rolling=False,
     rolling_min_periods=None,
+    rolling_pooled=False,
     rescale_factor=1,
     ax=None,
     add_quarter_lines=True,
@@ -840,15 +2286,38 @@ def plot_weighted_median_with_distribution_bars(
     -----
     rolling_window=1 means that there is no rolling aggregation applied.
 
+    By default, rolling averages the daily weighted quantiles. With
+    rolling_pooled=True, the quantiles are instead those of all observations
+    in the rolling window (see `rolling_weighted_stats`).
+
 
     """
     if ax is None:
         plt.clf()
         _, ax = plt.subplots()
 
-    median_series = data.groupby(date_col).apply(
-        lambda x: weighted_quantile(x[variable_name], 0.5, sample_weight=x[weight_col])
-    )
+    # All quantiles are computed together, sorting each date only once
+    quantiles = [0.5] + (list(percentiles) if percentile_bars else [])
+    if rolling and rolling_pooled:
+        quantile_df = rolling_weighted_stats(
+            data=data,
+            data_col=variable_name,
+            weight_col=weight_col,
+            date_col=date_col,
+            window=rolling_window,
+            min_periods=1 if rolling_min_periods is None else rolling_min_periods,
+            quantiles=quantiles,
+        ).iloc[:, 2:]
+        rolling = False
+    else:
+        quantile_df = groupby_weighted_quantile(
+            data_col=variable_name,
+            weight_col=weight_col,
+            by_col=date_col,
+            data=data,
+            quantiles=quantiles,
+        )
+    median_series = quantile_df.iloc[:, 0]
     if rolling:
         wavrs = median_series.rolling(
             rolling_window, min_periods=rolling_min_periods
@@ -858,16 +2327,8 @@ def plot_weighted_median_with_distribution_bars(
     (wavrs * rescale_factor).plot(ax=ax, label=label)
 
     if percentile_bars:
-        lower = data.groupby(date_col).apply(
-            lambda x: weighted_quantile(
-                x[variable_name], percentiles[0], sample_weight=x[weight_col]
-            )
-        )
-        upper = data.groupby(date_col).apply(
-            lambda x: weighted_quantile(
-                x[variable_name], percentiles[1], sample_weight=x[weight_col]
-            )
-        )
+        lower = quantile_df.iloc[:, 1]
+        upper = quantile_df.iloc[:, 2]
         if rolling:
             lower = lower.rolling(
                 rolling_window, min_periods=rolling_min_periods
@@ -906,7 +2367,7 @@ def plot_weighted_median_with_distribution_bars(
 
 
 def aligned_glimpse(
-    df: pl.DataFrame,
+    df: pl.DataFrame | pl.LazyFrame | pd.DataFrame,
     max_items: int = 10,
     sig_figs: int = 6,
     val_width: int = 12,
@@ -921,8 +2382,9 @@ def aligned_glimpse(
 
     Parameters
     ----------
-    df : pl.DataFrame
-        DataFrame to display
+    df : pl.DataFrame, pl.LazyFrame or pd.DataFrame
+        DataFrame to display. Only the first `max_items` rows of a LazyFrame
+        are collected.
     max_items : int
         Maximum number of rows to show (default 10)
     sig_figs : int
@@ -967,13 +2429,21 @@ def aligned_glimpse(
 
     # Limit rows to display
     df_head = df.head(max_items)
+    if isinstance(df_head, pl.LazyFrame):
+        df_head = df_head.collect()
+    if isinstance(df_head, pd.DataFrame):
+        # Missing values as None, like polars' to_list
+        df_head = df_head.astype(object).where(df_head.notna(), None)
+        dtypes = df.dtypes.to_dict()
+    else:
+        dtypes = df_head.schema
 
     # Find max column name length for alignment
-    max_col_len = max(len(c) for c in df.columns)
+    max_col_len = max(len(c) for c in df_head.columns)
 
     # Print each column as a row
-    for col_name in df.columns:
-        dtype = df[col_name].dtype
+    for col_name in df_head.columns:
+        dtype = dtypes[col_name]
         original_vals = df_head[col_name].to_list()
         formatted_vals = [format_val(v, col_name) for v in original_vals]
 
@@ -28,11 +28,21 @@ https://wrds-www.wharton.upenn.edu/documents/400/CRSP_Programmers_Guide.pdf
 
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-import wrds
+import pyarrow as pa
+import pyarrow.dataset as ds
 from pandas.tseries.offsets import MonthEnd
 
 from settings import config
+from wrds_backend import connect
+from wrds_schema import (
+    arrow_schema,
+    build_select,
+    date_columns,
+    enforce_crsp_dtypes,
+    get_table_schema,
+)
 
 OUTPUT_DIR = Path(config("OUTPUT_DIR"))
 DATA_DIR = Path(config("DATA_DIR"))
@@ -64,27 +74,46 @@ description_compustat = {
 }
 
 
-def pull_compustat(wrds_username=WRDS_USERNAME):
+compustat_columns = [
+    "gvkey",
+    "datadate",
+    "at",
+    "sale",
+    "cogs",
+    "xsga",
+    "xint",
+    "pstkl",
+    "txditc",
+    "pstkrv",
+    "seq",
+    "pstk",
+    "ni",
+    "sich",
+    "dp",
+    "ebit",
+]
+
+
+def pull_compustat(wrds_username=WRDS_USERNAME, columns=compustat_columns):
     """
     See description_compustat for a description of the variables.
+
+    `columns` are checked against the cached schema of `comp.funda` (see
+    `wrds_schema.get_table_schema`) before the query is sent.
     """
-    sql_query = """
-        SELECT 
-            gvkey, datadate, at, sale, cogs, xsga, xint, pstkl, txditc,
-            pstkrv, seq, pstk, ni, sich, dp, ebit
-        FROM 
-            comp.funda
-        WHERE 
+    where = """
             indfmt='INDL' AND -- industrial companies
             datafmt='STD' AND -- only standardized records
             popsrc='D' AND -- only from primary sources
             consol='C' AND -- consolidated financial statements
-            datadate >= '01/01/1959'
+            datadate >= '1959-01-01'
         """
     # with wrds.Connection(wrds_username=wrds_username) as db:
     #     comp = db.raw_sql(sql_query, date_cols=["datadate"])
-    db = wrds.Connection(wrds_username=wrds_username)
-    comp = db.raw_sql(sql_query, date_cols=["datadate"])
+    db = connect(wrds_username=wrds_username)
+    table_schema = get_table_schema("comp", "funda", db=db)
+    sql_query = build_select("comp", "funda", columns, table_schema, where=where)
+    comp = db.raw_sql(sql_query, date_cols=date_columns(table_schema, columns))
     db.close()
 
     comp["year"] = comp["datadate"].dt.year
@@ -110,27 +139,53 @@ description_crsp = {
 }
 
 
-def get_crsp_columns(wrds_username=WRDS_USERNAME):
-    """Get all column names from CRSP monthly stock file (CIZ format)."""
-    sql_query = """
-        SELECT column_name, data_type
-        FROM information_schema.columns
-        WHERE table_schema = 'crsp'
-        AND table_name = 'msf_v2'
-        ORDER BY ordinal_position;
-    """
-
-    db = wrds.Connection(wrds_username=wrds_username)
-    columns = db.raw_sql(sql_query)
-    db.close()
+def get_crsp_columns(wrds_username=WRDS_USERNAME, refresh=False):
+    """Get all column names from CRSP monthly stock file (CIZ format).
 
+    The columns are read from the local schema catalog and only queried from
+    WRDS when the catalog is missing or stale (or `refresh=True`).
+    """
+    table_schema = get_table_schema(
+        "crsp", "msf_v2", wrds_username=wrds_username, refresh=refresh
+    )
+    columns = pd.DataFrame(
+        table_schema["columns"].items(), columns=["column_name", "data_type"]
+    )
     return columns
 
 
-def pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME):
+crsp_ciz_columns = [
+    "permno",
+    "permco",
+    "mthcaldt",
+    "issuertype",
+    "securitytype",
+    "securitysubtype",
+    "sharetype",
+    "usincflg",
+    "primaryexch",
+    "conditionaltype",
+    "tradingstatusflg",
+    "mthret",
+    "mthretx",
+    "shrout",
+    "mthprc",
+    "cfacshr",
+    "cfacpr",
+]
+
+
+def pull_CRSP_stock_ciz(
+    wrds_username=WRDS_USERNAME, float32_returns=False, columns=crsp_ciz_columns
+):
     """Pull necessary CRSP monthly stock data to
     compute Fama-French factors. Use the new CIZ format.
 
+    Columns are cast to the compact types defined in `wrds_schema.py`. Set
+    `float32_returns=True` to also store returns as float32. `columns` are
+    checked against the cached schema of `crsp.msf_v2` before the query is
+    sent.
+
     Notes
     -----
 
@@ -156,26 +211,16 @@ def pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME):
     market_cap = mthprc * shrout
 
     """
-    sql_query = """
-        SELECT 
-            permno, permco, mthcaldt, 
-            issuertype, securitytype, securitysubtype, sharetype, 
-            usincflg, 
-            primaryexch, conditionaltype, tradingstatusflg,
-            mthret, mthretx, shrout, mthprc,
-            cfacshr, cfacpr
-        FROM 
-            crsp.msf_v2
-        WHERE 
-            mthcaldt >= '01/01/1959'
-        """
-
-    db = wrds.Connection(wrds_username=wrds_username)
-    crsp_m = db.raw_sql(sql_query, date_cols=["mthcaldt"])
+    db = connect(wrds_username=wrds_username)
+    table_schema = get_table_schema("crsp", "msf_v2", db=db)
+    sql_query = build_select(
+        "crsp", "msf_v2", columns, table_schema, where="mthcaldt >= '1959-01-01'"
+    )
+    crsp_m = db.raw_sql(sql_query, date_cols=date_columns(table_schema, columns))
     db.close()
 
-    # change variable format to int
-    crsp_m[["permco", "permno"]] = crsp_m[["permco", "permno"]].astype(int)
+    # change variable formats to compact types (int32 ids, categorical flags)
+    crsp_m = enforce_crsp_dtypes(crsp_m, float32_returns=float32_returns)
 
     # Line up date to be end of month
     crsp_m["jdate"] = crsp_m["mthcaldt"] + MonthEnd(0)
@@ -203,14 +248,14 @@ def pull_CRSP_Comp_Link_Table(wrds_username=WRDS_USERNAME):
             substr(linktype,1,1)='L' AND 
             (linkprim ='C' OR linkprim='P')
         """
-    db = wrds.Connection(wrds_username=wrds_username)
+    db = connect(wrds_username=wrds_username)
     ccm = db.raw_sql(sql_query, date_cols=["linkdt", "linkenddt"])
     db.close()
     return ccm
 
 
 def pull_Fama_French_factors(wrds_username=WRDS_USERNAME):
-    conn = wrds.Connection(wrds_username=wrds_username)
+    conn = connect(wrds_username=wrds_username)
     ff = conn.get_table(library="ff", table="factors_monthly")
     conn.close()
     ff[["smb", "hml"]] = ff[["smb", "hml"]].astype(float)
@@ -221,9 +266,87 @@ def pull_Fama_French_factors(wrds_username=WRDS_USERNAME):
     return ff
 
 
-def load_compustat(data_dir=DATA_DIR):
-    path = Path(data_dir) / "Compustat.parquet"
-    comp = pd.read_parquet(path)
+# Compustat is stored as a hive-partitioned parquet dataset, one directory per
+# calendar year of `datadate` (e.g. Compustat/year=1990/). Within each year,
+# rows are sorted by gvkey and written in small row groups, so that the min/max
+# statistics of each row group let the reader skip everything but the
+# requested firms.
+COMPUSTAT_DIRNAME = "Compustat"
+COMPUSTAT_PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16())]), flavor="hive"
+)
+COMPUSTAT_ROWS_PER_GROUP = 4096
+
+
+def save_compustat(comp, data_dir=DATA_DIR, table_schema=None):
+    """Write the output of `pull_compustat` to a year-partitioned dataset
+    in `data_dir / "Compustat"`, replacing any years that already exist.
+
+    If the schema of `comp.funda` is given (see `wrds_schema.get_table_schema`),
+    the columns are stored with the Arrow types of the table rather than the
+    types inferred by pandas (see `wrds_schema.arrow_schema`).
+    """
+    comp = comp.sort_values(["year", "gvkey", "datadate"], ignore_index=True)
+    schema = None
+    if table_schema is not None:
+        schema = arrow_schema(table_schema, df=comp)
+    table = pa.Table.from_pandas(comp, schema=schema, preserve_index=False)
+    table = table.set_column(
+        table.schema.get_field_index("year"),
+        "year",
+        table.column("year").cast(pa.int16()),
+    )
+    ds.write_dataset(
+        table,
+        Path(data_dir) / COMPUSTAT_DIRNAME,
+        format="parquet",
+        partitioning=COMPUSTAT_PARTITIONING,
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=COMPUSTAT_ROWS_PER_GROUP,
+    )
+
+
+def load_compustat(data_dir=DATA_DIR, gvkeys=None, years=None, columns=None):
+    """Load Compustat data saved with `save_compustat`.
+
+    Filtering on `years` only opens the matching partitions, and filtering on
+    `gvkeys` only reads the row groups that can contain those firms. With no
+    filters, the whole dataset is returned, with the same columns and dtypes
+    as the output of `pull_compustat`. Rows are sorted by year, gvkey and
+    datadate.
+
+    Examples
+    --------
+    ```
+    # Two firms, all years
+    comp = load_compustat(gvkeys=["001690", "012141"])
+
+    # Book equity inputs for the 1990s
+    comp = load_compustat(
+        years=range(1990, 2000),
+        columns=["gvkey", "datadate", "seq", "txditc", "pstkrv", "pstkl", "pstk"],
+    )
+    ```
+    """
+    dataset = ds.dataset(
+        Path(data_dir) / COMPUSTAT_DIRNAME,
+        format="parquet",
+        partitioning=COMPUSTAT_PARTITIONING,
+    )
+    expression = None
+    if years is not None:
+        years = [years] if np.isscalar(years) else list(years)
+        expression = ds.field("year").isin(pa.array(years, type=pa.int16()))
+    if gvkeys is not None:
+        gvkeys = [gvkeys] if isinstance(gvkeys, str) else list(gvkeys)
+        gvkey_filter = ds.field("gvkey").isin(pa.array(gvkeys, type=pa.string()))
+        expression = gvkey_filter if expression is None else expression & gvkey_filter
+
+    table = dataset.to_table(columns=columns, filter=expression)
+    comp = table.to_pandas()
+    if "year" in comp.columns:
+        # The partition key is stored as int16, `pull_compustat` gives int32
+        comp["year"] = comp["year"].astype("int32")
     return comp
 
 
@@ -254,7 +377,11 @@ def _demo():
 
 if __name__ == "__main__":
     comp = pull_compustat(wrds_username=WRDS_USERNAME)
-    comp.to_parquet(DATA_DIR / "Compustat.parquet")
+    save_compustat(
+        comp,
+        data_dir=DATA_DIR,
+        table_schema=get_table_schema("comp", "funda", wrds_username=WRDS_USERNAME),
+    )
 
     crsp = pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME)
     crsp.to_parquet(DATA_DIR / "CRSP_stock_ciz.parquet")
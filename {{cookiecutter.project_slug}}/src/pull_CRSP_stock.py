@@ -23,10 +23,20 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import wrds
+import pyarrow as pa
+import pyarrow.dataset as ds
 from dateutil.relativedelta import relativedelta
+from pyarrow import fs
 
 from settings import config
+from wrds_backend import connect
+from wrds_schema import (
+    arrow_schema,
+    check_columns,
+    date_columns,
+    enforce_crsp_dtypes,
+    get_table_schema,
+)
 
 DATA_DIR = Path(config("DATA_DIR"))
 WRDS_USERNAME = config("WRDS_USERNAME")
@@ -34,8 +44,31 @@ START_DATE = config("START_DATE")
 END_DATE = config("END_DATE")
 
 
+# Columns taken from each of the tables joined in `pull_CRSP_monthly_file`
+crsp_monthly_columns = {
+    "msf": [
+        "date",
+        "permno",
+        "permco",
+        "ret",
+        "retx",
+        "prc",
+        "altprc",
+        "vol",
+        "shrout",
+        "cfacshr",
+        "cfacpr",
+    ],
+    "msenames": ["shrcd", "exchcd", "comnam", "shrcls", "naics", "siccd"],
+    "msedelist": ["dlret", "dlretx", "dlstcd"],
+}
+
+
 def pull_CRSP_monthly_file(
-    start_date=START_DATE, end_date=END_DATE, wrds_username=WRDS_USERNAME
+    start_date=START_DATE,
+    end_date=END_DATE,
+    wrds_username=WRDS_USERNAME,
+    float32_returns=False,
 ):
     """
     Pulls monthly CRSP stock data from a specified start date to end date.
@@ -44,6 +77,13 @@ def pull_CRSP_monthly_file(
     follows the guidelines that CRSP uses for inclusion, with the exception
     of code 73, which is foreign companies -- without including this, the universe
     of securities is roughly half of what it should be.
+
+    Columns are cast to the compact types defined in `wrds_schema.py`. Set
+    `float32_returns=True` to also store returns as float32.
+
+    The columns in `crsp_monthly_columns` are checked against the cached
+    schemas of the joined tables (see `wrds_schema.get_table_schema`) before
+    the query is sent.
     """
     # Convert start_date to datetime if it's a string
     if isinstance(start_date, str):
@@ -53,13 +93,18 @@ def pull_CRSP_monthly_file(
     start_date = start_date - relativedelta(months=1)
     start_date = start_date.strftime("%Y-%m-%d")
 
+    db = connect(wrds_username=wrds_username)
+    select = []
+    date_cols = []
+    for table, columns in crsp_monthly_columns.items():
+        table_schema = get_table_schema("crsp", table, db=db)
+        check_columns(table_schema, columns, table=f"crsp.{table}")
+        select += [f"{table}.{col}" for col in columns]
+        date_cols += date_columns(table_schema, columns)
+
     query = f"""
     SELECT 
-        date,
-        msf.permno, msf.permco, shrcd, exchcd, comnam, shrcls, 
-        ret, retx, dlret, dlretx, dlstcd,
-        prc, altprc, vol, shrout, cfacshr, cfacpr,
-        naics, siccd
+        {", ".join(select)}
     FROM crsp.msf AS msf
     LEFT JOIN 
         crsp.msenames as msenames
@@ -81,8 +126,7 @@ def pull_CRSP_monthly_file(
     #     df = db.raw_sql(
     #         query, date_cols=["date", "namedt", "nameendt", "dlstdt"]
     #     )
-    db = wrds.Connection(wrds_username=wrds_username)
-    df = db.raw_sql(query, date_cols=["date", "namedt", "nameendt", "dlstdt"])
+    df = db.raw_sql(query, date_cols=date_cols)
     db.close()
 
     df = df.loc[:, ~df.columns.duplicated()]
@@ -103,6 +147,7 @@ def pull_CRSP_monthly_file(
     # Deal with delisting returns
     df = apply_delisting_returns(df)
 
+    df = enforce_crsp_dtypes(df, float32_returns=float32_returns)
     return df
 
 
@@ -121,7 +166,7 @@ def apply_delisting_returns(df):
         [
             df["dlstcd"].isin([500, 520, 580, 584] + list(range(551, 575)))
             & df["dlret"].isna(),
-            df["dlret"].isna() & df["dlstcd"].notna() & df["dlstcd"] >= 200,
+            df["dlret"].isna() & df["dlstcd"].notna() & (df["dlstcd"] >= 200),
             True,
         ],
         [-0.3, -1, df["dlret"]],
@@ -132,7 +177,7 @@ def apply_delisting_returns(df):
         [
             df["dlstcd"].isin([500, 520, 580, 584] + list(range(551, 575)))
             & df["dlretx"].isna(),
-            df["dlretx"].isna() & df["dlstcd"].notna() & df["dlstcd"] >= 200,
+            df["dlretx"].isna() & df["dlstcd"].notna() & (df["dlstcd"] >= 200),
             True,
         ],
         [-0.3, -1, df["dlretx"]],
@@ -169,12 +214,207 @@ def pull_CRSP_index_files(
     """
     # with wrds.Connection(wrds_username=wrds_username) as db:
     #     df = db.raw_sql(query, date_cols=["month", "caldt"])
-    db = wrds.Connection(wrds_username=wrds_username)
+    db = connect(wrds_username=wrds_username)
     df = db.raw_sql(query, date_cols=["caldt"])
     db.close()
     return df
 
 
+# The daily file is stored as a hive-partitioned dataset, one directory per
+# year (e.g. CRSP_DSF/year=1990/). Within each year, rows are sorted by
+# permno and date so that the row group statistics let the reader skip
+# everything but the requested securities.
+CRSP_DSF_DIRNAME = "CRSP_DSF"
+CRSP_DSF_PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16())]), flavor="hive"
+)
+CRSP_DSF_ROWS_PER_GROUP = 250_000
+
+# Columns taken from each of the tables joined in `pull_CRSP_daily_file`
+crsp_daily_columns = {
+    "dsf": [
+        "date",
+        "permno",
+        "permco",
+        "ret",
+        "retx",
+        "prc",
+        "vol",
+        "shrout",
+        "cfacshr",
+        "cfacpr",
+    ],
+    "dsenames": ["shrcd", "exchcd"],
+}
+
+
+def pull_CRSP_daily_file(
+    start_date=START_DATE,
+    end_date=END_DATE,
+    wrds_username=WRDS_USERNAME,
+    data_dir=DATA_DIR,
+    file_format="parquet",
+    float32_returns=False,
+):
+    """
+    Pulls daily CRSP stock data (crsp.dsf) and writes it to a year-partitioned
+    dataset in `data_dir / "CRSP_DSF"`.
+
+    The daily file is roughly 20 times larger than the monthly file, so it is
+    never held in memory all at once. It is pulled one calendar year at a
+    time, and each year is written to its own partition before the next
+    one is requested. Share codes are filtered the same way as in
+    `pull_CRSP_monthly_file`.
+
+    Use `file_format="ipc"` to write uncompressed Arrow IPC (Feather v2)
+    files instead of parquet. These take more disk space, but can be
+    memory-mapped without any decoding.
+
+    Returns the path to the dataset directory. Use `load_CRSP_daily_file`
+    to read slices of it.
+
+    The columns in `crsp_daily_columns` are checked against the cached
+    schemas of the joined tables, and the Arrow types of the written files
+    are taken from the same schemas (see `wrds_schema.arrow_schema`).
+    """
+    if isinstance(start_date, str):
+        start_date = datetime.strptime(start_date, "%Y-%m-%d")
+    if isinstance(end_date, str):
+        end_date = datetime.strptime(end_date, "%Y-%m-%d")
+
+    base_dir = Path(data_dir) / CRSP_DSF_DIRNAME
+    db = connect(wrds_username=wrds_username)
+    select = []
+    table_columns = {}
+    for table, columns in crsp_daily_columns.items():
+        table_schema = get_table_schema("crsp", table, db=db)
+        check_columns(table_schema, columns, table=f"crsp.{table}")
+        select += [f"{table}.{col}" for col in columns]
+        table_columns.update({col: table_schema["columns"][col] for col in columns})
+    # shrout is rescaled below, so it keeps the type pandas gives it
+    table_columns.pop("shrout")
+    table_schema = {"columns": table_columns}
+
+    for year in range(start_date.year, end_date.year + 1):
+        year_start = max(start_date, datetime(year, 1, 1)).strftime("%Y-%m-%d")
+        year_end = min(end_date, datetime(year, 12, 31)).strftime("%Y-%m-%d")
+        query = f"""
+        SELECT
+            {", ".join(select)}
+        FROM crsp.dsf AS dsf
+        LEFT JOIN
+            crsp.dsenames as dsenames
+        ON
+            dsf.permno = dsenames.permno AND
+            dsenames.namedt <= dsf.date AND
+            dsf.date <= dsenames.nameendt
+        WHERE
+            dsf.date BETWEEN '{year_start}' AND '{year_end}' AND
+            dsenames.shrcd IN (10, 11, 20, 21, 40, 41, 70, 71, 73)
+        """
+        df = db.raw_sql(query, date_cols=["date"])
+        if df.empty:
+            continue
+        df = df.sort_values(["permno", "date"], ignore_index=True)
+        df["shrout"] = df["shrout"] * 1000
+        df = enforce_crsp_dtypes(df, float32_returns=float32_returns)
+        df["year"] = year
+        _write_CRSP_daily_partition(
+            df,
+            base_dir,
+            file_format=file_format,
+            schema=arrow_schema(table_schema, df=df),
+        )
+    db.close()
+
+    return base_dir
+
+
+def _write_CRSP_daily_partition(df, base_dir, file_format="parquet", schema=None):
+    """Write one or more years of daily data, replacing those partitions."""
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    table = table.set_column(
+        table.schema.get_field_index("year"),
+        "year",
+        table.column("year").cast(pa.int16()),
+    )
+    if file_format == "parquet":
+        file_options = ds.ParquetFileFormat().make_write_options(compression="zstd")
+    elif file_format == "ipc":
+        file_options = ds.IpcFileFormat().make_write_options(compression=None)
+    else:
+        raise ValueError(f"Unknown file_format: {file_format}")
+    ds.write_dataset(
+        table,
+        base_dir,
+        format=file_format,
+        file_options=file_options,
+        partitioning=CRSP_DSF_PARTITIONING,
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=CRSP_DSF_ROWS_PER_GROUP,
+        min_rows_per_group=CRSP_DSF_ROWS_PER_GROUP,
+    )
+
+
+def load_CRSP_daily_file(
+    data_dir=DATA_DIR,
+    permnos=None,
+    start_date=None,
+    end_date=None,
+    columns=None,
+    file_format="parquet",
+):
+    """
+    Load a slice of the daily CRSP dataset written by `pull_CRSP_daily_file`.
+
+    The files are memory-mapped and only the requested slice is read.
+    Date bounds prune whole year partitions, and since rows are sorted by
+    permno within each year, a permno filter only touches the row groups
+    that contain those securities.
+
+    Examples
+    --------
+    ```
+    # All daily returns for two securities
+    df = load_CRSP_daily_file(permnos=[14593, 10107], columns=["date", "permno", "ret"])
+
+    # The whole cross-section for one month
+    df = load_CRSP_daily_file(start_date="2020-03-01", end_date="2020-03-31")
+    ```
+    """
+    dataset = ds.dataset(
+        Path(data_dir) / CRSP_DSF_DIRNAME,
+        format=file_format,
+        partitioning=CRSP_DSF_PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+    filters = []
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+        filters.append(ds.field("year") >= start_date.year)
+        filters.append(ds.field("date") >= start_date)
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date)
+        filters.append(ds.field("year") <= end_date.year)
+        filters.append(ds.field("date") <= end_date)
+    if permnos is not None:
+        permnos = pa.array(np.atleast_1d(permnos)).cast(
+            dataset.schema.field("permno").type
+        )
+        filters.append(ds.field("permno").isin(permnos))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != "year"]
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table.to_pandas()
+    return df
+
+
 def load_CRSP_monthly_file(data_dir=DATA_DIR):
     path = Path(data_dir) / "CRSP_MSF_INDEX_INPUTS.parquet"
     df = pd.read_parquet(path)
@@ -190,6 +430,10 @@ def load_CRSP_index_files(data_dir=DATA_DIR):
 def _demo():
     df_msf = load_CRSP_monthly_file(data_dir=DATA_DIR)
     df_msix = load_CRSP_index_files(data_dir=DATA_DIR)
+    df_dsf = load_CRSP_daily_file(
+        data_dir=DATA_DIR, start_date="2020-03-01", end_date="2020-03-31"
+    )
+    return df_msf, df_msix, df_dsf
 
 
 if __name__ == "__main__":
@@ -200,3 +444,5 @@ if __name__ == "__main__":
     df_msix = pull_CRSP_index_files(start_date=START_DATE, end_date=END_DATE)
     path = Path(DATA_DIR) / "CRSP_MSIX.parquet"
     df_msix.to_parquet(path)
+
+    pull_CRSP_daily_file(start_date=START_DATE, end_date=END_DATE, data_dir=DATA_DIR)
@@ -4,48 +4,349 @@ the given period from Bloomberg.
 
 You must have a Bloomberg terminal open on this computer to run. You must
 first install xbbg
+
+Requests go through `bdh_batched`, which caches each completed calendar year
+on disk (in `DATA_DIR / "bloomberg_cache"`) and asks for all the tickers,
+fields and years missing from the cache in a single `blp.bdh` call.
+Re-running the pull only requests the current year, which saves terminal
+request quota.
+
+Intraday bars are pulled with `pull_intraday_bars`, one `blp.bdib` request
+per ticker and day, with several requests running at once. Each day is
+written to a date-partitioned parquet dataset as soon as it arrives, so
+memory use does not grow with the window, and days that are already on disk
+are skipped, so an interrupted pull picks up where it stopped. Only days that
+are over are pulled, so that a partial session is never stored as complete.
+
+Set `BLOOMBERG_BACKEND=fake` to use the synthetic data in `fake_blp.py`
+instead of a terminal, e.g.
+```
+python src/pull_bloomberg.py --BLOOMBERG_BACKEND=fake
+```
 """
 
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
 
 from settings import config
 
 DATA_DIR = config("DATA_DIR")
 START_DATE = config("START_DATE")
 END_DATE = config("END_DATE")
+BLOOMBERG_BACKEND = config("BLOOMBERG_BACKEND")
 
+BBG_CACHE_DIR = Path(DATA_DIR) / "bloomberg_cache"
+BBG_INTRADAY_DIRNAME = "bloomberg_intraday"
 
-def pull_bbg_data(end_date=END_DATE):
-    bbg_df = pd.DataFrame()
-    bbg_df["dividend yield"] = blp.bdh(
-        "SPX Index", "EQY_DVD_YLD_12m", START_DATE, end_date
-    )[("SPX Index", "EQY_DVD_YLD_12m")]
-
-    bbg_df["index"] = blp.bdh("SPX Index", "px_last", START_DATE, end_date)[
-        ("SPX Index", "px_last")
-    ]
-
-    bbg_df["futures"] = pd.concat(
-        [
-            blp.bdh("SP1 Index", "px_last", START_DATE, "1997-08-31")[
-                ("SP1 Index", "px_last")
-            ],
-            blp.bdh("ES1 Index", "px_last", "1997-09-30", end_date)[
-                ("ES1 Index", "px_last")
-            ],
-        ]
+# S&P 500 futures: the big contract until the E-mini became the most liquid
+SPX_FUTURES_SCHEDULE = [
+    ("SP1 Index", START_DATE),
+    ("ES1 Index", "1997-09-30"),
+]
+
+
+def load_blp(backend=None):
+    """Return the `blp` module to request data from: `xbbg.blp` or, with
+    `backend="fake"`, `fake_blp`."""
+    backend = BLOOMBERG_BACKEND if backend is None else backend
+    if backend == "xbbg":
+        from xbbg import blp
+
+        return blp
+    if backend == "fake":
+        import fake_blp
+
+        return fake_blp
+    raise ValueError(f"Unknown Bloomberg backend: {backend}")
+
+
+def _year_spans(start_date, end_date):
+    """Split [start_date, end_date] into calendar-year spans."""
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    starts = [start_date] + list(pd.date_range(start_date, end_date, freq="YS"))
+    starts = sorted(set(starts))
+    ends = [s - pd.Timedelta(days=1) for s in starts[1:]] + [end_date]
+    return list(zip(starts, ends))
+
+
+def bdh_batched(
+    tickers, fields, start_date, end_date, blp=None, cache_dir=BBG_CACHE_DIR
+):
+    """Daily history of `fields` for `tickers`, with one `bdh` request for all
+    of them.
+
+    Years that are over are cached in `cache_dir`, one file per calendar
+    year, and read from there on later calls. The years that are not cached
+    are requested together, in one `bdh` call per run of consecutive missing
+    years (a single call on a cold cache), and split into years afterwards.
+    Set `cache_dir=None` to always request from Bloomberg.
+
+    Returns a DataFrame indexed by date with (ticker, field) columns, as
+    `blp.bdh` does. Missing combinations are filled with NaN.
+
+    Examples
+    --------
+    ```
+    df = bdh_batched(
+        ["SPX Index", "ES1 Index"], ["px_last", "px_volume"], "2000-01-01", "2024-12-31"
     )
+    df[("SPX Index", "px_last")]
+    ```
+    """
+    blp = load_blp() if blp is None else blp
+    tickers, fields = list(tickers), list(fields)
+    key = hashlib.sha1("|".join(sorted(tickers) + sorted(fields)).encode())
+    key = key.hexdigest()[:12]
+    today = pd.Timestamp.today().normalize()
+
+    spans = _year_spans(start_date, end_date)
+    frames = [None] * len(spans)
+    paths = [None] * len(spans)
+    runs = []
+    for i, (span_start, span_end) in enumerate(spans):
+        if cache_dir is not None:
+            filename = f"bdh_{key}_{span_start:%Y%m%d}_{span_end:%Y%m%d}.parquet"
+            paths[i] = Path(cache_dir) / filename
+        if paths[i] is not None and paths[i].exists():
+            frames[i] = pd.read_parquet(paths[i])
+        elif runs and runs[-1][-1] == i - 1:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+
+    for run in runs:
+        df = blp.bdh(tickers, fields, spans[run[0]][0], spans[run[-1]][1])
+        df.index = pd.to_datetime(df.index)
+        for i in run:
+            span_start, span_end = spans[i]
+            frames[i] = df.loc[span_start:span_end]
+            if paths[i] is not None and span_end < today:
+                paths[i].parent.mkdir(parents=True, exist_ok=True)
+                frames[i].to_parquet(paths[i])
+
+    columns = pd.MultiIndex.from_product([tickers, fields])
+    df = pd.concat(frames).reindex(columns=columns)
+    return df
+
+
+def stitch_continuous_futures(prices, schedule, adjust=None):
+    """Stitch the prices of several futures tickers into one continuous series.
+
+    Parameters
+    ----------
+    prices : pandas.DataFrame
+        Prices indexed by date, with one column per ticker.
+    schedule : list of (ticker, start_date)
+        Each ticker is used from its start date until the day before the
+        start date of the next one.
+    adjust : {None, "ratio", "difference"}
+        None splices the raw prices. "ratio" and "difference" back-adjust
+        earlier segments so that there is no jump on the roll dates, by
+        scaling or shifting them by the gap between the new and old ticker on
+        the last date before the roll.
+
+    Returns
+    -------
+    pandas.Series
+    """
+    if adjust not in (None, "ratio", "difference"):
+        raise ValueError(f"Unknown adjust: {adjust}")
+    segments = []
+    for i, (ticker, start) in enumerate(schedule):
+        end = None
+        if i + 1 < len(schedule):
+            end = pd.Timestamp(schedule[i + 1][1]) - pd.Timedelta(days=1)
+        segments.append(prices.loc[pd.Timestamp(start) : end, ticker].dropna())
+
+    if adjust is not None:
+        # Gap between the new and the old ticker on the last date before each
+        # roll. Every segment is adjusted by the gaps of all later rolls.
+        gaps = []
+        for i in range(1, len(segments)):
+            old = segments[i - 1]
+            new = prices[schedule[i][0]].loc[: old.index.max()].dropna()
+            if old.empty or new.empty:
+                gaps.append(1.0 if adjust == "ratio" else 0.0)
+            elif adjust == "ratio":
+                gaps.append(new.iloc[-1] / old.iloc[-1])
+            else:
+                gaps.append(new.iloc[-1] - old.iloc[-1])
+        for j in range(len(segments) - 1):
+            if adjust == "ratio":
+                segments[j] = segments[j] * np.prod(gaps[j:])
+            else:
+                segments[j] = segments[j] + np.sum(gaps[j:])
+
+    return pd.concat(segments)
+
+
+def pull_bbg_data(
+    start_date=START_DATE, end_date=END_DATE, blp=None, cache_dir=BBG_CACHE_DIR
+):
+    # Each group of tickers only asks for the fields it needs
+    futures_tickers = [ticker for ticker, _ in SPX_FUTURES_SCHEDULE]
+    index_df = bdh_batched(
+        ["SPX Index"],
+        ["EQY_DVD_YLD_12m", "px_last"],
+        start_date,
+        end_date,
+        blp=blp,
+        cache_dir=cache_dir,
+    )
+    futures_df = bdh_batched(
+        futures_tickers,
+        ["px_last"],
+        start_date,
+        end_date,
+        blp=blp,
+        cache_dir=cache_dir,
+    )
+
+    bbg_df = pd.DataFrame(index=index_df.index.union(futures_df.index))
+    bbg_df["dividend yield"] = index_df[("SPX Index", "EQY_DVD_YLD_12m")]
+    bbg_df["index"] = index_df[("SPX Index", "px_last")]
+    bbg_df["futures"] = stitch_continuous_futures(
+        futures_df.xs("px_last", axis=1, level=1), SPX_FUTURES_SCHEDULE
+    )
+    bbg_df = bbg_df.dropna(how="all")
 
     bbg_df.index.name = "Date"
 
     return bbg_df
 
 
-if __name__ == "__main__":
-    from xbbg import blp
+def _intraday_chunk_paths(base_dir, ticker, day):
+    """Data file and the marker written instead for days without data. The
+    marker starts with an underscore, so pyarrow does not read it. It holds
+    the number of empty responses received for the day."""
+    partition = base_dir / f"date={day:%Y-%m-%d}"
+    name = ticker.replace(" ", "_")
+    return partition / f"{name}.parquet", partition / f"_{name}.empty"
+
+
+def _pull_intraday_chunk(blp, ticker, day, path, empty_path, **kwargs):
+    """Request one day of bars for one ticker and write it to `path`."""
+    df = blp.bdib(ticker, dt=f"{day:%Y-%m-%d}", **kwargs)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if df.empty:
+        empty_path.write_text(str(_empty_responses(empty_path) + 1))
+        return 0
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.droplevel(0, axis=1)
+    df = df.rename_axis("time").reset_index()
+    df["time"] = pd.to_datetime(df["time"])
+    df.insert(0, "ticker", ticker)
+
+    # Write to a temporary file first so that a pull interrupted mid-write
+    # doesn't leave a chunk that looks complete.
+    tmp_path = path.with_name(f"_{path.name}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    tmp_path.replace(path)
+    return len(df)
+
+
+def _empty_responses(empty_path):
+    if not empty_path.exists():
+        return 0
+    return int(empty_path.read_text() or 1)
+
 
+def pull_intraday_bars(
+    tickers,
+    start_date,
+    end_date,
+    typ="TRADE",
+    interval=1,
+    blp=None,
+    data_dir=DATA_DIR,
+    max_workers=4,
+    max_empty_responses=3,
+):
+    """Pull intraday bars for `tickers` between `start_date` and `end_date`.
+
+    The window is split into one `bdib` request per ticker and business day,
+    and at most `max_workers` requests run at the same time. Each response is
+    written to `data_dir / "bloomberg_intraday" / "date=YYYY-MM-DD"` as it
+    arrives. Chunks already on disk are not requested again, so calling the
+    function again after an interruption resumes the pull.
+
+    Days from today on are not requested, since their session is not over.
+    `bdib` returns an empty frame both for days without trading and for
+    requests that failed or timed out, so an empty day is only skipped by
+    later calls once it has come back empty `max_empty_responses` times.
+
+    Returns the number of bars written by this call.
+
+    Examples
+    --------
+    ```
+    pull_intraday_bars(["ES1 Index"], "2023-01-01", "2024-12-31", interval=5)
+    bars = load_intraday_bars(["ES1 Index"], "2024-06-01", "2024-06-30")
+    ```
+    """
+    blp = load_blp() if blp is None else blp
+    base_dir = Path(data_dir) / BBG_INTRADAY_DIRNAME
+    yesterday = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    end_date = min(pd.Timestamp(end_date), yesterday)
+    chunks = []
+    for day in pd.bdate_range(start_date, end_date):
+        for ticker in tickers:
+            path, empty_path = _intraday_chunk_paths(base_dir, ticker, day)
+            if path.exists():
+                continue
+            if _empty_responses(empty_path) >= max_empty_responses:
+                continue
+            chunks.append((ticker, day, path, empty_path))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _pull_intraday_chunk,
+                blp,
+                *chunk,
+                typ=typ,
+                interval=interval,
+            )
+            for chunk in chunks
+        ]
+        n_bars = sum(future.result() for future in futures)
+    return n_bars
+
+
+def load_intraday_bars(
+    tickers=None, start_date=None, end_date=None, columns=None, data_dir=DATA_DIR
+):
+    """Load bars saved by `pull_intraday_bars`, reading only the days and
+    tickers requested. Rows are sorted by ticker and time."""
+    dataset = ds.dataset(
+        Path(data_dir) / BBG_INTRADAY_DIRNAME, format="parquet", partitioning="hive"
+    )
+    # Partition values are compared as strings, which sort like the dates
+    expression = ds.field("ticker").is_valid()
+    if start_date is not None:
+        expression &= ds.field("date") >= f"{pd.Timestamp(start_date):%Y-%m-%d}"
+    if end_date is not None:
+        expression &= ds.field("date") <= f"{pd.Timestamp(end_date):%Y-%m-%d}"
+    if tickers is not None:
+        expression &= ds.field("ticker").isin(list(tickers))
+    read_columns = columns
+    if columns is not None:
+        read_columns = list(dict.fromkeys(["ticker", "time", *columns]))
+    table = dataset.to_table(columns=read_columns, filter=expression)
+    df = table.to_pandas()
+    df = df.drop(columns="date", errors="ignore")
+    df = df.sort_values(["ticker", "time"], ignore_index=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+if __name__ == "__main__":
     df = pull_bbg_data(end_date=END_DATE)
     path = Path(DATA_DIR) / "bloomberg.parquet"
     df.to_parquet(path)
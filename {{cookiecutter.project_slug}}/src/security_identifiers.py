@@ -0,0 +1,395 @@
+"""
+Convert between security identifiers, and map CUSIPs to CRSP permnos.
+
+Identifiers:
+
+ - CUSIP: 8 characters identifying the security, plus a check digit
+   (`misc_tools.calc_check_digit`). Holdings data (13F, mutual funds, repo
+   collateral) usually report 9-digit CUSIPs, while CRSP stores 8-digit ones.
+ - ISIN: a 2-letter country code, a 9-character national identifier and a
+   check digit. For US and Canadian securities, the national identifier is
+   the 9-digit CUSIP; for UK securities, it is "00" followed by the SEDOL.
+ - SEDOL: 6 characters (digits and consonants) and a check digit.
+
+All functions work on whole arrays at once (see `misc_tools._ascii_matrix`),
+and return None for identifiers that are missing or invalid.
+
+CRSP changes a security's CUSIP when, e.g., the company changes its name, and
+CUSIPs are sometimes reused, so a CUSIP identifies a permno only on a given
+date. `build_cusip_crosswalk` turns the CRSP names history (`crsp.msenames`,
+pulled by `pull_CRSP_names_history`) into one row per CUSIP, permno and
+period of validity, which is saved to `DATA_DIR / "crsp_cusip_crosswalk.parquet"`.
+`CusipCrosswalk` loads it with a hash index on the CUSIP, for
+
+ - single lookups (`CusipCrosswalk.lookup`), which take a hash lookup and a
+   binary search over the few periods of that CUSIP, and
+ - bulk as-of joins of holdings data (`CusipCrosswalk.permnos` and
+   `CusipCrosswalk.add_permno`), which are a hashed `get_indexer` and one
+   `searchsorted` over the whole crosswalk, without merging or sorting the
+   holdings.
+"""
+
+import bisect
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from misc_tools import (
+    _ascii_matrix,
+    _cusip_check_digits,
+    _isin_check_digits,
+    validate_cusips,
+    validate_isins,
+)
+from settings import config
+from wrds_backend import connect
+from wrds_schema import check_columns, date_columns, get_table_schema
+
+DATA_DIR = Path(config("DATA_DIR"))
+WRDS_USERNAME = config("WRDS_USERNAME")
+
+# ISIN country codes whose national identifier is the CUSIP
+CUSIP_ISIN_COUNTRIES = ("US", "CA")
+
+# Value of each character in a SEDOL (vowels are not used)
+_sedol_values = np.full(256, -1, dtype=np.int16)
+_sedol_values[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10)
+for _i, _char in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZ"):
+    if _char not in "AEIOU":
+        _sedol_values[ord(_char)] = 10 + _i
+_sedol_weights = np.array([1, 3, 1, 7, 3, 9], dtype=np.int16)
+
+
+def _to_strings(chars, keep):
+    """Rows of an (n, width) array of ASCII codes as an object array of
+    strings, with None where `keep` is False."""
+    chars = np.ascontiguousarray(chars, dtype=np.uint8)
+    strings = chars.view(f"S{chars.shape[1]}").ravel().astype(str).astype(object)
+    strings[~keep] = None
+    return strings
+
+
+def _digit(values):
+    return (np.asarray(values) + ord("0")).astype(np.uint8)
+
+
+def cusip9_to_cusip8(cusips):
+    """First 8 characters of each CUSIP, e.g. to match CRSP's `ncusip`.
+
+    Examples
+    --------
+    ```
+    >>> cusip9_to_cusip8(['037833100', None])
+    array(['03783310', None], dtype=object)
+
+    ```
+    """
+    chars, wrong_length, _ = _ascii_matrix(cusips, 9)
+    return _to_strings(chars[:, :8], ~wrong_length)
+
+
+def cusip_to_isin(cusips, country="US"):
+    """ISINs of 8- or 9-digit CUSIPs. The CUSIP check digit is recomputed,
+    and 9-digit CUSIPs with a wrong check digit return None.
+
+    Examples
+    --------
+    ```
+    >>> cusip_to_isin(['03783310', '037833100', '037833101', 'AAPL'])
+    array(['US0378331005', 'US0378331005', None, None], dtype=object)
+
+    ```
+    """
+    cusips = np.asarray(cusips, dtype=object).ravel()
+    chars8, wrong_length8, _ = _ascii_matrix(cusips, 8)
+    chars9, wrong_length9, _ = _ascii_matrix(cusips, 9)
+    chars = np.where(wrong_length8[:, None], chars9[:, :8], chars8)
+    check_digits, invalid = _cusip_check_digits(chars)
+    valid = ~invalid & ~(wrong_length8 & wrong_length9)
+    valid &= wrong_length9 | (chars9[:, 8] == _digit(check_digits))
+
+    isin = np.empty((len(cusips), 12), dtype=np.uint8)
+    isin[:, :2] = np.frombuffer(country.encode(), dtype=np.uint8)
+    isin[:, 2:10] = chars
+    isin[:, 10] = _digit(check_digits)
+    isin[:, 11] = _digit(_isin_check_digits(isin[:, :11])[0])
+    return _to_strings(isin, valid)
+
+
+def isin_to_cusip(isins, countries=CUSIP_ISIN_COUNTRIES):
+    """9-digit CUSIPs of valid ISINs from `countries`.
+
+    Examples
+    --------
+    ```
+    >>> isin_to_cusip(['US0378331005', 'GB0002634946', 'US0378331006'])
+    array(['037833100', None, None], dtype=object)
+
+    ```
+    """
+    chars, _, _ = _ascii_matrix(isins, 12)
+    country = _to_strings(chars[:, :2], np.ones(len(chars), dtype=bool))
+    valid = validate_isins(isins) & np.isin(country, list(countries))
+    return _to_strings(chars[:, 2:11], valid)
+
+
+def _sedol_check_digits(chars):
+    """Check digits (as integers) of an (n, 6) array of ASCII codes, and a
+    mask of the rows with characters that are not allowed in a SEDOL."""
+    values = _sedol_values[chars]
+    invalid = (values < 0).any(axis=1)
+    total = (np.where(values < 0, 0, values) * _sedol_weights).sum(axis=1)
+    return (10 - total % 10) % 10, invalid
+
+
+def validate_sedols(sedols):
+    """Boolean array, True for the valid 7-character SEDOLs.
+
+    Examples
+    --------
+    ```
+    >>> validate_sedols(['0263494', '0263495', 'B0YBKJ7', 'B0YBKJ'])
+    array([ True, False,  True, False])
+
+    ```
+    """
+    chars, wrong_length, _ = _ascii_matrix(sedols, 7)
+    check_digits, invalid = _sedol_check_digits(chars[:, :6])
+    return ~wrong_length & ~invalid & (chars[:, 6] == _digit(check_digits))
+
+
+def sedol_to_isin(sedols, country="GB"):
+    """ISINs of valid SEDOLs.
+
+    Examples
+    --------
+    ```
+    >>> sedol_to_isin(['0263494', '0263495'])
+    array(['GB0002634946', None], dtype=object)
+
+    ```
+    """
+    chars, _, _ = _ascii_matrix(sedols, 7)
+    isin = np.empty((len(chars), 12), dtype=np.uint8)
+    isin[:, :2] = np.frombuffer(country.encode(), dtype=np.uint8)
+    isin[:, 2:4] = ord("0")
+    isin[:, 4:11] = chars
+    isin[:, 11] = _digit(_isin_check_digits(isin[:, :11])[0])
+    return _to_strings(isin, validate_sedols(sedols))
+
+
+def to_cusip8(identifiers):
+    """8-digit CUSIPs from a mix of 8-digit CUSIPs, 9-digit CUSIPs and
+    ISINs (see `CUSIP_ISIN_COUNTRIES`). Identifiers with a wrong check digit
+    return None.
+
+    Examples
+    --------
+    ```
+    >>> to_cusip8(['03783310', '037833100', 'US0378331005', '037833101'])
+    array(['03783310', '03783310', '03783310', None], dtype=object)
+
+    ```
+    """
+    identifiers = np.asarray(identifiers, dtype=object).ravel()
+    chars8, wrong_length8, _ = _ascii_matrix(identifiers, 8)
+    chars9, _, _ = _ascii_matrix(identifiers, 9)
+    chars12, _, _ = _ascii_matrix(isin_to_cusip(identifiers), 9)
+
+    is_cusip9 = validate_cusips(identifiers)
+    is_isin = chars12[:, 0] != 0
+    chars = np.where(
+        is_cusip9[:, None],
+        chars9[:, :8],
+        np.where(is_isin[:, None], chars12[:, :8], chars8),
+    )
+    _, invalid = _cusip_check_digits(chars)
+    keep = is_cusip9 | is_isin | (~wrong_length8 & ~invalid)
+    return _to_strings(chars, keep)
+
+
+########################################################################################
+## CUSIP to permno crosswalk
+########################################################################################
+
+
+def pull_CRSP_names_history(wrds_username=WRDS_USERNAME):
+    """Pull the CUSIP of every permno over time from `crsp.msenames`.
+
+    `ncusip` is the CUSIP in effect between `namedt` and `nameendt`, and
+    `cusip` is the most recent one (the "header" CUSIP).
+    """
+    columns = ["permno", "permco", "namedt", "nameendt", "ncusip", "cusip"]
+    db = connect(wrds_username=wrds_username)
+    table_schema = get_table_schema("crsp", "msenames", db=db)
+    check_columns(table_schema, columns, table="crsp.msenames")
+    query = f"SELECT {', '.join(columns)} FROM crsp.msenames"
+    df = db.raw_sql(query, date_cols=date_columns(table_schema, columns))
+    db.close()
+    return df
+
+
+def build_cusip_crosswalk(names):
+    """One row per CUSIP, permno and period over which the CUSIP identified
+    the permno, sorted by CUSIP and start date.
+
+    `msenames` has a new row whenever any of the name fields (e.g. the
+    exchange or share code) changes, so consecutive rows with the same
+    `ncusip` and `permno` are merged into one period.
+
+    The header CUSIP is added for permnos without any `ncusip`, valid over the
+    whole history of the permno.
+    """
+    names = names.dropna(subset=["permno", "namedt"])
+    by_ncusip = names.dropna(subset=["ncusip"])[
+        ["ncusip", "permno", "namedt", "nameendt"]
+    ].rename(columns={"ncusip": "cusip8"})
+    no_ncusip = names[~names["permno"].isin(by_ncusip["permno"])].dropna(
+        subset=["cusip"]
+    )
+    by_header = (
+        no_ncusip.groupby(["cusip", "permno"], as_index=False)
+        .agg(namedt=("namedt", "min"), nameendt=("nameendt", "max"))
+        .rename(columns={"cusip": "cusip8"})
+    )
+    df = pd.concat([by_ncusip, by_header], ignore_index=True)
+    df["permno"] = df["permno"].astype("int64")
+    df["nameendt"] = df["nameendt"].fillna(pd.Timestamp.max.normalize())
+    df = df.sort_values(["cusip8", "permno", "namedt"], kind="stable")
+
+    # Merge consecutive periods (no gap of more than a day) of the same pair
+    same_pair = (df["cusip8"] == df["cusip8"].shift()) & (
+        df["permno"] == df["permno"].shift()
+    )
+    # Latest end date so far within the pair
+    previous_end = df["nameendt"].groupby((~same_pair).cumsum()).cummax().shift()
+    contiguous = same_pair & (df["namedt"] - pd.Timedelta(days=1) <= previous_end)
+    period = (~contiguous).cumsum()
+    df = df.groupby(period, sort=False).agg(
+        cusip8=("cusip8", "first"),
+        permno=("permno", "first"),
+        namedt=("namedt", "min"),
+        nameendt=("nameendt", "max"),
+    )
+    df = df.sort_values(["cusip8", "namedt"], kind="stable").reset_index(drop=True)
+    return df
+
+
+def _day_numbers(dates):
+    """Dates as int64 days since 1970, with NaT as the smallest int64."""
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    return dates.view(np.int64)
+
+
+class CusipCrosswalk:
+    """Map 8-digit CUSIPs (or 9-digit CUSIPs and ISINs) to CRSP permnos, as
+    of a date.
+
+    Parameters
+    ----------
+    crosswalk : pandas.DataFrame
+        Output of `build_cusip_crosswalk`, with the columns cusip8, permno,
+        namedt and nameendt.
+
+    Examples
+    --------
+    ```
+    >>> crosswalk = pd.DataFrame({
+    ...     "cusip8": ["03783310", "03783310", "17275R10"],
+    ...     "permno": [14593, 99999, 76076],
+    ...     "namedt": pd.to_datetime(["1980-12-12", "1970-01-01", "1990-02-16"]),
+    ...     "nameendt": pd.to_datetime(["2024-12-31", "1979-12-31", "2024-12-31"]),
+    ... })
+    >>> xwalk = CusipCrosswalk(crosswalk)
+    >>> xwalk.lookup("037833100", "2020-06-30")
+    14593
+    >>> xwalk.permnos(["US0378331005", "03783310", "17275R10"],
+    ...               pd.to_datetime(["2020-06-30", "1975-01-31", "1980-01-31"]))
+    <IntegerArray>
+    [14593, 99999, <NA>]
+    Length: 3, dtype: Int64
+
+    ```
+    """
+
+    def __init__(self, crosswalk):
+        crosswalk = crosswalk.sort_values(["cusip8", "namedt"], kind="stable")
+        codes, uniques = pd.factorize(crosswalk["cusip8"], sort=True)
+        # Hash index from CUSIP to code; the rows of each code are contiguous
+        self._index = pd.Index(uniques)
+        self._starts = np.searchsorted(codes, np.arange(len(uniques) + 1))
+        self._codes = codes
+        self._start_days = _day_numbers(crosswalk["namedt"])
+        self._end_days = _day_numbers(crosswalk["nameendt"])
+        self._permnos = crosswalk["permno"].to_numpy(dtype=np.int64)
+        # Sorted (code, start date) keys for the as-of search
+        self._keys = self._key(codes, self._start_days)
+
+    @staticmethod
+    def _key(codes, days):
+        return (codes.astype(np.int64) << 32) + (days + 2**31)
+
+    @classmethod
+    def from_crsp(cls, data_dir=DATA_DIR):
+        """Crosswalk saved in `data_dir` by this module's `__main__`."""
+        return cls(load_cusip_crosswalk(data_dir=data_dir))
+
+    def lookup(self, identifier, date=None):
+        """Permno of a single CUSIP or ISIN on `date` (by default, the most
+        recent one), or None."""
+        if identifier not in self._index:
+            identifier = to_cusip8([identifier])[0]
+            if identifier is None or identifier not in self._index:
+                return None
+        code = self._index.get_loc(identifier)
+        start, stop = self._starts[code], self._starts[code + 1]
+        if date is None:
+            return int(self._permnos[stop - 1])
+        day = pd.Timestamp(date).value // (86400 * 10**9)
+        i = bisect.bisect_right(self._start_days[start:stop], day) - 1 + start
+        if i < start or day > self._end_days[i]:
+            return None
+        return int(self._permnos[i])
+
+    def permnos(self, identifiers, dates):
+        """Permnos of many CUSIPs or ISINs, each on its own date, as a
+        nullable integer array (missing where no CUSIP matches)."""
+        # Holdings repeat the same few CUSIPs, so only the distinct ones are
+        # converted and looked up
+        identifier_codes, uniques = pd.factorize(np.asarray(identifiers, dtype=object))
+        codes = self._index.get_indexer(to_cusip8(uniques))
+        codes = np.where(identifier_codes >= 0, codes[identifier_codes], -1)
+        days = _day_numbers(dates)
+        found = (codes >= 0) & ~np.isnat(np.asarray(dates, dtype="datetime64[D]"))
+        # Last period of the same CUSIP that starts on or before the date
+        rows = np.searchsorted(self._keys, self._key(codes, days), side="right") - 1
+        found &= rows >= 0
+        rows = np.where(found, rows, 0)
+        found &= self._codes[rows] == codes
+        found &= days <= self._end_days[rows]
+        return pd.arrays.IntegerArray(self._permnos[rows], ~found)
+
+    def add_permno(self, df, identifier_col="cusip", date_col="date"):
+        """Add the `permno` of `identifier_col` (CUSIPs or ISINs) at
+        `date_col` to a copy of `df`. Rows without a match have a missing
+        permno."""
+        df = df.copy()
+        df["permno"] = self.permnos(df[identifier_col], df[date_col])
+        return df
+
+
+def load_cusip_crosswalk(data_dir=DATA_DIR):
+    return pd.read_parquet(Path(data_dir) / "crsp_cusip_crosswalk.parquet")
+
+
+def _demo():
+    xwalk = CusipCrosswalk.from_crsp(data_dir=DATA_DIR)
+    print(xwalk.lookup("037833100"))
+    print(cusip_to_isin(["03783310", "17275R10"]))
+
+
+if __name__ == "__main__":
+    names = pull_CRSP_names_history(wrds_username=WRDS_USERNAME)
+    crosswalk = build_cusip_crosswalk(names)
+    crosswalk.to_parquet(DATA_DIR / "crsp_cusip_crosswalk.parquet")
@@ -151,6 +151,14 @@ else:
 defaults["START_DATE"] = datetime.strptime("1913-01-01", "%Y-%m-%d")
 defaults["END_DATE"] = datetime.strptime("2024-12-31", "%Y-%m-%d")
 
+## WRDS
+# Set to "duckdb" to run WRDS queries against the local mirror (wrds_backend.py)
+defaults["WRDS_BACKEND"] = "wrds"
+
+## Bloomberg
+# Set to "fake" to use synthetic data instead of a terminal (fake_blp.py)
+defaults["BLOOMBERG_BACKEND"] = "xbbg"
+
 
 ## File paths
 def if_relative_make_abs(path):
@@ -0,0 +1,47 @@
+import pandas as pd
+
+import benchmark_misc_tools
+from benchmark_misc_tools import (
+    BENCHMARKS,
+    load_benchmark_history,
+    make_crsp_panel,
+    make_repo_trades,
+    run_benchmarks,
+)
+
+
+def test_generators():
+    trades = make_repo_trades(5000, seed=1)
+    assert len(trades) == 5000
+    assert trades["date"].is_monotonic_increasing
+    assert (trades["cusip"].str.len() == 8).all()
+    pd.testing.assert_frame_equal(trades, make_repo_trades(5000, seed=1))
+
+    panel = make_crsp_panel(10_000)
+    assert abs(len(panel) - 10_000) < 500
+    assert not panel.duplicated(["permno", "mthcaldt"]).any()
+
+
+def test_run_benchmarks_appends_history(tmp_path, monkeypatch):
+    path = tmp_path / "benchmarks.csv"
+    for version in ["v1", "v2"]:
+        results = run_benchmarks(
+            sizes=[2000], repeat=1, output_path=path, version=version
+        )
+        assert set(results["function"]) == set(BENCHMARKS)
+        assert (results["seconds"] > 0).all()
+        assert (results["peak_memory_mb"] > 0).all()
+
+    history = load_benchmark_history(path)
+    assert list(history.columns) == ["v1", "v2"]
+    assert len(history) == len(BENCHMARKS)
+
+    # Slow functions are skipped above max_rows
+    monkeypatch.setattr(benchmark_misc_tools, "SLOW_FUNCTIONS", ["weighted_quantile"])
+    results = run_benchmarks(
+        sizes=[2000],
+        functions=["weighted_quantile"],
+        max_rows=1000,
+        output_path=None,
+    )
+    assert results.empty
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from calc_CRSP_adjustment_factors import (
+    calc_cumulative_adjustment_factors,
+    compare_with_legacy_factors,
+)
+
+
+def test_calc_cumulative_adjustment_factors():
+    crsp = pd.DataFrame(
+        {
+            "permno": np.array([2, 1, 1, 1, 1, 3], dtype="int32"),
+            "mthcaldt": pd.to_datetime(
+                [
+                    "1960-01-29",
+                    "1960-01-29",
+                    "1965-06-30",
+                    "1965-07-30",
+                    "2001-12-31",
+                    "2001-12-31",
+                ]
+            ),
+        },
+        index=[10, 11, 12, 13, 14, 15],
+    )
+    events = pd.DataFrame(
+        {
+            "permno": [1, 1, 1, 2],
+            # A 2-for-1 split in 1965, and a 3-for-2 split in 1990 on the
+            # same day as a spin-off that only affects the price.
+            "disexdt": pd.to_datetime(
+                ["1965-07-01", "1990-05-01", "1990-05-01", "1950-01-01"]
+            ),
+            "disfacpr": [1.0, 0.5, 0.1, 1.0],
+            "disfacshr": [1.0, 0.5, 0.0, 1.0],
+        }
+    )
+    factors = calc_cumulative_adjustment_factors(crsp, events)
+
+    expected = pd.DataFrame(
+        {
+            "cfacpr": [1.0, 2 * 1.5 * 1.1, 2 * 1.5 * 1.1, 1.5 * 1.1, 1.0, 1.0],
+            "cfacshr": [1.0, 3.0, 3.0, 1.5, 1.0, 1.0],
+        },
+        index=crsp.index,
+    )
+    pd.testing.assert_frame_equal(factors, expected)
+
+    legacy = expected.assign(cfacpr=expected["cfacpr"].where(crsp["permno"] != 1))
+    legacy.loc[14, "cfacshr"] = 2.0
+    comparison = compare_with_legacy_factors(factors, legacy)
+    assert comparison.loc["n", "cfacpr"] == 2
+    assert comparison.loc["share_matching", "cfacshr"] == 5 / 6
+    assert comparison.loc["max_rel_diff", "cfacshr"] == 0.5
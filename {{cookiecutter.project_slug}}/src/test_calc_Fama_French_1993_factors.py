@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from calc_Fama_French_1993_factors import calc_book_equity, calc_Fama_French_factors
+
+
+def test_calc_book_equity():
+    comp = pd.DataFrame(
+        {
+            "gvkey": ["001000", "001000", "002000"],
+            "datadate": pd.to_datetime(["2000-12-31", "2001-12-31", "2001-12-31"]),
+            "seq": [100.0, 100.0, 10.0],
+            "txditc": [5.0, np.nan, 0.0],
+            "pstkrv": [np.nan, 20.0, np.nan],
+            "pstkl": [10.0, 30.0, np.nan],
+            "pstk": [1.0, 1.0, 50.0],
+        }
+    )
+    result = calc_book_equity(comp)
+    pd.testing.assert_series_equal(
+        result["be"], pd.Series([95.0, 80.0, np.nan], name="be")
+    )
+    pd.testing.assert_series_equal(result["count"], pd.Series([0, 1, 0], name="count"))
+
+
+def _synthetic_universe():
+    """Twelve NYSE stocks with constant size and book-to-market.
+
+    Small stocks earn 1% more than big stocks and high book-to-market stocks
+    earn 2% more than low book-to-market stocks, so SMB should be 1% and HML
+    2% in every month.
+    """
+    dates = pd.date_range("1999-01-31", "2002-12-31", freq="ME")
+    permnos = np.arange(1, 13, dtype="int32")
+    is_small = permnos <= 6
+    bm_port = np.array(["L", "L", "M", "M", "H", "H"] * 2)
+    beme = np.array([0.1, 0.2, 0.5, 0.6, 2.0, 3.0] * 2)
+    price = np.where(is_small, 1.0, 10.0)
+    ret = 0.01 + 0.01 * is_small + 0.02 * (bm_port == "H") + 0.01 * (bm_port == "M")
+
+    crsp = pd.DataFrame(
+        {
+            "permno": np.tile(permnos, len(dates)),
+            "permco": np.tile(permnos, len(dates)),
+            "jdate": np.repeat(dates, len(permnos)),
+            "mthprc": np.tile(price, len(dates)),
+            "shrout": 100.0,
+            "mthret": np.tile(ret, len(dates)),
+            "sharetype": "NS",
+            "securitytype": "EQTY",
+            "securitysubtype": "COM",
+            "usincflg": "Y",
+            "issuertype": "CORP",
+            "primaryexch": "N",
+            "conditionaltype": "RW",
+            "tradingstatusflg": "A",
+        }
+    )
+    gvkeys = [f"{p:06d}" for p in permnos]
+    ccm = pd.DataFrame(
+        {
+            "gvkey": gvkeys,
+            "permno": permnos.astype(float),
+            "linktype": "LC",
+            "linkprim": "P",
+            "linkdt": pd.Timestamp("1990-01-01"),
+            "linkenddt": pd.NaT,
+        }
+    )
+    fiscal_years = pd.to_datetime(
+        ["1998-12-31", "1999-12-31", "2000-12-31", "2001-12-31"]
+    )
+    me = price * 100.0
+    comp = pd.DataFrame(
+        {
+            "gvkey": np.tile(gvkeys, len(fiscal_years)),
+            "datadate": np.repeat(fiscal_years, len(permnos)),
+            "seq": np.tile(beme * me, len(fiscal_years)),
+            "txditc": 0.0,
+            "pstkrv": 0.0,
+            "pstkl": np.nan,
+            "pstk": np.nan,
+        }
+    )
+    return crsp, comp, ccm
+
+
+def test_calc_Fama_French_factors():
+    crsp, comp, ccm = _synthetic_universe()
+    factors = calc_Fama_French_factors(crsp, comp, ccm)
+
+    # Portfolios are first formed in June 2000 and held from July 2000.
+    assert factors.index.min() == pd.Timestamp("2000-07-31")
+    assert factors.index.max() == pd.Timestamp("2002-12-31")
+    assert len(factors) == 30
+
+    np.testing.assert_allclose(factors["SMB"], 0.01)
+    np.testing.assert_allclose(factors["HML"], 0.02)
+    np.testing.assert_allclose(factors["B/L"], 0.01)
+    np.testing.assert_allclose(factors["S/H"], 0.04)
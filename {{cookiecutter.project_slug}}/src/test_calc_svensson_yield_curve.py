@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from calc_svensson_yield_curve import SvenssonCurve
+
+
+def _params():
+    return pd.DataFrame(
+        {
+            "BETA0": [5.0, 4.0, 3.0],
+            "BETA1": [0.0, -2.0, 1.5],
+            "BETA2": [0.0, 1.0, -3.0],
+            "BETA3": [0.0, 2.0, np.nan],
+            "TAU1": [1.0, 1.5, 2.0],
+            "TAU2": [1.0, 8.0, np.nan],
+        },
+        index=pd.to_datetime(["1975-01-02", "2000-01-03", "2024-12-31"]),
+    )
+
+
+def _zero_loop(row, n):
+    """Zero yield at a single maturity, written out term by term."""
+    x1 = n / row["TAU1"]
+    terms = row["BETA0"] + row["BETA1"] * (1 - np.exp(-x1)) / x1
+    terms += row["BETA2"] * ((1 - np.exp(-x1)) / x1 - np.exp(-x1))
+    if not np.isnan(row["BETA3"]):
+        x2 = n / row["TAU2"]
+        terms += row["BETA3"] * ((1 - np.exp(-x2)) / x2 - np.exp(-x2))
+    return terms
+
+
+def test_zero_matches_formula():
+    params = _params()
+    curve = SvenssonCurve(params)
+    maturities = [0.5, 1, 2, 7.25, 30]
+    zero = curve.zero(maturities)
+    assert zero.shape == (3, 5)
+    for date, row in params.iterrows():
+        expected = [_zero_loop(row, n) for n in maturities]
+        np.testing.assert_allclose(zero.loc[date], expected)
+
+
+def test_short_end_limits():
+    curve = SvenssonCurve(_params())
+    params = _params()
+    instantaneous = params["BETA0"] + params["BETA1"]
+    np.testing.assert_allclose(curve.zero([0]).iloc[:, 0], instantaneous)
+    np.testing.assert_allclose(curve.forward([0]).iloc[:, 0], instantaneous)
+    np.testing.assert_allclose(curve.discount([0]).iloc[:, 0], 1.0)
+
+
+def test_flat_curve():
+    # A flat curve at 5% continuously compounded
+    curve = SvenssonCurve(_params().iloc[:1])
+    maturities = [1, 2.5, 10]
+    np.testing.assert_allclose(curve.zero(maturities), 5.0)
+    np.testing.assert_allclose(curve.forward(maturities), 5.0)
+    np.testing.assert_allclose(
+        curve.discount(maturities).iloc[0], np.exp(-0.05 * np.array(maturities))
+    )
+    # Semiannual bond-equivalent yield of a 5% continuous rate
+    np.testing.assert_allclose(curve.par(maturities), 200 * np.expm1(0.05 / 2))
+
+
+def test_par_bond_prices_at_par():
+    curve = SvenssonCurve(_params())
+    par = curve.par([10]).iloc[:, 0].to_numpy()
+    times = np.arange(0.5, 10.5, 0.5)
+    for i, coupon in enumerate(par):
+        amounts = np.full(len(times), coupon / 2)
+        amounts[-1] += 100
+        prices = curve.price_cashflows(times, amounts)
+        np.testing.assert_allclose(prices[i], 100)
+
+
+def test_price_cashflows_many_bonds():
+    curve = SvenssonCurve(_params())
+    times = np.array([[1.0, 2.0], [0.5, 0.0]])
+    amounts = np.array([[5.0, 105.0], [100.0, 0.0]])
+    prices = curve.price_cashflows(times, amounts)
+    assert prices.shape == (3, 2)
+    discount = curve.discount([0.5, 1.0, 2.0])
+    np.testing.assert_allclose(prices[:, 0], 5 * discount[1.0] + 105 * discount[2.0])
+    np.testing.assert_allclose(prices[:, 1], 100 * discount[0.5])
+
+
+def test_results_are_cached():
+    curve = SvenssonCurve(_params())
+    first = curve.zero_rates([1, 2])
+    assert curve.zero_rates(np.array([1.0, 2.0])) is first
+    assert not first.flags.writeable
+
+    # Frames are copies, so changing one does not change later results
+    zero = curve.zero([1, 2])
+    zero.iloc[0, 0] = 99
+    assert curve.zero([1, 2]).iloc[0, 0] == first[0, 0]
+
+    # The cache is bounded, and cash flow grids are not cached
+    for i in range(2 * curve.cache_size):
+        curve.zero_rates([i + 0.5])
+        curve.price_cashflows([i + 0.5], [100.0])
+    assert len(curve._cache) == curve.cache_size
+    assert curve.zero_rates([1, 2]) is not first
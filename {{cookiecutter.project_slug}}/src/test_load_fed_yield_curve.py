@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+import load_fed_yield_curve
+
+
+def _fake_csv():
+    notes = "".join(f"Note line {i}\n" for i in range(9))
+    header = ["Date", "BETA0", "BETA1"] + [f"SVENY{i:02d}" for i in range(1, 31)]
+    header += [f"SVENF{i:02d}" for i in range(1, 31)]
+    rows = [
+        ["1961-06-14", "3.9", "-0.5"] + ["2.5"] * 30 + ["NA"] * 30,
+        ["2024-12-31", "4.1", "0.2"] + ["4.25"] * 29 + ["NA"] + ["4.0"] * 30,
+    ]
+    lines = [",".join(header)] + [",".join(row) for row in rows]
+    return (notes + "\n".join(lines) + "\n").encode()
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"Last-Modified": "Tue, 31 Dec 2024 15:00:00 GMT"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+
+def test_pull_fed_yield_curve_only_downloads_changes(tmp_path, monkeypatch):
+    requests_made = []
+
+    def fake_get(url, headers, stream, timeout):
+        requests_made.append(headers)
+        if "If-Modified-Since" in headers:
+            return FakeResponse(304)
+        return FakeResponse(200, _fake_csv())
+
+    monkeypatch.setattr(load_fed_yield_curve.requests, "get", fake_get)
+
+    df = load_fed_yield_curve.pull_fed_yield_curve(data_dir=tmp_path)
+    assert list(df.columns) == load_fed_yield_curve.SVENY_COLUMNS
+    assert df.index.name == "Date"
+    assert df.index[0] == pd.Timestamp("1961-06-14")
+    assert (df.dtypes == "float64").all()
+    assert np.isnan(df.loc["2024-12-31", "SVENY30"])
+
+    # The second pull sends If-Modified-Since and reuses the parsed curve
+    df.to_parquet(tmp_path / "fed_yield_curve.parquet")
+    again = load_fed_yield_curve.pull_fed_yield_curve(data_dir=tmp_path)
+    assert requests_made[1]["If-Modified-Since"] == "Tue, 31 Dec 2024 15:00:00 GMT"
+    pd.testing.assert_frame_equal(again, df)
+
+
+def test_load_fed_yield_curve_uses_arrow_sidecar(tmp_path):
+    dates = pd.bdate_range("2020-01-01", periods=50, name="Date")
+    df = pd.DataFrame(
+        np.arange(50 * 30, dtype=float).reshape(50, 30),
+        index=dates,
+        columns=load_fed_yield_curve.SVENY_COLUMNS,
+    )
+    df.iloc[3, 5] = np.nan
+    df.to_parquet(tmp_path / "fed_yield_curve.parquet")
+
+    # data_dir can be a string
+    loaded = load_fed_yield_curve.load_fed_yield_curve(data_dir=str(tmp_path))
+    assert (tmp_path / "fed_yield_curve.arrow").exists()
+    pd.testing.assert_frame_equal(loaded, df, check_freq=False)
+
+    subset = load_fed_yield_curve.load_fed_yield_curve(
+        data_dir=tmp_path,
+        columns=["SVENY10", "SVENY02"],
+        start_date="2020-01-06",
+        end_date="2020-01-31",
+    )
+    expected = df.loc["2020-01-06":"2020-01-31", ["SVENY10", "SVENY02"]]
+    pd.testing.assert_frame_equal(subset, expected, check_freq=False)
+
+    # A newer parquet file replaces the sidecar
+    (df + 1).to_parquet(tmp_path / "fed_yield_curve.parquet")
+    loaded = load_fed_yield_curve.load_fed_yield_curve(data_dir=tmp_path)
+    pd.testing.assert_frame_equal(loaded, df + 1, check_freq=False)
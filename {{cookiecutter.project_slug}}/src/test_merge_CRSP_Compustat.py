@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from merge_CRSP_Compustat import link_CRSP_to_Compustat, merge_CRSP_and_Compustat
+
+
+def _example_data():
+    crsp = pd.DataFrame(
+        {
+            "permno": np.array([1, 1, 1, 2, 2, 3], dtype="int32"),
+            "jdate": pd.to_datetime(
+                [
+                    "2000-06-30",
+                    "2005-06-30",
+                    "2012-06-30",
+                    "2001-06-30",
+                    "2010-06-30",
+                    "2001-06-30",
+                ]
+            ),
+            "mthret": [0.01, 0.02, 0.03, 0.04, 0.05, 0.06],
+        }
+    )
+    ccm = pd.DataFrame(
+        {
+            "gvkey": ["001000", "001001", "002000", "002001"],
+            "permno": [1.0, 1.0, 2.0, 2.0],
+            "linktype": ["LC", "LU", "LC", "LC"],
+            "linkprim": ["P", "P", "P", "C"],
+            "linkdt": pd.to_datetime(
+                ["1990-01-01", "2010-01-01", "1995-01-01", "2008-01-01"]
+            ),
+            # Link for permno 1 is open-ended after 2010. The secondary link
+            # for permno 2 expires before 2010, but the primary one is valid.
+            "linkenddt": pd.to_datetime(["2009-12-31", None, None, "2009-01-01"]),
+        }
+    )
+    comp = pd.DataFrame(
+        {
+            "gvkey": ["001000", "001000", "001001", "002000", "002000"],
+            "datadate": pd.to_datetime(
+                ["1999-12-31", "2004-12-31", "2011-12-31", "2000-12-31", "2001-12-31"]
+            ),
+            "seq": [10.0, 20.0, 30.0, 40.0, 50.0],
+        }
+    )
+    return crsp, comp, ccm
+
+
+def test_link_CRSP_to_Compustat():
+    crsp, _, ccm = _example_data()
+    result = link_CRSP_to_Compustat(crsp, ccm)
+    expected = pd.Series(
+        ["001000", "001000", "001001", "002000", "002000", np.nan], name="gvkey"
+    )
+    pd.testing.assert_series_equal(result["gvkey"], expected)
+
+
+def test_merge_CRSP_and_Compustat():
+    crsp, comp, ccm = _example_data()
+    result = merge_CRSP_and_Compustat(crsp, comp, ccm, min_lag_months=6)
+
+    # Same rows and order as crsp
+    assert len(result) == len(crsp)
+    pd.testing.assert_series_equal(result["mthret"], crsp["mthret"])
+
+    expected_seq = pd.Series([10.0, 20.0, 30.0, 40.0, np.nan, np.nan], name="seq")
+    pd.testing.assert_series_equal(result["seq"], expected_seq)
+
+    # 2001-12-31 is less than 6 months before 2001-06-30, and the 2010 row for
+    # permno 2 is too far from any fiscal year end.
+    assert result.loc[3, "datadate"] == pd.Timestamp("2000-12-31")
+
+
+def test_merge_CRSP_and_Compustat_inner_and_stats():
+    crsp, comp, ccm = _example_data()
+    result, stats = merge_CRSP_and_Compustat(
+        crsp, comp, ccm, how="inner", return_stats=True
+    )
+    assert len(result) == 4
+    assert stats.loc["matched_rows", "link"] == 5
+    assert stats.loc["matched_rows", "fundamentals"] == 4
+    assert stats.loc["intersection", "link"] == 2
@@ -1,11 +1,36 @@
+import numpy as np
 import pandas as pd
+import polars as pl
+import pytest
+from matplotlib import pyplot as plt
 
 from misc_tools import (
+    WeightedQuantileSketch,
+    _period_numbers,
+    aligned_glimpse,
+    calc_check_digit,
+    compare_parquet_vintages,
+    compare_vintages,
+    convert_cusips_from_8_to_9_digit,
+    cusip_check_digit_expr,
+    dataframe_set_difference,
+    freq_counts,
     get_most_recent_quarter_end,
     get_next_quarter_start,
     groupby_weighted_average,
+    groupby_weighted_quantile,
     groupby_weighted_std,
+    leave_one_out_aggregates,
+    leave_one_out_sums,
+    merge_stats,
+    plot_weighted_median_with_distribution_bars,
+    rolling_weighted_stats,
+    validate_cusips,
+    validate_isins,
     weighted_average,
+    weighted_quantile,
+    weighted_quantile_from_parquet,
+    with_lagged_columns,
 )
 
 
@@ -39,6 +64,62 @@ def test_groupby_weighted_average():
     pd.testing.assert_series_equal(result, expected)
 
 
+def test_groupby_weighted_average_many_columns():
+    rng = np.random.default_rng(0)
+    n = 1000
+    df = pd.DataFrame(
+        {
+            "date": rng.integers(0, 20, n),
+            "rate": rng.normal(2, 1, n),
+            "haircut": rng.normal(5, 1, n),
+            "amount": rng.lognormal(0, 1, n),
+        },
+        index=rng.permutation(n) + 100,
+    )
+    df.loc[df.index[:50], "haircut"] = np.nan
+    original = df.copy()
+
+    result = groupby_weighted_average(
+        data_col=["rate", "haircut"], weight_col="amount", by_col="date", data=df
+    )
+    pd.testing.assert_frame_equal(df, original)
+    for col in ["rate", "haircut"]:
+        valid = df[df[col].notna()]
+        expected = (valid[col] * valid["amount"]).groupby(valid["date"]).sum() / (
+            valid["amount"].groupby(valid["date"]).sum()
+        )
+        pd.testing.assert_series_equal(result[col], expected, check_names=False)
+
+    transformed = groupby_weighted_average(
+        data_col=["rate", "haircut"],
+        weight_col="amount",
+        by_col="date",
+        data=df,
+        transform=True,
+    )
+    assert transformed.index.equals(df.index)
+    np.testing.assert_allclose(transformed, result.loc[df["date"]])
+
+    result_pl = groupby_weighted_average(
+        data_col=["rate", "haircut"],
+        weight_col="amount",
+        by_col="date",
+        data=pl.from_pandas(df).lazy(),
+        library="polars",
+    ).collect()
+    np.testing.assert_allclose(result_pl.drop("date").to_numpy(), result.to_numpy())
+    transformed_pl = groupby_weighted_average(
+        data_col="rate",
+        weight_col="amount",
+        by_col="date",
+        data=pl.from_pandas(df),
+        transform=True,
+        new_column_name="avg_rate",
+        library="polars",
+    )
+    np.testing.assert_allclose(transformed_pl["avg_rate"], transformed["rate"])
+
+
 def test_groupby_weighted_std():
     df_nccb = pd.DataFrame(
         {
@@ -69,6 +150,641 @@ def test_groupby_weighted_std():
     pd.testing.assert_series_equal(result, expected)
 
 
+def test_groupby_weighted_std_matches_apply():
+    rng = np.random.default_rng(0)
+    n = 2000
+    df = pd.DataFrame(
+        {
+            "date": rng.integers(0, 50, n),
+            "dealer": rng.choice(["A", "B", "C"], n),
+            "rate": rng.normal(1e4, 1, n),  # large mean, small spread
+            "amount": rng.lognormal(0, 1, n),
+        }
+    )
+
+    def weighted_sd(x, ddof):
+        avg = np.average(x["rate"], weights=x["amount"])
+        numer = np.sum(x["amount"] * (x["rate"] - avg) ** 2)
+        denom = (len(x) - ddof) / len(x) * x["amount"].sum()
+        return np.sqrt(numer / denom)
+
+    for ddof in [0, 1]:
+        expected = df.groupby(["date", "dealer"]).apply(
+            weighted_sd, ddof=ddof, include_groups=False
+        )
+        result = groupby_weighted_std(
+            data_col="rate",
+            weight_col="amount",
+            by_col=["date", "dealer"],
+            data=df,
+            ddof=ddof,
+        )
+        pd.testing.assert_series_equal(result, expected, rtol=1e-6)
+
+        result_pl = groupby_weighted_std(
+            data_col="rate",
+            weight_col="amount",
+            by_col=["date", "dealer"],
+            data=pl.from_pandas(df),
+            ddof=ddof,
+            library="polars",
+        )
+        np.testing.assert_allclose(result_pl["rate"].to_numpy(), expected, rtol=1e-6)
+
+
+def test_groupby_weighted_std_skips_missing_values():
+    df = pd.DataFrame(
+        {
+            "group": [1, 1, 1, 1, 2, 2, 3],
+            "rate": [1.0, np.nan, 3.0, 4.0, 2.0, 5.0, np.nan],
+            "amount": [1.0, 3.0, 1.0, 2.0, 1.0, 1.0, 1.0],
+        }
+    )
+    kwargs = dict(data_col="rate", weight_col="amount", by_col="group")
+    result = groupby_weighted_std(data=df, **kwargs)
+    expected = groupby_weighted_std(data=df.dropna(), **kwargs)
+    pd.testing.assert_series_equal(result.iloc[:2], expected)
+    assert np.isnan(result.loc[3])
+
+    result_pl = groupby_weighted_std(data=pl.from_pandas(df), **kwargs)
+    np.testing.assert_allclose(result_pl["rate"].to_numpy(), result)
+
+    df = _bank_region_panel()
+    kwargs = dict(data_col="loans", weight_col="assets", by_col=["region", "year"])
+    expected = groupby_weighted_std(data=df, **kwargs)
+    result_pl = groupby_weighted_std(data=pl.from_pandas(df), **kwargs)
+    np.testing.assert_allclose(result_pl["loans"].to_numpy(), expected)
+
+
+def test_groupby_weighted_quantile_matches_weighted_quantile():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame(
+        {
+            "date": rng.integers(0, 40, n),
+            "rate": rng.normal(2, 1, n),
+            "volume": rng.integers(1, 100, n).astype(float),
+        }
+    )
+    df.loc[df["date"] == 7, "volume"] = 5.0  # equal weights
+    df.loc[df.index[:5], "rate"] = np.nan
+    quantiles = [0, 0.01, 0.25, 0.5, 0.9, 1]
+
+    expected = (
+        df.dropna()
+        .groupby("date")
+        .apply(
+            lambda x: pd.Series(
+                weighted_quantile(x["rate"], quantiles, sample_weight=x["volume"]),
+                index=quantiles,
+            ),
+            include_groups=False,
+        )
+    )
+    result = groupby_weighted_quantile(
+        data_col="rate",
+        weight_col="volume",
+        by_col="date",
+        data=df,
+        quantiles=quantiles,
+    )
+    pd.testing.assert_frame_equal(result, expected, check_names=False)
+
+    median = groupby_weighted_quantile(
+        data_col="rate", weight_col="volume", by_col="date", data=df
+    )
+    pd.testing.assert_series_equal(median, expected[0.5], check_names=False)
+
+    result_pl = groupby_weighted_quantile(
+        data_col="rate",
+        weight_col="volume",
+        by_col="date",
+        data=pl.from_pandas(df),
+        quantiles=quantiles,
+        library="polars",
+    )
+    np.testing.assert_allclose(
+        result_pl.drop("date").to_numpy(), expected.to_numpy(), rtol=1e-12
+    )
+
+
+def test_weighted_quantile_sketch_is_exact_before_compression():
+    values = np.array([3.0, 1.0, 2.0, 5.0, 4.0])
+    weights = np.array([1.0, 2.0, 1.0, 1.0, 3.0])
+    quantiles = [0, 0.1, 0.5, 0.8, 1]
+    sketch = WeightedQuantileSketch().update(values, sample_weight=weights)
+    np.testing.assert_allclose(
+        sketch.quantile(quantiles),
+        weighted_quantile(values, quantiles, sample_weight=weights),
+    )
+
+
+def test_weighted_quantile_sketch_error_bound():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(0, 2, 400_000)
+    weights = rng.lognormal(0, 1, 400_000)
+
+    # Four partitions, each streamed in chunks, then merged
+    sketches = []
+    for part in np.array_split(np.arange(len(values)), 4):
+        sketch = WeightedQuantileSketch(compression=200)
+        for chunk in np.array_split(part, 20):
+            sketch.update(values[chunk], sample_weight=weights[chunk])
+        sketches.append(sketch)
+    sketch = sketches[0]
+    for other in sketches[1:]:
+        sketch.merge(other)
+    assert len(sketch.means) <= 110
+    assert sketch.min == values.min() and sketch.max == values.max()
+
+    # Weighted rank of the estimates
+    order = np.argsort(values)
+    cdf = np.cumsum(weights[order]) / weights.sum()
+    quantiles = np.array([0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999])
+    ranks = np.interp(sketch.quantile(quantiles), values[order], cdf)
+    bound = np.pi * np.sqrt(quantiles * (1 - quantiles)) / 200
+    assert (np.abs(ranks - quantiles) <= bound).all()
+
+
+def test_weighted_quantile_from_parquet(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"rate": rng.normal(size=10_000), "volume": rng.random(10_000)})
+    df.to_parquet(tmp_path / "trades.parquet", row_group_size=1000)
+    median, sketch = weighted_quantile_from_parquet(
+        tmp_path / "trades.parquet", "rate", 0.5, weight_col="volume", batch_size=1000
+    )
+    assert sketch.total_weight == pytest.approx(df["volume"].sum())
+    exact = weighted_quantile(df["rate"], 0.5, sample_weight=df["volume"])
+    assert median == pytest.approx(exact, abs=0.02)
+
+
+def test_rolling_weighted_stats_matches_recomputing_each_window():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame(
+        {
+            "date": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(rng.integers(0, 30, n), unit="D"),
+            "rate": rng.normal(5, 0.1, n),
+            "volume": rng.lognormal(0, 1, n),
+        }
+    )
+    df.loc[df.index[:10], "rate"] = np.nan
+    quantiles = [0, 0.05, 0.5, 0.95, 1]
+    dates = np.sort(df["date"].unique())
+
+    for window, expanding in [(1, False), (5, False), (1, True)]:
+        result = rolling_weighted_stats(
+            data=df,
+            data_col="rate",
+            weight_col="volume",
+            window=window,
+            expanding=expanding,
+            quantiles=quantiles,
+        )
+        assert len(result) == len(dates)
+        for i, date in enumerate(dates):
+            start = dates[0] if expanding else dates[max(0, i - window + 1)]
+            x = df[df["date"].between(start, date)].dropna()
+            expected_std = groupby_weighted_std(
+                data_col="rate",
+                weight_col="volume",
+                by_col="key",
+                data=x.assign(key=0),
+            ).iloc[0]
+            row = result.loc[date]
+            assert row["mean"] == pytest.approx(
+                np.average(x["rate"], weights=x["volume"]), rel=1e-12
+            )
+            assert row["std"] == pytest.approx(expected_std, rel=1e-8)
+            np.testing.assert_allclose(
+                row[quantiles].to_numpy(dtype=float),
+                weighted_quantile(x["rate"], quantiles, sample_weight=x["volume"]),
+                rtol=1e-12,
+            )
+
+    result = rolling_weighted_stats(
+        data=df, data_col="rate", weight_col="volume", window=5, min_periods=5
+    )
+    assert result.iloc[:4].isna().all().all()
+    assert result.iloc[4:].notna().all().all()
+
+    # Repeated quantiles get one column each, as in groupby_weighted_quantile
+    kwargs = dict(data=df, data_col="rate", weight_col="volume", window=5)
+    result = rolling_weighted_stats(quantiles=[0.5, 0.5, 0.9], **kwargs)
+    assert result.columns.tolist() == ["mean", "std", 0.5, 0.5, 0.9]
+    pd.testing.assert_frame_equal(
+        result.iloc[:, 2:4],
+        rolling_weighted_stats(quantiles=[0.5], **kwargs)[[0.5, 0.5]],
+    )
+    plot_weighted_median_with_distribution_bars(
+        data=df,
+        variable_name="rate",
+        weight_col="volume",
+        percentiles=[0.5, 0.9],
+        rolling=True,
+        rolling_window=5,
+        rolling_pooled=True,
+        add_quarter_lines=False,
+    )
+    plt.close("all")
+
+
+def _check_digit_loop(cusip):
+    """Check digit computed one character at a time, as in python-stdnum."""
+    alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ*@#"
+    digits = "".join(
+        str((1, 2)[i % 2] * alphabet.index(c)) for i, c in enumerate(cusip)
+    )
+    return str((10 - sum(int(d) for d in digits)) % 10)
+
+
+def _isin_check_digit_loop(payload):
+    digits = "".join(str(int(c, 36)) for c in payload)
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        d = int(d) * (2 if i % 2 == 0 else 1)
+        total += d // 10 + d % 10
+    return str((10 - total % 10) % 10)
+
+
+def test_cusip_check_digits():
+    rng = np.random.default_rng(0)
+    alphabet = np.array(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ*@#"))
+    cusips = ["".join(row) for row in rng.choice(alphabet, (2000, 8))]
+    expected = [_check_digit_loop(c) for c in cusips]
+    assert calc_check_digit(cusips).tolist() == expected
+
+    series = pd.Series(cusips[:3] + [None], index=[10, 11, 12, 13])
+    converted = convert_cusips_from_8_to_9_digit(series)
+    assert converted.index.tolist() == [10, 11, 12, 13]
+    assert converted.iloc[:3].tolist() == [c + d for c, d in zip(cusips[:3], expected)]
+    assert pd.isna(converted.iloc[3])
+
+    result_pl = pl.DataFrame({"cusip": cusips}).select(cusip_check_digit_expr("cusip"))
+    assert result_pl.columns == ["cusip_check_digit"]
+    assert result_pl.to_series().to_list() == expected
+    invalid = pl.DataFrame({"cusip": ["0378331", "0378331a", "", None, cusips[0]]})
+    result_pl = invalid.with_columns(cusip_check_digit_expr(pl.col("cusip")))
+    assert result_pl["cusip_check_digit"].to_list() == [None] * 4 + expected[:1]
+
+    cusips9 = [c + d for c, d in zip(cusips, expected)]
+    assert validate_cusips(cusips9).all()
+    wrong = [c[:8] + str((int(c[8]) + 1) % 10) for c in cusips9]
+    assert not validate_cusips(wrong).any()
+
+    with pytest.raises(ValueError):
+        calc_check_digit(["0378331"])
+    with pytest.raises(ValueError):
+        calc_check_digit(["0378331a"])
+
+
+def test_validate_isins():
+    rng = np.random.default_rng(0)
+    alphanumeric = np.array(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    countries = rng.choice(["US", "GB", "DE", "JP", "XS"], 1000)
+    payloads = [
+        country + "".join(row)
+        for country, row in zip(countries, rng.choice(alphanumeric, (1000, 9)))
+    ]
+    isins = [p + _isin_check_digit_loop(p) for p in payloads]
+    assert validate_isins(isins).all()
+    wrong = [i[:11] + str((int(i[11]) + 3) % 10) for i in isins]
+    assert not validate_isins(wrong).any()
+    assert not validate_isins(["1S0378331005", "US03783310é5", None]).any()
+
+
+def test_identifier_helpers_accept_empty_batches():
+    assert validate_cusips([]).shape == (0,)
+    assert validate_isins([]).shape == (0,)
+    assert calc_check_digit([]).shape == (0,)
+    assert convert_cusips_from_8_to_9_digit(pd.Series([], dtype=object)).empty
+
+
+@pytest.mark.parametrize("freq", ["D", "B", "W", "W-FRI", "MS", "ME", "QS", "QE", "YE"])
+def test_period_numbers_match_resample(freq):
+    rng = np.random.default_rng(0)
+    dates = pd.Timestamp("2001-01-01") + pd.to_timedelta(
+        np.sort(rng.integers(0, 3 * 365, 200)), unit="D"
+    )
+    resampler = pd.Series(np.arange(len(dates)), index=dates).resample(freq)
+    labels = resampler.last().index
+    expected = np.empty(len(dates), dtype=int)
+    for label, rows in resampler.indices.items():
+        expected[rows] = labels.get_loc(label)
+    np.testing.assert_array_equal(_period_numbers(dates, freq), expected)
+
+
+def _lag_by_pivoting(df, col, lag, freq):
+    """Lags through a (dates x ids) table, as with_lagged_columns used to."""
+    wide = df.pivot(index="date", columns="id", values=col).resample(freq).last()
+    lagged = wide.shift(lag).stack(future_stack=True).rename("lagged")
+    return df.join(lagged, on=["date", "id"])["lagged"]
+
+
+def test_with_lagged_columns_matches_pivoting():
+    rng = np.random.default_rng(0)
+    months = pd.date_range("2000-01-01", periods=60, freq="MS")
+    df = pd.DataFrame(
+        {
+            "id": np.repeat([3, 1, 2, 7], len(months)),
+            "date": np.tile(months, 4),
+            "ret": rng.normal(size=4 * len(months)),
+            "me": rng.integers(1, 100, 4 * len(months)),
+        }
+    )
+    # Gaps in the panel, and rows out of order
+    df = df.sample(frac=0.8, random_state=0)
+
+    result = with_lagged_columns(
+        df, column_to_lag=["ret", "me"], id_column="id", lags=[1, 3, -1], freq="MS"
+    )
+    assert result.index.equals(df.index)
+    for col in ["ret", "me"]:
+        for lag in [1, 3, -1]:
+            expected = _lag_by_pivoting(df, col, lag, "MS")
+            np.testing.assert_allclose(result[f"L{lag}_{col}"], expected)
+
+    # Month-end dates are binned into months like resample does
+    month_end = df.assign(date=df["date"] + pd.offsets.MonthEnd(0))
+    result_month_end = with_lagged_columns(
+        month_end, column_to_lag="ret", id_column="id", freq="MS"
+    )
+    np.testing.assert_allclose(result_month_end["L1_ret"], result["L1_ret"])
+
+    result_polars = with_lagged_columns(
+        pl.from_pandas(df),
+        column_to_lag=["ret", "me"],
+        id_column="id",
+        lags=[1, 3, -1],
+        freq="MS",
+        library="polars",
+    )
+    pd.testing.assert_frame_equal(
+        result_polars.to_pandas(), result.reset_index(drop=True), check_dtype=False
+    )
+
+
+def _bank_region_panel():
+    rng = np.random.default_rng(0)
+    n = 2000
+    df = pd.DataFrame(
+        {
+            "region": rng.integers(0, 20, n),
+            "year": rng.integers(2000, 2005, n),
+            "bank": rng.integers(0, 30, n),
+            "loans": rng.lognormal(size=n),
+            "deposits": rng.integers(0, 100, n),
+            "assets": rng.lognormal(size=n),
+        }
+    )
+    df.loc[rng.random(n) < 0.05, "loans"] = np.nan
+    return df
+
+
+def test_leave_one_out_aggregates_match_lambda_transforms():
+    df = _bank_region_panel()
+    by = ["region", "year"]
+    g = df.groupby(by)
+
+    result = leave_one_out_sums(df, groupby=by, summed_col="deposits")
+    expected = g["deposits"].transform(lambda x: x.sum() - x)
+    pd.testing.assert_series_equal(result, expected)
+
+    sums = leave_one_out_aggregates(df, ["loans", "deposits"], by, stat="sum")
+    counts = leave_one_out_aggregates(df, ["loans", "deposits"], by, stat="count")
+    means = leave_one_out_aggregates(df, ["loans", "deposits"], by, stat="mean")
+    for col in ["loans", "deposits"]:
+        expected_sum = g[col].transform(lambda x: x.sum() - x.fillna(0))
+        expected_count = g[col].transform(lambda x: x.count() - x.notna())
+        np.testing.assert_allclose(sums[col], expected_sum)
+        np.testing.assert_array_equal(counts[col], expected_count)
+        np.testing.assert_allclose(means[col], expected_sum / expected_count)
+
+    weighted = leave_one_out_aggregates(
+        df, "loans", by, stat="mean", weight_col="assets"
+    )
+    products = (df["loans"] * df["assets"]).fillna(0)
+    weights = df["assets"].where(df["loans"].notna(), 0)
+    expected = (products.groupby([df[c] for c in by]).transform("sum") - products) / (
+        weights.groupby([df[c] for c in by]).transform("sum") - weights
+    )
+    np.testing.assert_allclose(weighted, expected)
+
+
+def test_leave_one_group_out():
+    df = _bank_region_panel()
+    result = leave_one_out_aggregates(
+        df, "loans", "region", stat="mean", leave_out_col="bank"
+    )
+    for i in [0, 17, 1234]:
+        row = df.iloc[i]
+        others = df[(df["region"] == row["region"]) & (df["bank"] != row["bank"])]
+        assert np.isclose(result.iloc[i], others["loans"].mean())
+
+
+def _with_missing_keys_and_weights(df):
+    rng = np.random.default_rng(1)
+    df = df.astype({"region": float, "bank": float})
+    for col in ["region", "bank", "assets"]:
+        df.loc[rng.random(len(df)) < 0.05, col] = np.nan
+    # pl.from_pandas turns NaN into null, so keep the missing weights as NaN
+    df_pl = pl.from_pandas(df).with_columns(pl.col("assets").fill_null(np.nan))
+    return df, df_pl
+
+
+@pytest.mark.parametrize("missing", [False, True])
+@pytest.mark.parametrize("weight_col", ["assets", None])
+@pytest.mark.parametrize("stat", ["sum", "mean", "count"])
+def test_leave_one_out_aggregates_polars(stat, weight_col, missing):
+    df = _bank_region_panel()
+    df_pl = pl.from_pandas(df)
+    if missing:
+        df, df_pl = _with_missing_keys_and_weights(df)
+    kwargs = dict(
+        columns=["loans", "deposits"],
+        groupby=["region", "year"],
+        stat=stat,
+        weight_col=weight_col,
+        leave_out_col="bank",
+    )
+    result = leave_one_out_aggregates(df_pl, library="polars", **kwargs)
+    expected = leave_one_out_aggregates(df, **kwargs)
+    pd.testing.assert_frame_equal(result.to_pandas(), expected)
+
+
+def test_grouped_helpers_polars_skip_missing_keys_and_weights():
+    df, df_pl = _with_missing_keys_and_weights(_bank_region_panel())
+    kwargs = dict(data_col="loans", weight_col="assets", by_col="region")
+
+    expected = groupby_weighted_average(data=df, **kwargs)
+    result = groupby_weighted_average(data=df_pl, **kwargs)
+    assert result["region"].null_count() == 0
+    np.testing.assert_allclose(result["region"], expected.index)
+    np.testing.assert_allclose(result["loans"], expected)
+
+    expected = groupby_weighted_average(data=df, transform=True, **kwargs)
+    result = groupby_weighted_average(data=df_pl, transform=True, **kwargs)
+    np.testing.assert_allclose(result.to_series().to_numpy(), expected)
+
+    expected = groupby_weighted_std(data=df, **kwargs)
+    result = groupby_weighted_std(data=df_pl, **kwargs)
+    np.testing.assert_allclose(result["region"], expected.index)
+    np.testing.assert_allclose(result["loans"], expected)
+
+    quantiles = [0.25, 0.5, 0.75]
+    expected = groupby_weighted_quantile(data=df, quantiles=quantiles, **kwargs)
+    result = groupby_weighted_quantile(data=df_pl, quantiles=quantiles, **kwargs)
+    np.testing.assert_allclose(result["region"], expected.index)
+    np.testing.assert_allclose(result.drop("region").to_numpy(), expected)
+
+
+def test_helpers_accept_pandas_and_polars(capsys):
+    df = _bank_region_panel()
+    df_pl = pl.from_pandas(df)
+    lazy = df_pl.lazy()
+
+    kwargs = dict(data_col="loans", weight_col="assets", by_col="region")
+    expected = groupby_weighted_average(data=df, **kwargs)
+    result = groupby_weighted_average(data=lazy, **kwargs)
+    assert isinstance(result, pl.LazyFrame)
+    np.testing.assert_allclose(result.collect()["loans"], expected)
+    kwargs["data_col"] = "deposits"
+    result = groupby_weighted_std(data=df_pl, **kwargs)
+    expected = groupby_weighted_std(data=df, **kwargs)
+    np.testing.assert_allclose(result["deposits"], expected)
+
+    expected = freq_counts(df, col="bank")
+    result = freq_counts(lazy, col="bank").collect().to_pandas()
+    assert result.columns.tolist() == ["bank", "count", "freq", "cum_freq"]
+    counts = result.set_index("bank")["count"]
+    pd.testing.assert_series_equal(
+        counts.sort_index(),
+        expected.set_index("bank")["count"].sort_index(),
+        check_dtype=False,
+    )
+    np.testing.assert_allclose(result["cum_freq"].iloc[-1], 100)
+
+    left, right = df.iloc[:1500], df.iloc[1000:]
+    expected = merge_stats(left, right, on=["region", "bank"])
+    result = merge_stats(
+        pl.from_pandas(left).lazy(), pl.from_pandas(right), on=["region", "bank"]
+    )
+    pd.testing.assert_series_equal(result, expected)
+
+    expected = dataframe_set_difference(left, right, show="numbers")
+    result = dataframe_set_difference(
+        pl.from_pandas(left), pl.from_pandas(right).lazy(), show="numbers"
+    )
+    assert result == expected
+
+    assert weighted_average("deposits", "assets", df_pl) == pytest.approx(
+        weighted_average("deposits", "assets", df)
+    )
+    # Missing values are skipped with their weights on both backends
+    expected = np.average(
+        df["loans"].dropna(), weights=df["assets"][df["loans"].notna()]
+    )
+    assert weighted_average("loans", "assets", df) == pytest.approx(expected)
+    assert weighted_average("loans", "assets", df_pl) == pytest.approx(expected)
+    small = pd.DataFrame({"x": [1, None, 3], "w": [1, 3, 1]})
+    assert weighted_average("x", "w", small) == 2.0
+    assert weighted_average("x", "w", pl.from_pandas(small)) == 2.0
+
+    dated = df.assign(
+        date=pd.Timestamp("2024-01-01") + pd.to_timedelta(df["year"], "D")
+    )
+    kwargs = dict(data_col="deposits", weight_col="assets", window=2)
+    expected = rolling_weighted_stats(data=dated, **kwargs)
+    result = rolling_weighted_stats(data=pl.from_pandas(dated).lazy(), **kwargs)
+    assert result.columns == ["date", "mean", "std", "0.5"]
+    np.testing.assert_allclose(result["0.5"], expected[0.5])
+
+    aligned_glimpse(df.head(3))
+    pandas_lines = capsys.readouterr().out.splitlines()
+    aligned_glimpse(lazy)
+    polars_lines = capsys.readouterr().out.splitlines()
+    assert len(pandas_lines) == len(polars_lines) == len(df.columns)
+
+
+def test_dataframe_set_difference_rows():
+    df = _bank_region_panel()
+    left = df.iloc[:1500].set_axis(np.arange(1500) * 2)
+    right = df.iloc[1000:].sample(frac=0.5, random_state=0)
+    in_right = set(right.fillna(-1).itertuples(index=False))
+    expected = [
+        i
+        for i, row in enumerate(left.fillna(-1).itertuples(index=False))
+        if row not in in_right
+    ]
+
+    row_numbers, rows = dataframe_set_difference(left, right)
+    assert row_numbers == expected
+    pd.testing.assert_frame_equal(rows, left.iloc[expected])
+
+    row_numbers, rows = dataframe_set_difference(
+        pl.from_pandas(left).lazy(), pl.from_pandas(right)
+    )
+    assert row_numbers == expected
+    pd.testing.assert_frame_equal(
+        rows.to_pandas(), left.iloc[expected].reset_index(drop=True)
+    )
+
+
+def _vintages():
+    old = _bank_region_panel().assign(id=np.arange(2000))
+    rng = np.random.default_rng(1)
+    new = old.drop(index=rng.choice(2000, 100, replace=False))
+    changed = rng.choice(new.index, 50, replace=False)
+    new.loc[changed, "deposits"] += 1
+    added = old.iloc[:30].assign(id=np.arange(5000, 5030))
+    new = pd.concat([new, added]).sample(frac=1, random_state=0)
+    return old, new.reset_index(drop=True)
+
+
+def test_compare_vintages():
+    old, new = _vintages()
+    merged = old.merge(new, on="id", how="outer", indicator=True)
+    both = merged[merged["_merge"] == "both"]
+    expected = {
+        "added": merged.loc[merged["_merge"] == "right_only", "id"],
+        "removed": merged.loc[merged["_merge"] == "left_only", "id"],
+        "changed": both.loc[both["deposits_x"] != both["deposits_y"], "id"],
+    }
+    expected = {name: sorted(ids) for name, ids in expected.items()}
+    assert len(expected["changed"]) == 50
+
+    def check(diff):
+        for name in ["added", "removed", "changed"]:
+            assert sorted(diff[name]["id"].to_list()) == expected[name]
+        assert diff["changed_before"]["id"].to_list() == diff["changed"]["id"].to_list()
+        before = diff["changed_before"]["deposits"].to_numpy()
+        np.testing.assert_array_equal(
+            diff["changed"]["deposits"].to_numpy(), before + 1
+        )
+
+    diff = compare_vintages(old, new, key="id")
+    check(diff)
+    pd.testing.assert_frame_equal(diff["added"], new[new["id"] >= 5000])
+    check(compare_vintages(pl.from_pandas(old).lazy(), pl.from_pandas(new), "id"))
+    unchanged = compare_vintages(old, new, key="id", columns=["loans", "assets"])
+    assert len(unchanged["changed"]) == 0
+
+
+def test_compare_parquet_vintages(tmp_path):
+    old, new = _vintages()
+    old.to_parquet(tmp_path / "old.parquet")
+    new.to_parquet(tmp_path / "new.parquet")
+    diff = compare_parquet_vintages(
+        tmp_path / "old.parquet", tmp_path / "new.parquet", ["id"], batch_size=128
+    )
+    expected = compare_vintages(pl.from_pandas(old), pl.from_pandas(new), "id")
+    for name, frame in expected.items():
+        assert diff[name].columns == frame.columns
+        assert diff[name].sort("id").equals(frame.sort("id"))
+    assert diff["changed_before"]["id"].equals(diff["changed"]["id"])
+
+
 def test_get_most_recent_quarter_end():
     d = pd.to_datetime("2019-10-21")
     result = get_most_recent_quarter_end(d)
@@ -0,0 +1,131 @@
+import pandas as pd
+
+import fake_blp
+from pull_bloomberg import (
+    bdh_batched,
+    load_intraday_bars,
+    pull_bbg_data,
+    pull_intraday_bars,
+    stitch_continuous_futures,
+)
+
+
+def test_bdh_batched_uses_one_request_and_caches_years(tmp_path):
+    fake_blp.requests.clear()
+    tickers, fields = ["SPX Index", "ES1 Index"], ["px_last", "px_volume"]
+    df = bdh_batched(
+        tickers, fields, "2018-06-01", "2020-12-31", blp=fake_blp, cache_dir=tmp_path
+    )
+    assert len(fake_blp.requests) == 1
+    assert fake_blp.requests[0][1:3] == (tickers, fields)
+    assert df.index.min() == pd.Timestamp("2018-06-01")
+    assert df.index.max() == pd.Timestamp("2020-12-31")
+    assert list(df.columns) == [(t, f) for t in tickers for f in fields]
+    assert len(list(tmp_path.glob("*.parquet"))) == 3
+
+    # Completed years are read from the cache
+    again = bdh_batched(
+        tickers, fields, "2018-06-01", "2020-12-31", blp=fake_blp, cache_dir=tmp_path
+    )
+    assert len(fake_blp.requests) == 1
+    pd.testing.assert_frame_equal(again, df, check_freq=False)
+
+    # Only the years missing from the cache are requested
+    next(tmp_path.glob("*_20190101_*.parquet")).unlink()
+    again = bdh_batched(
+        tickers, fields, "2018-06-01", "2020-12-31", blp=fake_blp, cache_dir=tmp_path
+    )
+    assert len(fake_blp.requests) == 2
+    assert fake_blp.requests[1][3:] == (
+        pd.Timestamp("2019-01-01"),
+        pd.Timestamp("2019-12-31"),
+    )
+    pd.testing.assert_frame_equal(again, df, check_freq=False)
+
+
+def test_stitch_continuous_futures():
+    index = pd.date_range("2000-01-03", periods=4, freq="D")
+    prices = pd.DataFrame(
+        {"OLD": [10.0, 11.0, 12.0, 13.0], "NEW": [20.0, 22.0, 24.0, 26.0]},
+        index=index,
+    )
+    schedule = [("OLD", "2000-01-01"), ("NEW", "2000-01-05")]
+
+    raw = stitch_continuous_futures(prices, schedule)
+    assert raw.tolist() == [10.0, 11.0, 24.0, 26.0]
+
+    ratio = stitch_continuous_futures(prices, schedule, adjust="ratio")
+    assert ratio.tolist() == [20.0, 22.0, 24.0, 26.0]
+
+    difference = stitch_continuous_futures(prices, schedule, adjust="difference")
+    assert difference.tolist() == [21.0, 22.0, 24.0, 26.0]
+
+
+def test_pull_bbg_data(tmp_path):
+    fake_blp.requests.clear()
+    df = pull_bbg_data("1997-01-01", "1998-12-31", blp=fake_blp, cache_dir=tmp_path)
+    # One request for the index and one for the futures, with only the
+    # fields each of them needs
+    assert [r[1:3] for r in fake_blp.requests] == [
+        (["SPX Index"], ["EQY_DVD_YLD_12m", "px_last"]),
+        (["SP1 Index", "ES1 Index"], ["px_last"]),
+    ]
+    assert list(df.columns) == ["dividend yield", "index", "futures"]
+    assert df["futures"].notna().all()
+    assert df.index.name == "Date"
+
+
+def test_pull_intraday_bars_resumes(tmp_path):
+    fake_blp.requests.clear()
+    tickers = ["ES1 Index", "SPX Index"]
+    # 2024-01-01 is a holiday without data
+    n_bars = pull_intraday_bars(
+        tickers, "2024-01-01", "2024-01-05", interval=5, blp=fake_blp, data_dir=tmp_path
+    )
+    assert len(fake_blp.requests) == 10
+    assert n_bars == 2 * 4 * 79
+
+    # Simulate an interrupted pull by removing one day of one ticker. The
+    # holiday is requested again, since an empty response can be an error.
+    partition = tmp_path / "bloomberg_intraday" / "date=2024-01-03"
+    (partition / "SPX_Index.parquet").unlink()
+    n_bars = pull_intraday_bars(
+        tickers, "2024-01-01", "2024-01-05", interval=5, blp=fake_blp, data_dir=tmp_path
+    )
+    assert len(fake_blp.requests) == 13
+    assert n_bars == 79
+
+    # After three empty responses, the holiday is not requested any more
+    for _ in range(2):
+        pull_intraday_bars(
+            tickers, "2024-01-01", "2024-01-05", blp=fake_blp, data_dir=tmp_path
+        )
+    assert len(fake_blp.requests) == 15
+
+    bars = load_intraday_bars(
+        ["SPX Index"], "2024-01-02", "2024-01-03", data_dir=tmp_path
+    )
+    assert len(bars) == 2 * 79
+    assert bars["time"].is_monotonic_increasing
+    assert list(bars.columns[:2]) == ["ticker", "time"]
+
+    volume = load_intraday_bars(
+        ["SPX Index"], "2024-01-02", "2024-01-03", columns=["volume"], data_dir=tmp_path
+    )
+    assert volume.columns.tolist() == ["volume"]
+    assert volume["volume"].tolist() == bars["volume"].tolist()
+
+
+def test_pull_intraday_bars_skips_unfinished_days(tmp_path):
+    fake_blp.requests.clear()
+    today = pd.Timestamp.today().normalize()
+    start = today - pd.offsets.BDay(2)
+    pull_intraday_bars(
+        ["ES1 Index"],
+        start,
+        today + pd.Timedelta(days=10),
+        blp=fake_blp,
+        data_dir=tmp_path,
+    )
+    days = [pd.Timestamp(r[3]) for r in fake_blp.requests]
+    assert days == list(pd.bdate_range(start, today - pd.Timedelta(days=1)))
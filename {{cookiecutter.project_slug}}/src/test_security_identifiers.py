@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from misc_tools import convert_cusips_from_8_to_9_digit, validate_isins
+from security_identifiers import (
+    CusipCrosswalk,
+    build_cusip_crosswalk,
+    cusip_to_isin,
+    isin_to_cusip,
+    sedol_to_isin,
+    to_cusip8,
+)
+
+
+def test_cusip_isin_round_trip():
+    rng = np.random.default_rng(0)
+    alphabet = np.array(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    cusip8 = ["".join(row) for row in alphabet[rng.integers(0, 36, (1000, 8))]]
+    cusip9 = convert_cusips_from_8_to_9_digit(cusip8).tolist()
+
+    isins = cusip_to_isin(cusip8)
+    assert validate_isins(isins).all()
+    assert (cusip_to_isin(cusip9) == isins).all()
+    assert isin_to_cusip(isins).tolist() == cusip9
+    assert to_cusip8(isins).tolist() == cusip8
+    assert to_cusip8(cusip9).tolist() == cusip8
+
+
+def test_invalid_identifiers_are_missing():
+    assert cusip_to_isin(["037833101", "0378331", None]).tolist() == [None] * 3
+    assert isin_to_cusip(["CA0378331000", "US037833100"]).tolist() == [None] * 2
+    assert to_cusip8(["03783310!", None, "US0378331006"]).tolist() == [None] * 3
+    assert sedol_to_isin(["B0YBKJ7", "A0YBKJ7"]).tolist() == ["GB00B0YBKJ77", None]
+
+
+def _names():
+    return pd.DataFrame(
+        {
+            "permno": [1, 1, 1, 2, 3, 4],
+            "permco": [10, 10, 10, 20, 30, 40],
+            "namedt": pd.to_datetime(
+                [
+                    "1990-01-01",
+                    "1995-01-01",
+                    "2000-01-01",
+                    "2005-01-01",
+                    "1990-01-01",
+                    "2010-01-01",
+                ]
+            ),
+            "nameendt": pd.to_datetime(
+                [
+                    "1994-12-31",
+                    "1999-12-31",
+                    "2002-12-31",
+                    None,
+                    "1999-12-31",
+                    "2020-12-31",
+                ]
+            ),
+            # Permno 1 changes exchange in 1995 (same CUSIP) and CUSIP in 2000.
+            # Its first CUSIP is reused by permno 2 from 2005.
+            "ncusip": [
+                "11111111",
+                "11111111",
+                "22222222",
+                "11111111",
+                "33333333",
+                None,
+            ],
+            "cusip": ["22222222"] * 3 + ["11111111", "33333333", "44444444"],
+        }
+    )
+
+
+def test_build_cusip_crosswalk():
+    crosswalk = build_cusip_crosswalk(_names())
+    assert crosswalk["cusip8"].tolist() == [
+        "11111111",
+        "11111111",
+        "22222222",
+        "33333333",
+        "44444444",
+    ]
+    assert crosswalk["permno"].tolist() == [1, 2, 1, 3, 4]
+    assert crosswalk["namedt"].iloc[0] == pd.Timestamp("1990-01-01")
+    assert crosswalk["nameendt"].iloc[0] == pd.Timestamp("1999-12-31")
+    assert crosswalk["nameendt"].iloc[1] > pd.Timestamp("2200-01-01")
+
+
+def test_crosswalk_permnos_match_lookup():
+    xwalk = CusipCrosswalk(build_cusip_crosswalk(_names()))
+    rng = np.random.default_rng(0)
+    n = 500
+    identifiers = rng.choice(
+        ["11111111", "111111118", "22222222", "33333333", "44444444", "99999999"], n
+    ).astype(object)
+    identifiers[:5] = None
+    dates = pd.Series(
+        pd.to_datetime("1985-01-01")
+        + pd.to_timedelta(rng.integers(0, 40 * 365, n), unit="D")
+    )
+    dates.iloc[5:10] = pd.NaT
+
+    result = xwalk.permnos(identifiers, dates)
+    expected = [
+        xwalk.lookup(i, d) if i is not None and d is not pd.NaT else None
+        for i, d in zip(identifiers, dates)
+    ]
+    expected = pd.array(expected, dtype="Int64")
+    pd.testing.assert_extension_array_equal(result, expected)
+    assert (~result.isna()).sum() > 100
+    assert xwalk.lookup("11111111", "1997-06-30") == 1
+    assert xwalk.lookup("11111111", "2001-06-30") is None
+    assert xwalk.lookup("11111111", "2021-06-30") == 2
+    assert xwalk.lookup("11111111") == 2
+
+
+def test_add_permno():
+    xwalk = CusipCrosswalk(build_cusip_crosswalk(_names()))
+    holdings = pd.DataFrame(
+        {
+            "cusip": ["US1111111183", "222222226", "333333334"],
+            "date": pd.to_datetime(["1992-03-31", "2001-03-31", "2005-03-31"]),
+        },
+        index=[10, 20, 30],
+    )
+    result = xwalk.add_permno(holdings)
+    assert result.index.tolist() == [10, 20, 30]
+    expected = pd.array([1, 1, None], dtype="Int64")
+    pd.testing.assert_extension_array_equal(result["permno"].array, expected)
+    assert "permno" not in holdings
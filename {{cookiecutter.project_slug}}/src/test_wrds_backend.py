@@ -0,0 +1,310 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+import wrds_backend
+
+
+def _synthetic_tables():
+    dates = pd.date_range("2000-01-31", "2000-12-31", freq="ME")
+    permnos = [10001, 10002]
+    msf = pd.DataFrame(
+        {
+            "date": np.tile(dates, len(permnos)),
+            "permno": np.repeat(permnos, len(dates)),
+            "permco": np.repeat([1, 2], len(dates)),
+            "ret": 0.01,
+            "retx": 0.01,
+            "prc": -20.0,
+            "altprc": 20.0,
+            "vol": 100.0,
+            "shrout": 1000.0,
+            "cfacshr": 1.0,
+            "cfacpr": 1.0,
+        }
+    )
+    msenames = pd.DataFrame(
+        {
+            "permno": permnos,
+            "namedt": pd.to_datetime(["1990-01-01", "1990-01-01"]),
+            "nameendt": pd.to_datetime(["2024-12-31", "2024-12-31"]),
+            "shrcd": [10, 12],
+            "exchcd": [1, 3],
+            "comnam": ["FIRST CORP", "SECOND CORP"],
+            "shrcls": [None, None],
+            "naics": ["3341", "5221"],
+            "siccd": [3570, 6020],
+        }
+    )
+    msedelist = pd.DataFrame(
+        {
+            "permno": [10001],
+            "dlstdt": pd.to_datetime(["2000-12-29"]),
+            "dlret": [np.nan],
+            "dlretx": [np.nan],
+            "dlstcd": [552],
+        }
+    )
+    days = pd.bdate_range("2000-12-01", "2001-01-31")
+    dsf = pd.DataFrame(
+        {
+            "date": np.tile(days, 3),
+            "permno": np.repeat([10001, 10002, 10003], len(days)),
+            "permco": np.repeat([1, 2, 3], len(days)),
+            "ret": 0.001,
+            "retx": 0.001,
+            "prc": 20.0,
+            "vol": 100.0,
+            "shrout": 1000.0,
+            "cfacshr": 1.0,
+            "cfacpr": 1.0,
+        }
+    )
+    dsenames = pd.DataFrame(
+        {
+            "permno": [10001, 10002, 10003],
+            "namedt": pd.to_datetime(["1990-01-01"] * 3),
+            "nameendt": pd.to_datetime(["2024-12-31"] * 3),
+            "shrcd": [10, 11, 12],
+            "exchcd": [1, 3, 1],
+        }
+    )
+    msf_v2 = msf.rename(
+        columns={"date": "mthcaldt", "ret": "mthret", "retx": "mthretx"}
+    )
+    msf_v2 = msf_v2.rename(columns={"prc": "mthprc"}).assign(
+        issuertype="CORP",
+        securitytype="EQTY",
+        securitysubtype="COM",
+        sharetype="NS",
+        usincflg="Y",
+        primaryexch="N",
+        conditionaltype="RW",
+        tradingstatusflg="A",
+    )
+    funda = pd.DataFrame(
+        {
+            "gvkey": ["001000", "001000", "002000"],
+            "datadate": pd.to_datetime(["1958-12-31", "1999-12-31", "1999-12-31"]),
+            "seq": [1.0, 2.0, 3.0],
+            "indfmt": "INDL",
+            "datafmt": "STD",
+            "popsrc": "D",
+            "consol": "C",
+        }
+    )
+    for col in wrds_backend.mirror_tables["comp.funda"]:
+        if col not in funda.columns:
+            funda[col] = np.nan
+    linktable = pd.DataFrame(
+        {
+            "gvkey": ["001000", "002000"],
+            "lpermno": permnos,
+            "linktype": ["LC", "NR"],
+            "linkprim": ["P", "P"],
+            "linkdt": pd.to_datetime(["1990-01-01", "1990-01-01"]),
+            "linkenddt": pd.to_datetime([None, None]),
+        }
+    )
+    factors = pd.DataFrame(
+        {"date": pd.to_datetime(["2000-01-01"]), "smb": ["0.01"], "hml": ["0.02"]}
+    )
+    return {
+        "crsp.msf": msf,
+        "crsp.msenames": msenames,
+        "crsp.msedelist": msedelist,
+        "crsp.dsf": dsf,
+        "crsp.dsenames": dsenames,
+        "crsp.msf_v2": msf_v2,
+        "comp.funda": funda,
+        "crsp.ccmxpf_linktable": linktable,
+        "ff.factors_monthly": factors,
+    }
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    path = tmp_path / "wrds_mirror.duckdb"
+    wrds_backend.write_tables(_synthetic_tables(), mirror_path=path)
+    monkeypatch.setattr(wrds_backend, "WRDS_BACKEND", "duckdb")
+    monkeypatch.setattr(wrds_backend, "WRDS_MIRROR_PATH", path)
+    return path
+
+
+def test_pull_CRSP_Compustat_from_mirror(mirror):
+    # Each pull module is only included with its cookiecutter option
+    pull_CRSP_Compustat = pytest.importorskip("pull_CRSP_Compustat")
+    comp = pull_CRSP_Compustat.pull_compustat(wrds_username="nobody")
+    assert comp["gvkey"].tolist() == ["001000", "002000"]
+    assert comp["year"].tolist() == [1999, 1999]
+
+    crsp = pull_CRSP_Compustat.pull_CRSP_stock_ciz(wrds_username="nobody")
+    assert len(crsp) == 24
+    assert crsp["permno"].dtype == "int32"
+    assert (crsp["jdate"].dt.is_month_end).all()
+
+    ccm = pull_CRSP_Compustat.pull_CRSP_Comp_Link_Table(wrds_username="nobody")
+    assert ccm["permno"].tolist() == [10001]
+
+    ff = pull_CRSP_Compustat.pull_Fama_French_factors(wrds_username="nobody")
+    assert ff["date"].iloc[0] == pd.Timestamp("2000-01-31")
+
+
+def test_pull_CRSP_monthly_file_from_mirror(mirror):
+    pull_CRSP_stock = pytest.importorskip("pull_CRSP_stock")
+    df = pull_CRSP_stock.pull_CRSP_monthly_file(
+        start_date="2000-02-01", end_date="2000-12-31", wrds_username="nobody"
+    )
+    # Share code 12 is not in the CRSP universe
+    assert set(df["permno"]) == {10001}
+    assert len(df) == 12
+    # Delisting code 552 without a delisting return is treated as -30%
+    assert df.loc[df["date"] == "2000-12-31", "dlret"].iloc[0] == -0.3
+
+
+def test_compustat_dataset_round_trip(tmp_path):
+    pull_CRSP_Compustat = pytest.importorskip("pull_CRSP_Compustat")
+    rng = np.random.default_rng(0)
+    n = 300
+    comp = pd.DataFrame(
+        {
+            "gvkey": rng.choice(["001000", "001001", "002000", "012141"], n),
+            "datadate": pd.Timestamp("1990-01-31")
+            + pd.to_timedelta(rng.integers(0, 3650, n), unit="D"),
+            "at": rng.lognormal(size=n),
+            "seq": rng.lognormal(size=n),
+        }
+    )
+    comp["year"] = comp["datadate"].dt.year
+    pull_CRSP_Compustat.save_compustat(comp, data_dir=tmp_path)
+    expected = comp.sort_values(["year", "gvkey", "datadate"], ignore_index=True)
+
+    result = pull_CRSP_Compustat.load_compustat(data_dir=tmp_path)
+    pd.testing.assert_frame_equal(result, expected)
+
+    result = pull_CRSP_Compustat.load_compustat(
+        data_dir=tmp_path,
+        gvkeys=["001000", "012141"],
+        years=range(1992, 1995),
+        columns=["gvkey", "datadate", "at"],
+    )
+    mask = expected["gvkey"].isin(["001000", "012141"]) & expected["year"].between(
+        1992, 1994
+    )
+    pd.testing.assert_frame_equal(
+        result, expected.loc[mask, ["gvkey", "datadate", "at"]].reset_index(drop=True)
+    )
+
+    result = pull_CRSP_Compustat.load_compustat(
+        data_dir=tmp_path, gvkeys="002000", years=1999
+    )
+    assert (result["gvkey"] == "002000").all()
+    assert (result["year"] == 1999).all()
+    assert len(result) == ((comp["gvkey"] == "002000") & (comp["year"] == 1999)).sum()
+
+    # Integer items come back from WRDS as float64 when they have missing
+    # values, and are stored with the type from the table schema instead
+    comp["sich"] = np.where(comp.index % 7 == 0, np.nan, 3570.0)
+    table_schema = {"columns": {"gvkey": "character varying", "sich": "smallint"}}
+    pull_CRSP_Compustat.save_compustat(
+        comp, data_dir=tmp_path, table_schema=table_schema
+    )
+    dataset = ds.dataset(tmp_path / "Compustat", format="parquet")
+    assert dataset.schema.field("sich").type == pa.int16()
+    assert dataset.schema.field("at").type == pa.float64()
+    result = pull_CRSP_Compustat.load_compustat(data_dir=tmp_path, columns=["sich"])
+    assert result["sich"].isna().sum() == (comp.index % 7 == 0).sum()
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "ipc"])
+def test_pull_CRSP_daily_file_from_mirror(mirror, tmp_path, file_format):
+    pull_CRSP_stock = pytest.importorskip("pull_CRSP_stock")
+    base_dir = pull_CRSP_stock.pull_CRSP_daily_file(
+        start_date="2000-12-15",
+        end_date="2001-01-31",
+        wrds_username="nobody",
+        data_dir=tmp_path,
+        file_format=file_format,
+    )
+    assert sorted(p.name for p in base_dir.iterdir()) == ["year=2000", "year=2001"]
+
+    def load(**kwargs):
+        return pull_CRSP_stock.load_CRSP_daily_file(
+            data_dir=tmp_path, file_format=file_format, **kwargs
+        )
+
+    df = load()
+    # Share code 12 is not in the CRSP universe
+    assert set(df["permno"]) == {10001, 10002}
+    assert df["date"].min() == pd.Timestamp("2000-12-15")
+    assert "year" not in df.columns
+    assert df["shrout"].iloc[0] == 1_000_000
+
+    df = load(start_date="2001-01-10", end_date="2001-01-12", permnos=10002)
+    assert df["permno"].tolist() == [10002] * 3
+    assert df["date"].tolist() == list(pd.bdate_range("2001-01-10", "2001-01-12"))
+
+    df = load(end_date="2000-12-31", columns=["permno", "ret"])
+    assert df.columns.tolist() == ["permno", "ret"]
+    assert len(df) == 2 * len(pd.bdate_range("2000-12-15", "2000-12-31"))
+
+    # Pulling a year again replaces its partition
+    pull_CRSP_stock.pull_CRSP_daily_file(
+        start_date="2001-01-02",
+        end_date="2001-01-31",
+        wrds_username="nobody",
+        data_dir=tmp_path,
+        file_format=file_format,
+    )
+    assert len(load(start_date="2001-01-01")) == 2 * len(
+        pd.bdate_range("2001-01-02", "2001-01-31")
+    )
+
+
+def test_get_table_quotes_reserved_columns(mirror):
+    db = wrds_backend.connect(wrds_username="nobody")
+    comp = db.get_table("comp", "funda", columns=["gvkey", "at", "seq"], obs=2)
+    db.close()
+    assert comp.columns.tolist() == ["gvkey", "at", "seq"]
+    assert len(comp) == 2
+
+
+def test_mirror_wrds_tables_copies_dsf_by_year(mirror, tmp_path, monkeypatch):
+    queries = []
+
+    class Connection(wrds_backend.DuckDBConnection):
+        def __init__(self, wrds_username):
+            super().__init__(mirror)
+
+        def raw_sql(self, sql, date_cols=None):
+            queries.append(sql)
+            return super().raw_sql(sql, date_cols=date_cols)
+
+        def get_table(self, library, table, **kwargs):
+            assert f"{library}.{table}" != "crsp.dsf"
+            return super().get_table(library, table, **kwargs)
+
+    monkeypatch.setattr(wrds_backend.wrds, "Connection", Connection)
+    path = tmp_path / "copy.duckdb"
+    tables = {
+        name: wrds_backend.mirror_tables[name] for name in ["crsp.dsf", "crsp.dsenames"]
+    }
+    wrds_backend.mirror_wrds_tables(tables=tables, mirror_path=path)
+
+    # One query for the range of years, then one per year (2000 and 2001)
+    assert len([sql for sql in queries if "crsp.dsf" in sql]) == 3
+    db = wrds_backend.DuckDBConnection(path)
+    sql = "SELECT * FROM crsp.dsf ORDER BY permno, date"
+    result = db.raw_sql(sql, date_cols=["date"])
+    db.close()
+    db = wrds_backend.DuckDBConnection(mirror)
+    expected = db.raw_sql(sql, date_cols=["date"])
+    db.close()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        wrds_backend.connect(wrds_username="nobody", backend="sqlite")
@@ -0,0 +1,67 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from wrds_schema import (
+    SCHEMA_CATALOG_FILENAME,
+    arrow_schema,
+    build_select,
+    date_columns,
+    get_table_schema,
+)
+
+
+class FakeConnection:
+    """Answers the two metadata queries made by `get_table_schema`."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def raw_sql(self, sql):
+        self.queries += 1
+        if "information_schema" in sql:
+            return pd.DataFrame(
+                {
+                    "column_name": ["permno", "mthcaldt", "mthret", "primaryexch"],
+                    "data_type": ["integer", "date", "double precision", "character"],
+                }
+            )
+        return pd.DataFrame({"row_estimate": [4_000_000]})
+
+
+def test_get_table_schema_is_cached(tmp_path):
+    db = FakeConnection()
+    schema = get_table_schema("crsp", "msf_v2", db=db, data_dir=tmp_path)
+    assert list(schema["columns"]) == ["permno", "mthcaldt", "mthret", "primaryexch"]
+    assert schema["row_estimate"] == 4_000_000
+    assert db.queries == 2
+
+    # Second call is answered from the catalog on disk
+    again = get_table_schema("crsp", "msf_v2", db=db, data_dir=tmp_path)
+    assert again == schema
+    assert db.queries == 2
+
+    with open(tmp_path / SCHEMA_CATALOG_FILENAME) as f:
+        assert "crsp.msf_v2" in json.load(f)
+
+    get_table_schema("crsp", "msf_v2", db=db, data_dir=tmp_path, refresh=True)
+    assert db.queries == 4
+
+
+def test_query_builder(tmp_path):
+    schema = get_table_schema("crsp", "msf_v2", db=FakeConnection(), data_dir=tmp_path)
+    columns = ["permno", "mthcaldt", "mthret"]
+
+    sql = build_select("crsp", "msf_v2", columns, schema, where="mthret > 0")
+    assert sql == (
+        'SELECT "permno", "mthcaldt", "mthret"\nFROM crsp.msf_v2\nWHERE mthret > 0'
+    )
+    assert date_columns(schema, columns) == ["mthcaldt"]
+    assert arrow_schema(schema, columns) == pa.schema(
+        [("permno", pa.int32()), ("mthcaldt", pa.date32()), ("mthret", pa.float64())]
+    )
+
+    with pytest.raises(ValueError, match="mthprc"):
+        build_select("crsp", "msf_v2", ["permno", "mthprc"], schema)
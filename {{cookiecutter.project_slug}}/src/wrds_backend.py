@@ -0,0 +1,253 @@
+"""
+Connections to WRDS or to a local DuckDB mirror of the WRDS tables we use.
+
+The `pull_*` functions in `pull_CRSP_stock.py` and `pull_CRSP_Compustat.py`
+open their connections with `connect`, which returns either a
+`wrds.Connection` or a `DuckDBConnection`. Both have the `raw_sql`,
+`get_table` and `close` methods used by the pull functions, so the same SQL
+runs against either one. The backend is chosen with the `WRDS_BACKEND`
+setting ("wrds", the default, or "duckdb"), e.g.
+```
+python src/pull_CRSP_Compustat.py --WRDS_BACKEND=duckdb
+```
+
+The mirror is a single DuckDB file (`DATA_DIR / "wrds_mirror.duckdb"` by
+default) with one schema per WRDS library (crsp, comp, ff, ...). It can be
+populated once from WRDS with `mirror_wrds_tables`, after which repeat pulls
+are local columnar queries, or from synthetic DataFrames with `write_tables`,
+which makes the WRDS code path testable without credentials.
+
+Note that the SQL in the pull functions is kept to the subset that Postgres
+and DuckDB share. In particular, date literals must be ISO formatted
+('1959-01-01', not '01/01/1959').
+"""
+
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import wrds
+
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+WRDS_USERNAME = config("WRDS_USERNAME")
+WRDS_BACKEND = config("WRDS_BACKEND")
+WRDS_MIRROR_PATH = DATA_DIR / "wrds_mirror.duckdb"
+
+# Tables mirrored by `mirror_wrds_tables`, with the columns to copy (None for
+# all of them). Only the Compustat columns used in this project are copied,
+# since comp.funda has close to a thousand columns, and only the crsp.dsf
+# columns pulled by `pull_CRSP_daily_file`, since it has billions of cells.
+mirror_tables = {
+    "crsp.msf": None,
+    "crsp.msenames": None,
+    "crsp.msedelist": None,
+    "crsp.dsf": [
+        "date",
+        "permno",
+        "permco",
+        "ret",
+        "retx",
+        "prc",
+        "vol",
+        "shrout",
+        "cfacshr",
+        "cfacpr",
+    ],
+    "crsp.dsenames": ["permno", "namedt", "nameendt", "shrcd", "exchcd"],
+    "crsp.msf_v2": None,
+    "crsp.stkdistributions": None,
+    "crsp.ccmxpf_linktable": None,
+    "comp.funda": [
+        "gvkey",
+        "datadate",
+        "at",
+        "sale",
+        "cogs",
+        "xsga",
+        "xint",
+        "pstkl",
+        "txditc",
+        "pstkrv",
+        "seq",
+        "pstk",
+        "ni",
+        "sich",
+        "dp",
+        "ebit",
+        "indfmt",
+        "datafmt",
+        "popsrc",
+        "consol",
+    ],
+    "ff.factors_monthly": None,
+}
+
+# Tables too large to pull in one query, with the date column used to copy
+# them one year at a time.
+chunked_tables = {"crsp.dsf": "date"}
+
+
+class DuckDBConnection:
+    """Read-only stand-in for `wrds.Connection` backed by a DuckDB file.
+
+    Examples
+    --------
+    ```
+    db = DuckDBConnection()
+    comp = db.raw_sql(
+        "SELECT gvkey, datadate, seq FROM comp.funda WHERE datadate >= '2000-01-01'",
+        date_cols=["datadate"],
+    )
+    db.close()
+    ```
+    """
+
+    # Schema metadata is read straight from the database file, so there is
+    # no point caching it (see `wrds_schema.get_table_schema`).
+    is_local = True
+
+    def __init__(self, path=WRDS_MIRROR_PATH, read_only=True):
+        path = Path(path)
+        if read_only and not path.exists():
+            raise FileNotFoundError(
+                f"No WRDS mirror at {path}. Create it with `mirror_wrds_tables` "
+                "or `write_tables`."
+            )
+        self.path = path
+        self.connection = duckdb.connect(str(path), read_only=read_only)
+
+    def raw_sql(self, sql, date_cols=None):
+        df = self.connection.execute(sql).df()
+        for col in date_cols or []:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col])
+        return df
+
+    def get_table(self, library, table, columns=None, obs=None, date_cols=None):
+        # Quoted, since some Compustat items (e.g., `at`) are reserved words
+        select = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+        sql = f"SELECT {select} FROM {library}.{table}"
+        if obs is not None:
+            sql += f" LIMIT {int(obs)}"
+        return self.raw_sql(sql, date_cols=date_cols)
+
+    def list_tables(self, library):
+        df = self.raw_sql(
+            f"""
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = '{library}'
+            ORDER BY table_name
+            """
+        )
+        return df["table_name"].tolist()
+
+    def close(self):
+        self.connection.close()
+
+
+def connect(wrds_username=WRDS_USERNAME, backend=None, mirror_path=None):
+    """Open a connection to WRDS or to the local mirror.
+
+    `backend` defaults to the `WRDS_BACKEND` setting and `mirror_path` to
+    `DATA_DIR / "wrds_mirror.duckdb"`.
+    """
+    backend = WRDS_BACKEND if backend is None else backend
+    if backend == "wrds":
+        return wrds.Connection(wrds_username=wrds_username)
+    if backend == "duckdb":
+        return DuckDBConnection(
+            WRDS_MIRROR_PATH if mirror_path is None else mirror_path
+        )
+    raise ValueError(f"Unknown WRDS backend: {backend}")
+
+
+def write_tables(tables, mirror_path=WRDS_MIRROR_PATH, append=False):
+    """Write DataFrames to the mirror, replacing existing tables.
+
+    `tables` maps "library.table" names to DataFrames. Datetime columns are
+    stored as DATE, as they are on WRDS. With `append=True`, the rows are
+    added to the existing tables instead, which lets a large table be written
+    in chunks.
+
+    Examples
+    --------
+    ```
+    write_tables({"ff.factors_monthly": ff}, mirror_path=tmp_path / "mirror.duckdb")
+    ```
+    """
+    mirror_path = Path(mirror_path)
+    mirror_path.parent.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect(str(mirror_path))
+    for name, df in tables.items():
+        library, table = name.split(".")
+        date_cols = df.select_dtypes(include=["datetime64"]).columns
+        select = ", ".join(
+            f'CAST("{col}" AS DATE) AS "{col}"' if col in date_cols else f'"{col}"'
+            for col in df.columns
+        )
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS {library}")
+        con.register("_df", df)
+        if append:
+            con.execute(
+                f"CREATE TABLE IF NOT EXISTS {library}.{table} AS "
+                f"SELECT {select} FROM _df LIMIT 0"
+            )
+            con.execute(f"INSERT INTO {library}.{table} SELECT {select} FROM _df")
+        else:
+            con.execute(
+                f"CREATE OR REPLACE TABLE {library}.{table} AS SELECT {select} FROM _df"
+            )
+        con.unregister("_df")
+    con.close()
+
+
+def _mirror_by_year(db, name, columns, date_col, mirror_path):
+    """Copy a table one year at a time, so that only one year is in memory."""
+    select = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+    years = db.raw_sql(
+        f"""
+        SELECT EXTRACT(YEAR FROM MIN({date_col})) AS first_year,
+               EXTRACT(YEAR FROM MAX({date_col})) AS last_year
+        FROM {name}
+        """
+    ).iloc[0]
+    if pd.isna(years["first_year"]):
+        df = db.raw_sql(f"SELECT {select} FROM {name} LIMIT 0")
+        write_tables({name: df}, mirror_path=mirror_path)
+        return
+    for year in range(int(years["first_year"]), int(years["last_year"]) + 1):
+        df = db.raw_sql(
+            f"""
+            SELECT {select} FROM {name}
+            WHERE {date_col} BETWEEN '{year}-01-01' AND '{year}-12-31'
+            """,
+            date_cols=[date_col],
+        )
+        first_year = year == int(years["first_year"])
+        if first_year or not df.empty:
+            write_tables({name: df}, mirror_path=mirror_path, append=not first_year)
+
+
+def mirror_wrds_tables(
+    tables=mirror_tables, wrds_username=WRDS_USERNAME, mirror_path=WRDS_MIRROR_PATH
+):
+    """Copy WRDS tables into the local mirror, one table at a time.
+
+    The tables in `chunked_tables` (crsp.dsf) are copied one year at a time.
+    """
+    db = wrds.Connection(wrds_username=wrds_username)
+    for name, columns in tables.items():
+        if name in chunked_tables:
+            _mirror_by_year(db, name, columns, chunked_tables[name], mirror_path)
+            continue
+        library, table = name.split(".")
+        df = db.get_table(library=library, table=table, columns=columns)
+        write_tables({name: df}, mirror_path=mirror_path)
+    db.close()
+    return mirror_path
+
+
+if __name__ == "__main__":
+    mirror_wrds_tables(wrds_username=WRDS_USERNAME)
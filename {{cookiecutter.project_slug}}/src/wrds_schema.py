@@ -0,0 +1,337 @@
+"""
+Column types for the CRSP data pulled from WRDS.
+
+`db.raw_sql` infers the type of each column from the query result. In
+practice, this means that integer identifiers and codes come back as float64
+and text fields come back as Python objects. This module defines the
+intended type of each column and is shared by `pull_CRSP_stock.py` and
+`pull_CRSP_Compustat.py`.
+
+ - Identifiers (permno, permco) are stored as int32.
+ - Share, exchange, and delisting codes are stored as small nullable integers.
+ - Text fields (company names, share classes, CIZ flags) are stored as
+   categoricals, which are written to parquet as dictionary-encoded strings.
+ - Returns can optionally be stored as float32.
+
+Since pandas writes these types into the parquet schema, reading the data back
+with `pd.read_parquet` gives the same compact types without re-inferring them.
+
+The module also keeps a local catalog of the WRDS tables we query (column
+names, Postgres types and approximate row counts), cached as JSON in
+`DATA_DIR`. The catalog is used to
+
+ - list the columns of a table without querying `information_schema` each
+   time (see `get_table_schema`),
+ - build projected SELECT statements whose columns are checked against the
+   table before any data is transferred (see `build_select`), and
+ - map the Postgres types to Arrow types when writing parquet, and find the
+   date columns to parse (see `arrow_schema` and `date_columns`).
+"""
+
+import difflib
+import json
+from datetime import date
+from pathlib import Path
+
+import pyarrow as pa
+
+from settings import config
+from wrds_backend import connect
+
+DATA_DIR = Path(config("DATA_DIR"))
+WRDS_USERNAME = config("WRDS_USERNAME")
+
+SCHEMA_CATALOG_FILENAME = "wrds_schema_catalog.json"
+
+crsp_dtypes = {
+    ## Identifiers
+    "permno": "int32",
+    "permco": "int32",
+    ## Codes
+    "shrcd": "Int8",
+    "exchcd": "Int8",
+    "dlstcd": "Int16",
+    "siccd": "Int16",
+    ## Text fields
+    "comnam": "category",
+    "shrcls": "category",
+    "naics": "category",
+    ## CIZ flags
+    "issuertype": "category",
+    "securitytype": "category",
+    "securitysubtype": "category",
+    "sharetype": "category",
+    "usincflg": "category",
+    "primaryexch": "category",
+    "conditionaltype": "category",
+    "tradingstatusflg": "category",
+}
+
+crsp_return_columns = ["ret", "retx", "dlret", "dlretx", "mthret", "mthretx"]
+
+
+def enforce_crsp_dtypes(df, float32_returns=False, dtypes=crsp_dtypes):
+    """Cast the columns of a CRSP DataFrame to compact types.
+
+    Columns that are not listed in `dtypes` (and returns, unless
+    `float32_returns` is True) are left as they are. Columns listed in
+    `dtypes` that are not in `df` are ignored.
+
+    Examples
+    --------
+    ```
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({
+    ...     'permno': [10001.0, 10002.0],
+    ...     'exchcd': [1.0, None],
+    ...     'comnam': ['GAS NATURAL INC', 'BANCTRUST FINANCIAL GROUP INC'],
+    ...     'ret': [0.01, -0.02],
+    ... })
+    >>> enforce_crsp_dtypes(df, float32_returns=True).dtypes
+    permno       int32
+    exchcd        Int8
+    comnam    category
+    ret        float32
+    dtype: object
+
+    ```
+    """
+    new_dtypes = {col: dtype for col, dtype in dtypes.items() if col in df.columns}
+    if float32_returns:
+        for col in crsp_return_columns:
+            if col in df.columns:
+                new_dtypes[col] = "float32"
+    return df.astype(new_dtypes)
+
+
+## Postgres types, as reported by information_schema.columns, to Arrow types
+postgres_to_arrow = {
+    "smallint": pa.int16(),
+    "integer": pa.int32(),
+    "bigint": pa.int64(),
+    "real": pa.float32(),
+    "double precision": pa.float64(),
+    "numeric": pa.float64(),
+    "character": pa.string(),
+    "character varying": pa.string(),
+    "text": pa.string(),
+    "boolean": pa.bool_(),
+    "date": pa.date32(),
+    "timestamp without time zone": pa.timestamp("us"),
+    ## DuckDB names, for the local mirror (see wrds_backend.py)
+    "tinyint": pa.int8(),
+    "float": pa.float32(),
+    "double": pa.float64(),
+    "varchar": pa.string(),
+    "timestamp": pa.timestamp("us"),
+    "timestamp_ns": pa.timestamp("ns"),
+}
+
+
+def _arrow_type(data_type):
+    return postgres_to_arrow.get(data_type.lower(), pa.string())
+
+
+def _fetch_table_schema(db, library, table):
+    columns = db.raw_sql(
+        f"""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = '{library}'
+        AND table_name = '{table}'
+        ORDER BY ordinal_position;
+        """
+    )
+    if columns.empty:
+        raise ValueError(f"Table {library}.{table} not found on WRDS")
+    # Planner estimate from the last ANALYZE. This is free to look up, unlike
+    # COUNT(*), but is not available for views.
+    estimate = db.raw_sql(
+        f"""
+        SELECT c.reltuples::bigint AS row_estimate
+        FROM pg_class AS c
+        JOIN pg_namespace AS n ON n.oid = c.relnamespace
+        WHERE n.nspname = '{library}' AND c.relname = '{table}';
+        """
+    )
+    row_estimate = None
+    if not estimate.empty and estimate["row_estimate"].iloc[0] > 0:
+        row_estimate = int(estimate["row_estimate"].iloc[0])
+    return {
+        "columns": dict(zip(columns["column_name"], columns["data_type"])),
+        "row_estimate": row_estimate,
+        "fetched": date.today().isoformat(),
+    }
+
+
+def load_schema_catalog(data_dir=DATA_DIR):
+    """Load the cached catalog, keyed by "library.table"."""
+    path = Path(data_dir) / SCHEMA_CATALOG_FILENAME
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_table_schema(
+    library,
+    table,
+    db=None,
+    wrds_username=WRDS_USERNAME,
+    data_dir=DATA_DIR,
+    max_age_days=30,
+    refresh=False,
+):
+    """Get the columns, Postgres types and approximate row count of a table.
+
+    The schema is read from the local catalog if it was fetched less than
+    `max_age_days` ago. Otherwise it is fetched from WRDS, using `db` if an
+    open connection is given, and saved to the catalog. If `db` is a
+    connection to the local DuckDB mirror, its schema is returned directly.
+
+    Returns a dict with keys "columns" (column name to Postgres type, in
+    table order), "row_estimate" (None if unknown) and "fetched".
+
+    Examples
+    --------
+    ```
+    schema = get_table_schema("crsp", "msf_v2")
+    list(schema["columns"])[:3]
+    # ['permno', 'hdrcusip', 'hdrcusip9']
+    ```
+    """
+    if getattr(db, "is_local", False):
+        return _fetch_table_schema(db, library, table)
+
+    key = f"{library}.{table}"
+    catalog = load_schema_catalog(data_dir)
+    entry = catalog.get(key)
+    if entry is not None and not refresh:
+        age = date.today() - date.fromisoformat(entry["fetched"])
+        if age.days <= max_age_days:
+            return entry
+
+    if db is None:
+        conn = connect(wrds_username=wrds_username)
+        entry = _fetch_table_schema(conn, library, table)
+        conn.close()
+    else:
+        entry = _fetch_table_schema(db, library, table)
+
+    catalog[key] = entry
+    path = Path(data_dir) / SCHEMA_CATALOG_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(catalog, f, indent=2, sort_keys=True)
+    return entry
+
+
+def check_columns(table_schema, columns, table="table"):
+    """Raise a ValueError if any of `columns` is not in `table_schema`.
+
+    The error message suggests close matches for misspelled columns.
+    """
+    available = table_schema["columns"]
+    missing = [col for col in columns if col not in available]
+    if missing:
+        hints = []
+        for col in missing:
+            close = difflib.get_close_matches(col, available, n=1)
+            hints.append(f"{col} (did you mean {close[0]}?)" if close else col)
+        raise ValueError(f"Columns not in {table}: {', '.join(hints)}")
+
+
+def arrow_schema(table_schema, columns=None, df=None):
+    """Arrow schema for `columns` (default: all columns) of a table.
+
+    Postgres types without an entry in `postgres_to_arrow` map to string.
+
+    With `df`, the schema is for the columns of `df`, to pass to
+    `pa.Table.from_pandas`. `db.raw_sql` returns integer columns with missing
+    values as float64 and text as Python objects, so float64 and object
+    columns take their type from the table instead. Columns that were already
+    cast (e.g., by `enforce_crsp_dtypes`), date columns and columns that are
+    not in the table keep the type that pandas gives them.
+
+    Examples
+    --------
+    ```
+    >>> table_schema = {"columns": {
+    ...     "permno": "integer",
+    ...     "mthret": "double precision",
+    ... }}
+    >>> arrow_schema(table_schema)
+    permno: int32
+    mthret: double
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({"permno": [10001.0, None], "year": [2000, 2000]})
+    >>> arrow_schema(table_schema, df=df).field("permno")
+    pyarrow.Field<permno: int32>
+
+    ```
+    """
+    if df is not None:
+        fields = []
+        for field in pa.Schema.from_pandas(df, preserve_index=False):
+            data_type = table_schema["columns"].get(field.name)
+            if data_type is not None and df[field.name].dtype in ("float64", "object"):
+                arrow_type = _arrow_type(data_type)
+                if not pa.types.is_temporal(arrow_type):
+                    field = field.with_type(arrow_type)
+            fields.append(field)
+        return pa.schema(fields)
+
+    columns = list(table_schema["columns"]) if columns is None else columns
+    check_columns(table_schema, columns)
+    return pa.schema(
+        [(col, _arrow_type(table_schema["columns"][col])) for col in columns]
+    )
+
+
+def date_columns(table_schema, columns=None):
+    """Columns with a date or timestamp type, to pass as `date_cols` to
+    `db.raw_sql`."""
+    columns = list(table_schema["columns"]) if columns is None else columns
+    return [
+        col
+        for col in columns
+        if pa.types.is_temporal(_arrow_type(table_schema["columns"][col]))
+    ]
+
+
+def build_select(library, table, columns, table_schema, where=None):
+    """Build a SELECT of `columns` from `library.table`.
+
+    The columns are checked against `table_schema` (from `get_table_schema`),
+    so that a typo fails immediately instead of after the query is sent.
+    Column names are quoted, since some Compustat items (e.g., `at`) are
+    reserved words in DuckDB (see `wrds_backend.py`).
+
+    Examples
+    --------
+    ```
+    >>> table_schema = {"columns": {
+    ...     "gvkey": "character varying",
+    ...     "datadate": "date",
+    ...     "at": "double precision",
+    ... }}
+    >>> sql = build_select(
+    ...     "comp", "funda", ["gvkey", "at"], table_schema, where="at > 0"
+    ... )
+    >>> print(sql)
+    SELECT "gvkey", "at"
+    FROM comp.funda
+    WHERE at > 0
+    >>> build_select("comp", "funda", ["gvkey", "datdate"], table_schema)
+    Traceback (most recent call last):
+    ...
+    ValueError: Columns not in comp.funda: datdate (did you mean datadate?)
+
+    ```
+    """
+    check_columns(table_schema, columns, table=f"{library}.{table}")
+    select = ", ".join(f'"{col}"' for col in columns)
+    sql_query = f"SELECT {select}\nFROM {library}.{table}"
+    if where:
+        sql_query += f"\nWHERE {where}"
+    return sql_query